@@ -0,0 +1,129 @@
+"""Shows that slow chats no longer block each other, while each chat stays ordered.
+
+Usage: poetry run python benchmarks/concurrency_benchmark.py [--chats 100]
+
+Every simulated chat sends a text message that triggers a slow fake LLM call
+(random latency up to `--max-latency`), immediately followed by a button press.
+All updates go through PerChatUpdateProcessor. The run fails (exit code 1) if
+any chat's updates were handled out of order, or if the total time is not
+close to the slowest single call rather than the sum of all calls.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "src"))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:benchmark")
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from telegram import Update  # noqa: E402
+from telegram.ext import SimpleUpdateProcessor  # noqa: E402
+
+from utils.update_processor import PerChatUpdateProcessor  # noqa: E402
+
+# Allowed overhead on top of the slowest call before the run counts as failed.
+TOLERANCE = 1.5
+
+
+def make_update(update_id: int, chat_id: int, kind: str) -> Update:
+    chat = {"id": chat_id, "type": "private"}
+    user = {"id": chat_id, "is_bot": False, "first_name": "User"}
+    message = {"message_id": update_id, "date": 0, "chat": chat, "from": user}
+    if kind == "text":
+        return Update.de_json(
+            {"update_id": update_id, "message": {**message, "text": "Hi"}}, None
+        )
+    return Update.de_json(
+        {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": user,
+                "chat_instance": str(chat_id),
+                "data": "finish_gpt_dialog",
+                "message": message,
+            },
+        },
+        None,
+    )
+
+
+async def run(processor, chats: int, latencies: dict) -> tuple[float, dict]:
+    handled: dict[int, list[str]] = {chat_id: [] for chat_id in range(chats)}
+
+    async def handle(update: Update) -> None:
+        chat_id = update.effective_chat.id
+        if update.message:
+            await asyncio.sleep(latencies[chat_id])  # slow fake LLM call
+            handled[chat_id].append("text")
+        else:
+            handled[chat_id].append("button")
+
+    updates = []
+    for chat_id in range(chats):
+        updates.append(make_update(len(updates), chat_id, "text"))
+        updates.append(make_update(len(updates), chat_id, "button"))
+
+    await processor.initialize()
+    started = time.perf_counter()
+    # Like Application, start processing every update in arrival order.
+    tasks = [
+        asyncio.create_task(processor.process_update(update, handle(update)))
+        for update in updates
+    ]
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    await processor.shutdown()
+    return elapsed, handled
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--max-latency", type=float, default=2.0)
+    parser.add_argument("--max-concurrent-chats", type=int, default=100)
+    parser.add_argument(
+        "--with-baseline",
+        action="store_true",
+        help="also run the default sequential processing (takes sum-latency time)",
+    )
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    latencies = {
+        chat_id: rng.uniform(args.max_latency / 10, args.max_latency)
+        for chat_id in range(args.chats)
+    }
+    latencies[0] = args.max_latency
+
+    processor = PerChatUpdateProcessor(args.max_concurrent_chats)
+    elapsed, handled = asyncio.run(run(processor, args.chats, latencies))
+    ordered = all(events == ["text", "button"] for events in handled.values())
+
+    result = {
+        "chats": args.chats,
+        "max_concurrent_chats": args.max_concurrent_chats,
+        "max_latency_s": args.max_latency,
+        "sum_latency_s": round(sum(latencies.values()), 3),
+        "per_chat_elapsed_s": round(elapsed, 3),
+        "per_chat_ordered": ordered,
+    }
+    if args.with_baseline:
+        baseline, _ = asyncio.run(run(SimpleUpdateProcessor(1), args.chats, latencies))
+        result["sequential_elapsed_s"] = round(baseline, 3)
+    print(json.dumps(result))
+
+    waves = -(-args.chats // args.max_concurrent_chats)
+    if not ordered or elapsed > waves * args.max_latency * TOLERANCE:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
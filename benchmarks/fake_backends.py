@@ -0,0 +1,368 @@
+"""Local stand-ins for the Telegram Bot API, the OpenAI API and a trace collector.
+
+Used by load_test.py. Both fakes answer with just enough data for the bot's
+handlers, after a random latency drawn from a log-normal distribution around a
+configurable median, and fail a configurable share of calls: the Bot API with
+429 (retry after 1 second), OpenAI with 500. Given FloodLimits, the Bot API also
+answers requests to chats beyond them with 429 and the time until the next one
+is allowed. Calls are counted per method and exposed as JSON at GET /stats.
+
+Streaming completions are sent as one server-sent events body once the latency
+has passed, since the HTTP server does not stream responses. The Bot API server
+also accepts OTLP/HTTP JSON spans at POST /v1/traces and counts them.
+"""
+
+import asyncio
+import itertools
+import json
+import math
+import random
+import re
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from urllib.parse import parse_qs, quote
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "src"))
+
+from utils.http_server import HttpServer, HttpRequest, HttpResponse  # noqa: E402
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+VOICE_FILE_SIZE = 16 * 1024
+FAKE_REPLY = (
+    "That is a great question. Here is a short answer with a few sentences. "
+    "It mentions one fact. Then it mentions another fact. Finally it ends."
+)
+TRANSCRIPTION = "Tell me something interesting about the Moon."
+TELEGRAM_METHODS = [
+    "getMe",
+    "getUpdates",
+    "sendMessage",
+    "sendPhoto",
+    "sendVoice",
+    "sendChatAction",
+    "editMessageText",
+    "editMessageCaption",
+    "editMessageReplyMarkup",
+    "answerCallbackQuery",
+    "deleteMessage",
+    "getFile",
+    "setWebhook",
+    "deleteWebhook",
+]
+
+
+@dataclass
+class Profile:
+    """Latency and error distribution of one fake backend."""
+
+    median_latency: float
+    spread: float = 0.5
+    error_rate: float = 0.0
+
+    def latency(self) -> float:
+        if self.median_latency <= 0:
+            return 0.0
+        return random.lognormvariate(math.log(self.median_latency), self.spread)
+
+    def fails(self) -> bool:
+        return random.random() < self.error_rate
+
+
+@dataclass
+class FloodLimits:
+    """Token buckets for requests to chats: over all chats and per chat."""
+
+    global_per_second: float = 30.0
+    global_burst: float = 30.0
+    chat_per_second: float = 1.0
+    chat_burst: float = 5.0
+
+
+class _FloodControl:
+    def __init__(self, limits: FloodLimits):
+        self.limits = limits
+        # key -> [tokens, last update]
+        self._buckets: dict = {}
+
+    def _wait(self, key, rate: float, burst: float, now: float) -> float:
+        tokens, updated = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        self._buckets[key] = [tokens, now]
+        return 0.0 if tokens >= 1 else (1 - tokens) / rate
+
+    def check(self, chat_id) -> float:
+        """Takes the tokens of a request; returns 0 or the seconds to wait."""
+        limits, now = self.limits, time.monotonic()
+        wait = max(
+            self._wait(None, limits.global_per_second, limits.global_burst, now),
+            self._wait(chat_id, limits.chat_per_second, limits.chat_burst, now),
+        )
+        if not wait:
+            self._buckets[None][0] -= 1
+            self._buckets[chat_id][0] -= 1
+        return wait
+
+
+def too_many_requests(retry_after: int) -> HttpResponse:
+    return json_response(
+        {
+            "ok": False,
+            "error_code": 429,
+            "description": f"Too Many Requests: retry after {retry_after}",
+            "parameters": {"retry_after": retry_after},
+        },
+        429,
+    )
+
+
+def json_response(payload: dict, status: int = 200) -> HttpResponse:
+    return HttpResponse(status, json.dumps(payload).encode(), "application/json")
+
+
+class FakeTelegram:
+    def __init__(self, token: str, profile: Profile, limits: FloodLimits = None):
+        self.token = token
+        self.profile = profile
+        self.calls = Counter()
+        self._message_ids = itertools.count(1_000_000)
+        self._flood_control = _FloodControl(limits) if limits else None
+
+    def routes(self) -> dict:
+        routes = {
+            ("POST", f"/bot{self.token}/{method}"): self._handler(method)
+            for method in TELEGRAM_METHODS
+        }
+        # File downloads use the URL-encoded token.
+        file_path = f"/file/bot{quote(self.token)}/voice/voice.oga"
+        routes[("GET", file_path)] = self.download
+        return routes
+
+    @staticmethod
+    def _parameters(request: HttpRequest) -> dict:
+        content_type = request.headers.get("content-type", "")
+        if content_type.startswith("multipart/form-data"):
+            # Only chat_id is needed from uploads.
+            match = re.search(rb'name="chat_id"\r\n\r\n(-?\d+)', request.body)
+            return {"chat_id": match.group(1).decode()} if match else {}
+        if content_type.startswith("application/json"):
+            return json.loads(request.body or b"{}")
+        return {k: v[0] for k, v in parse_qs(request.body.decode()).items()}
+
+    def _message(self, params: dict, **fields) -> dict:
+        chat_id = int(params.get("chat_id", 0))
+        message_id = int(params.get("message_id") or next(self._message_ids))
+        return {
+            "message_id": message_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            **fields,
+        }
+
+    def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            return []
+        if method in ("sendMessage", "editMessageText"):
+            return self._message(params, text=params.get("text", ""))
+        if method in ("sendPhoto", "editMessageCaption"):
+            photo_id = f"photo-{next(self._message_ids)}"
+            photo = [
+                {
+                    "file_id": photo_id,
+                    "file_unique_id": photo_id,
+                    "width": 1,
+                    "height": 1,
+                }
+            ]
+            return self._message(params, photo=photo, caption=params.get("caption"))
+        if method == "sendVoice":
+            voice = {"file_id": "voice", "file_unique_id": "voice", "duration": 1}
+            return self._message(params, voice=voice)
+        if method == "editMessageReplyMarkup":
+            return self._message(params, text="")
+        if method == "getFile":
+            return {
+                "file_id": params.get("file_id", "voice"),
+                "file_unique_id": "voice",
+                "file_size": VOICE_FILE_SIZE,
+                "file_path": "voice/voice.oga",
+            }
+        return True
+
+    def _handler(self, method: str):
+        async def handle(request: HttpRequest) -> HttpResponse:
+            self.calls[method] += 1
+            params = self._parameters(request)
+            if self._flood_control and params.get("chat_id") is not None:
+                # Limits apply when a request arrives, not when it is answered.
+                wait = self._flood_control.check(str(params["chat_id"]))
+                if wait:
+                    self.calls["flood_limited"] += 1
+                    return too_many_requests(math.ceil(wait))
+            await asyncio.sleep(self.profile.latency())
+            if self.profile.fails():
+                self.calls["errors"] += 1
+                return too_many_requests(1)
+            result = self._result(method, params)
+            return json_response({"ok": True, "result": result})
+
+        return handle
+
+    async def download(self, _request: HttpRequest) -> HttpResponse:
+        self.calls["download"] += 1
+        await asyncio.sleep(self.profile.latency())
+        return HttpResponse(200, b"OggS" + bytes(VOICE_FILE_SIZE - 4), "audio/ogg")
+
+
+class FakeOpenAI:
+    def __init__(self, profile: Profile):
+        self.profile = profile
+        self.calls = Counter()
+        self._ids = itertools.count()
+
+    def routes(self) -> dict:
+        return {
+            ("GET", "/v1/models"): self.models,
+            ("POST", "/v1/chat/completions"): self.chat_completion,
+            ("POST", "/v1/audio/transcriptions"): self.transcription,
+            ("POST", "/v1/audio/speech"): self.speech,
+        }
+
+    async def _delay(self, name: str) -> HttpResponse | None:
+        self.calls[name] += 1
+        await asyncio.sleep(self.profile.latency())
+        if self.profile.fails():
+            self.calls["errors"] += 1
+            return json_response({"error": {"message": "fake server error"}}, 500)
+        return None
+
+    async def models(self, _request: HttpRequest) -> HttpResponse:
+        self.calls["models"] += 1
+        return json_response({"object": "list", "data": []})
+
+    def _content(self, body: dict) -> str:
+        prompt = body["messages"][-1]["content"]
+        if (body.get("response_format") or {}).get("type") != "json_object":
+            return FAKE_REPLY
+        languages = re.search(r"each of these languages: (.+?)\. Reply", prompt)
+        if languages:
+            return json.dumps(
+                {language: FAKE_REPLY for language in languages.group(1).split(", ")}
+            )
+        match = re.search(r"(\d+) different", prompt)
+        count = int(match.group(1)) if match else 5
+        if '"questions"' in prompt:
+            questions = []
+            for _ in range(count):
+                n = next(self._ids)
+                options = {letter: f"Option {letter}{n}" for letter in "ABCD"}
+                questions.append(
+                    {"question": f"Question #{n}?", "options": options, "correct": "C"}
+                )
+            return json.dumps({"questions": questions})
+        facts = [f"Interesting fact: fact #{next(self._ids)}." for _ in range(count)]
+        return json.dumps({"facts": facts})
+
+    async def chat_completion(self, request: HttpRequest) -> HttpResponse:
+        if error := await self._delay("chat.completions"):
+            return error
+        body = json.loads(request.body)
+        content = self._content(body)
+        usage = {"prompt_tokens": 50, "completion_tokens": 30, "total_tokens": 80}
+        base = {"id": "chatcmpl-fake", "created": 0, "model": body["model"]}
+        if not body.get("stream"):
+            message = {"role": "assistant", "content": content}
+            return json_response(
+                {
+                    **base,
+                    "object": "chat.completion",
+                    "choices": [
+                        {"index": 0, "message": message, "finish_reason": "stop"}
+                    ],
+                    "usage": usage,
+                }
+            )
+
+        events = []
+        for word in re.findall(r"\S+\s*", content):
+            chunk = {
+                **base,
+                "object": "chat.completion.chunk",
+                "choices": [
+                    {"index": 0, "delta": {"content": word}, "finish_reason": None}
+                ],
+            }
+            events.append(f"data: {json.dumps(chunk)}\n\n")
+        events.append("data: [DONE]\n\n")
+        return HttpResponse(200, "".join(events).encode(), "text/event-stream")
+
+    async def transcription(self, _request: HttpRequest) -> HttpResponse:
+        if error := await self._delay("audio.transcriptions"):
+            return error
+        return HttpResponse(200, TRANSCRIPTION.encode(), "text/plain")
+
+    async def speech(self, request: HttpRequest) -> HttpResponse:
+        if error := await self._delay("audio.speech"):
+            return error
+        text = json.loads(request.body)["input"]
+        return HttpResponse(200, b"OggS" + bytes(len(text) * 100), "audio/ogg")
+
+
+class FakeCollector:
+    """Accepts OTLP/HTTP JSON trace exports and counts the spans."""
+
+    def __init__(self):
+        self.calls = Counter()
+
+    def routes(self) -> dict:
+        return {("POST", "/v1/traces"): self.traces}
+
+    async def traces(self, request: HttpRequest) -> HttpResponse:
+        self.calls["requests"] += 1
+        for resource_spans in json.loads(request.body)["resourceSpans"]:
+            for scope_spans in resource_spans["scopeSpans"]:
+                self.calls["spans"] += len(scope_spans["spans"])
+        return json_response({})
+
+
+async def serve(token: str, telegram: Profile, openai: Profile, ready, stop) -> None:
+    """Runs the fakes until `stop` is set; sends their ports through `ready`."""
+    fake_telegram = FakeTelegram(token, telegram)
+    fake_openai = FakeOpenAI(openai)
+    fake_collector = FakeCollector()
+
+    async def stats(_request: HttpRequest) -> HttpResponse:
+        return json_response(
+            {
+                "telegram": fake_telegram.calls,
+                "openai": fake_openai.calls,
+                "collector": fake_collector.calls,
+            }
+        )
+
+    telegram_server = HttpServer(
+        "127.0.0.1",
+        0,
+        {**fake_telegram.routes(), **fake_collector.routes(), ("GET", "/stats"): stats},
+    )
+    openai_server = HttpServer(
+        "127.0.0.1", 0, {**fake_openai.routes(), ("GET", "/stats"): stats}
+    )
+    await telegram_server.start()
+    await openai_server.start()
+    ready.send((telegram_server.port, openai_server.port))
+    while not stop.is_set():
+        await asyncio.sleep(0.1)
+    await telegram_server.stop()
+    await openai_server.stop()
+
+
+def run_process(token, telegram, openai, ready, stop) -> None:
+    """Entry point of the subprocess that hosts the fakes."""
+    asyncio.run(serve(token, telegram, openai, ready, stop))
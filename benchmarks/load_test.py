@@ -0,0 +1,328 @@
+"""Drives simulated users through every flow of the real bot, fully offline.
+
+Usage: poetry run python benchmarks/load_test.py [--users 20] [--output run.json]
+
+The Application from bot.py runs in this process against the fake Bot API and
+OpenAI servers of fake_backends.py, which run in a subprocess so they do not
+skew the bot's CPU time and RSS. `--users` users per flow (/random, /gpt, /talk,
+/quiz, /translate, /voice) go through their flow concurrently, each step waiting
+until the bot has fully handled the previous update. The report is printed as
+JSON (and written to `--output`): per-handler throughput and p50/p95/p99
+latency, outbound call counts per API method and the bot's peak RSS.
+
+Rate limits, the bot's per-user ones and those of its outbound Bot API
+requests, are switched off unless `--keep-rate-limits` is given, since the
+simulated users are much faster than people. With `--trace-collector`, traces
+are exported to the fake OTLP collector, and the report counts the spans it got
+(set TRACE_SAMPLE_RATE to choose the share of traced updates).
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import defaultdict
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "src"))
+sys.path.insert(0, str(ROOT_DIR / "benchmarks"))
+
+from fake_backends import BOT_USER, Profile, run_process  # noqa: E402
+
+TOKEN = "123:benchmark"
+FLOWS = ["random", "gpt", "talk", "quiz", "translate", "voice"]
+RATE_LIMITED_FEATURES = ["global", "gpt", "talk", "translate", "voice", "fact", "quiz"]
+PHRASES = ["Hello!", "Thank you", "Where is the station?", "Good morning"]
+
+
+def percentile(sorted_values: list, share: float) -> float:
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * share))
+    return sorted_values[index]
+
+
+class Recorder:
+    def __init__(self, timeout: float):
+        """Matches handled updates to the simulated users waiting for them."""
+        self.timeout = timeout
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.timeouts: dict[str, int] = defaultdict(int)
+        self._waiting: dict[int, asyncio.Future] = {}
+        self._failed: set[int] = set()
+        self._update_ids = itertools.count(1)
+
+    def next_update_id(self) -> int:
+        return next(self._update_ids)
+
+    async def handled(self, update, _context) -> None:
+        """TypeHandler in the last group: runs once all other groups are done."""
+        future = self._waiting.pop(update.update_id, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    async def failed(self, update, _context) -> None:
+        if update is not None:
+            self._failed.add(update.update_id)
+
+    async def submit(self, application, step: str, data: dict) -> None:
+        from telegram import Update
+
+        update = Update.de_json(data, application.bot)
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[update.update_id] = future
+        started = time.perf_counter()
+        await application.update_queue.put(update)
+        try:
+            await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self._waiting.pop(update.update_id, None)
+            self.timeouts[step] += 1
+            return
+        self.latencies[step].append(time.perf_counter() - started)
+        if update.update_id in self._failed:
+            self.errors[step] += 1
+
+    def report(self, elapsed: float) -> dict:
+        handlers = {}
+        for step in sorted(set(self.latencies) | set(self.timeouts)):
+            latencies = sorted(self.latencies[step])
+            entry = {
+                "count": len(latencies),
+                "errors": self.errors[step],
+                "timeouts": self.timeouts[step],
+                "throughput_per_s": round(len(latencies) / elapsed, 2),
+            }
+            if latencies:
+                for name, share in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99)):
+                    entry[f"{name}_ms"] = round(percentile(latencies, share) * 1000, 2)
+                entry["max_ms"] = round(latencies[-1] * 1000, 2)
+            handlers[step] = entry
+        return handlers
+
+
+class SimulatedUser:
+    def __init__(self, user_id: int, application, recorder: Recorder, think_time):
+        self.user_id = user_id
+        self.application = application
+        self.recorder = recorder
+        self.think_time = think_time
+        self.user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+        self.chat = {"id": user_id, "type": "private"}
+
+    def _message(self, update_id: int, **fields) -> dict:
+        return {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": self.chat,
+            "from": self.user,
+            **fields,
+        }
+
+    async def _submit(self, step: str, data: dict) -> None:
+        await self.recorder.submit(self.application, step, data)
+        if self.think_time:
+            await asyncio.sleep(self.think_time)
+
+    async def send_text(self, step: str, text: str) -> None:
+        update_id = self.recorder.next_update_id()
+        fields = {"text": text}
+        if text.startswith("/"):
+            command = text.split()[0]
+            fields["entities"] = [
+                {"type": "bot_command", "offset": 0, "length": len(command)}
+            ]
+        message = self._message(update_id, **fields)
+        await self._submit(step, {"update_id": update_id, "message": message})
+
+    async def send_voice(self, step: str) -> None:
+        update_id = self.recorder.next_update_id()
+        voice = {
+            "file_id": f"voice-{update_id}",
+            "file_unique_id": f"voice-{update_id}",
+            "duration": 3,
+        }
+        message = self._message(update_id, voice=voice)
+        await self._submit(step, {"update_id": update_id, "message": message})
+
+    async def press(self, step: str, callback_data: str) -> None:
+        update_id = self.recorder.next_update_id()
+        bot_message = {**self._message(update_id, text="..."), "from": BOT_USER}
+        query = {
+            "id": str(update_id),
+            "from": self.user,
+            "chat_instance": str(self.user_id),
+            "data": callback_data,
+            "message": bot_message,
+        }
+        await self._submit(step, {"update_id": update_id, "callback_query": query})
+
+    async def run(self, flow: str, steps: int) -> None:
+        if flow == "random":
+            await self.send_text("random:start", "/random")
+            for _ in range(steps):
+                await self.press("random:more", "random_more")
+            await self.press("random:finish", "finish_random")
+        elif flow == "gpt":
+            await self.send_text("gpt:start", "/gpt")
+            for i in range(steps):
+                await self.send_text("gpt:message", f"Question number {i}?")
+            await self.press("gpt:finish", "finish_gpt_dialog")
+        elif flow == "talk":
+            await self.send_text("talk:start", "/talk")
+            await self.press("talk:choose", "talk_Albert Einstein")
+            for i in range(steps):
+                await self.send_text("talk:message", f"What do you think of {i}?")
+            await self.press("talk:finish", "finish_talk_dialog")
+        elif flow == "quiz":
+            await self.send_text("quiz:start", "/quiz")
+            await self.press("quiz:topic", "quiz_topic_History")
+            for i in range(steps):
+                await self.send_text("quiz:answer", "C")
+                if i < steps - 1:
+                    await self.press("quiz:more", "quiz_more")
+            await self.press("quiz:finish", "finish_quiz")
+        elif flow == "translate":
+            await self.send_text("translate:start", "/translate")
+            await self.press("translate:language", "lang_German")
+            for i in range(steps):
+                await self.send_text("translate:text", PHRASES[i % len(PHRASES)])
+            await self.press("translate:change", "change_lang")
+            await self.press("translate:all", "lang_all")
+            await self.send_text("translate:all_text", f"Translate {self.user_id}")
+            await self.press("translate:finish", "finish_translate")
+        elif flow == "voice":
+            await self.send_text("voice:start", "/voice")
+            for _ in range(steps):
+                await self.send_voice("voice:message")
+            await self.press("voice:finish", "finish_voice")
+
+
+def fetch_stats(port: int) -> dict:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats") as response:
+        return json.load(response)
+
+
+async def run(args, telegram_port: int) -> dict:
+    from telegram import Update
+    from telegram.ext import TypeHandler
+
+    import bot
+
+    application = bot.build_application()
+    recorder = Recorder(args.step_timeout)
+    application.add_handler(TypeHandler(Update, recorder.handled), group=1000)
+    application.add_error_handler(recorder.failed)
+
+    user_ids = itertools.count(10_000)
+    users = [
+        (SimulatedUser(next(user_ids), application, recorder, args.think_time), flow)
+        for flow in args.flows
+        for _ in range(args.users)
+    ]
+
+    async with application:
+        await bot.post_init(application)
+        await application.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(user.run(flow, args.steps) for user, flow in users))
+        elapsed = time.perf_counter() - started
+        await application.stop()
+    await bot.post_shutdown(application)
+
+    stats = await asyncio.to_thread(fetch_stats, telegram_port)
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "handlers": recorder.report(elapsed),
+        "telegram_calls": dict(sorted(stats["telegram"].items())),
+        "openai_calls": dict(sorted(stats["openai"].items())),
+        "collector_spans": stats["collector"].get("spans", 0),
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20, help="users per flow")
+    parser.add_argument("--steps", type=int, default=5, help="messages per user")
+    parser.add_argument("--flows", default=",".join(FLOWS))
+    parser.add_argument("--think-time", type=float, default=0.0)
+    parser.add_argument("--step-timeout", type=float, default=60.0)
+    parser.add_argument("--telegram-latency", type=float, default=0.05)
+    parser.add_argument("--telegram-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-latency", type=float, default=0.5)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--latency-spread", type=float, default=0.5)
+    parser.add_argument("--keep-rate-limits", action="store_true")
+    parser.add_argument("--trace-collector", action="store_true")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+    args.flows = [flow for flow in args.flows.split(",") if flow]
+
+    telegram = Profile(
+        args.telegram_latency, args.latency_spread, args.telegram_error_rate
+    )
+    openai = Profile(args.openai_latency, args.latency_spread, args.openai_error_rate)
+    ready, ready_child = multiprocessing.Pipe()
+    stop = multiprocessing.Event()
+    fakes = multiprocessing.Process(
+        target=run_process, args=(TOKEN, telegram, openai, ready_child, stop)
+    )
+    fakes.start()
+    try:
+        telegram_port, openai_port = ready.recv()
+        with tempfile.TemporaryDirectory() as data_dir:
+            os.environ.update(
+                {
+                    "TELEGRAM_BOT_TOKEN": TOKEN,
+                    "OPENAI_API_KEY": "sk-benchmark",
+                    "TELEGRAM_BASE_URL": f"http://127.0.0.1:{telegram_port}/bot",
+                    "TELEGRAM_BASE_FILE_URL": (
+                        f"http://127.0.0.1:{telegram_port}/file/bot"
+                    ),
+                    "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+                    "DATA_DIR": data_dir,
+                    "VOICE_TEMP_DIR": str(Path(data_dir) / "voice"),
+                    "BOT_MODE": "polling",
+                }
+            )
+            os.environ.pop("MEDIA_PREWARM_CHAT_ID", None)
+            if args.trace_collector:
+                os.environ["TRACE_OTLP_ENDPOINT"] = (
+                    f"http://127.0.0.1:{telegram_port}/v1/traces"
+                )
+            if not args.keep_rate_limits:
+                os.environ["RATE_LIMITS"] = json.dumps(
+                    {feature: None for feature in RATE_LIMITED_FEATURES}
+                )
+                os.environ["OUTBOUND_LIMITS"] = json.dumps(
+                    {"global": None, "private": None, "group": None}
+                )
+            report = asyncio.run(run(args, telegram_port))
+    finally:
+        stop.set()
+        fakes.join()
+
+    report = {
+        "settings": {
+            key: value for key, value in vars(args).items() if key != "output"
+        },
+        **report,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
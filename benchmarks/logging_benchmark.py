@@ -0,0 +1,117 @@
+"""Measures what logging costs the bot's handlers.
+
+Usage: poetry run python benchmarks/logging_benchmark.py [--runs 3]
+       [--users 10] [--steps 3]
+
+Runs load_test.py with fake backends that answer without delay, once per
+logging mode: off (LOG_LEVEL=CRITICAL), INFO as JSON, INFO as text and DEBUG
+as JSON. For each mode the medians over `--runs` runs are printed as JSON: CPU
+time of the load test process per handled update, the median of the handlers'
+p50 latencies, the wall time and the bytes logged, plus the CPU and latency
+overhead relative to running with logging off.
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+LOAD_TEST = ROOT_DIR / "benchmarks" / "load_test.py"
+MODES = {
+    "off": {"LOG_LEVEL": "CRITICAL", "LOG_FORMAT": "json"},
+    "info_json": {"LOG_LEVEL": "INFO", "LOG_FORMAT": "json"},
+    "info_text": {"LOG_LEVEL": "INFO", "LOG_FORMAT": "text"},
+    "debug_json": {"LOG_LEVEL": "DEBUG", "LOG_FORMAT": "json"},
+}
+
+
+def children_cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_load_test(args, settings: dict, extra_args: tuple = ()) -> dict:
+    """
+    Runs one load test with the environment `settings`; returns its CPU time,
+    latency, wall time and log size.
+    """
+    command = [
+        sys.executable,
+        str(LOAD_TEST),
+        "--users",
+        str(args.users),
+        "--steps",
+        str(args.steps),
+        "--flows",
+        args.flows,
+        "--openai-latency",
+        "0",
+        "--telegram-latency",
+        "0",
+        "--latency-spread",
+        "0",
+        *extra_args,
+    ]
+    env = {**os.environ, **settings}
+    with tempfile.TemporaryFile() as log_file:
+        cpu_before = children_cpu_seconds()
+        result = subprocess.run(
+            command,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=log_file,
+            check=True,
+        )
+        # Includes the fake backends' process, which does the same work per mode.
+        cpu = children_cpu_seconds() - cpu_before
+        log_bytes = log_file.tell()
+
+    report = json.loads(result.stdout)
+    handlers = report["handlers"].values()
+    updates = sum(entry["count"] for entry in handlers)
+    return {
+        "cpu_ms_per_update": cpu * 1000 / max(updates, 1),
+        "handler_p50_ms": statistics.median(
+            entry["p50_ms"] for entry in handlers if "p50_ms" in entry
+        ),
+        "elapsed_s": report["elapsed_s"],
+        "log_bytes": log_bytes,
+        "errors": sum(entry["errors"] + entry["timeouts"] for entry in handlers),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--users", type=int, default=10, help="users per flow")
+    parser.add_argument("--steps", type=int, default=3, help="messages per user")
+    parser.add_argument("--flows", default="random,gpt,talk,quiz,translate")
+    args = parser.parse_args()
+
+    results = {}
+    for mode, settings in MODES.items():
+        runs = [run_load_test(args, settings) for _ in range(args.runs)]
+        results[mode] = {
+            key: round(statistics.median(run[key] for run in runs), 3)
+            for key in runs[0]
+        }
+
+    off = results["off"]
+    for mode, result in results.items():
+        if mode == "off":
+            continue
+        for name, key in (("cpu", "cpu_ms_per_update"), ("p50", "handler_p50_ms")):
+            overhead = (result[key] / off[key] - 1) * 100 if off[key] else 0.0
+            result[f"{name}_overhead_pct"] = round(overhead, 1)
+
+    print(json.dumps({"settings": vars(args), "modes": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
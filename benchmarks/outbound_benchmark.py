@@ -0,0 +1,151 @@
+"""Shows that the outbound scheduler sends at Telegram's limits without 429s.
+
+Usage: poetry run python benchmarks/outbound_benchmark.py [--chats 60]
+       [--answers 5] [--edits 5]
+
+A fake Bot API (fake_backends.py) enforces flood limits like Telegram's: 30
+requests per second over all chats and 1 per second per chat, with bursts of
+30 and 5. Every chat receives `--answers` answers, each sent `--think-time`
+seconds after a typing action, while a burst of `--edits` edits of one message
+is fired at it. This
+runs once with a bare ExtBot and once with OutboundScheduler as its rate
+limiter. Printed as JSON per run: the time taken, requests delivered per
+second, 429s answered by the fake, failed calls, answer latency and the
+scheduler's counters. The script exits with status 1 if the scheduled run got
+any 429 or delivered less than `--min-utilization` of the global limit.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "src"))
+sys.path.insert(0, str(ROOT_DIR / "benchmarks"))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:benchmark")
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from telegram.error import TelegramError  # noqa: E402
+from telegram.ext import ExtBot  # noqa: E402
+from telegram.request import HTTPXRequest  # noqa: E402
+
+from fake_backends import FakeTelegram, FloodLimits, Profile  # noqa: E402
+from utils.http_server import HttpServer  # noqa: E402
+from utils.outbound_scheduler import OutboundScheduler  # noqa: E402
+
+TOKEN = "123:benchmark"
+FIRST_CHAT_ID = 10_000
+
+
+def percentile(sorted_values: list, share: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(share * len(sorted_values)))]
+
+
+async def run_chat(bot: ExtBot, chat_id: int, args, latencies: list, failures):
+    """Sends one chat's answers and edits; records answer latencies."""
+
+    async def call(coroutine):
+        try:
+            return await coroutine
+        except TelegramError:
+            failures[0] += 1
+            return None
+
+    message = await call(bot.send_message(chat_id, "Thinking…"))
+    message_id = message.message_id if message else 1
+    edits = asyncio.gather(
+        *(
+            call(bot.edit_message_text(f"Draft {i}", chat_id, message_id))
+            for i in range(args.edits)
+        )
+    )
+    for i in range(args.answers):
+        await call(bot.send_chat_action(chat_id, "typing"))
+        await asyncio.sleep(args.think_time)
+        started = time.perf_counter()
+        if await call(bot.send_message(chat_id, f"Answer {i}")):
+            latencies.append(time.perf_counter() - started)
+    await edits
+
+
+async def run(args, port: int, fake: FakeTelegram, scheduled: bool) -> dict:
+    scheduler = OutboundScheduler() if scheduled else None
+    bot = ExtBot(
+        TOKEN,
+        base_url=f"http://127.0.0.1:{port}/bot",
+        request=HTTPXRequest(connection_pool_size=1024, pool_timeout=60),
+        rate_limiter=scheduler,
+    )
+    latencies, failures = [], [0]
+    fake.calls.clear()
+    async with bot:
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(
+                run_chat(bot, FIRST_CHAT_ID + i, args, latencies, failures)
+                for i in range(args.chats)
+            )
+        )
+        elapsed = time.perf_counter() - started
+    calls = dict(fake.calls)
+    flood_limited = calls.pop("flood_limited", 0)
+    delivered = sum(calls.values()) - calls.get("getMe", 0) - flood_limited
+    latencies.sort()
+    result = {
+        "elapsed_s": round(elapsed, 2),
+        "delivered_per_s": round(delivered / elapsed, 1),
+        "flood_limited_429s": flood_limited,
+        "failed_calls": failures[0],
+        "answer_p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "answer_p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "answers_sent": len(latencies),
+        "calls": calls,
+    }
+    if scheduler:
+        result["scheduler"] = dict(scheduler.stats)
+    return result
+
+
+async def main_async(args) -> dict:
+    fake = FakeTelegram(TOKEN, Profile(args.latency, 0.3), FloodLimits())
+    server = HttpServer("127.0.0.1", 0, fake.routes())
+    await server.start()
+    try:
+        unscheduled = await run(args, server.port, fake, scheduled=False)
+        # Lets the fake's buckets refill.
+        limits = FloodLimits()
+        await asyncio.sleep(limits.chat_burst / limits.chat_per_second + 1)
+        scheduled = await run(args, server.port, fake, scheduled=True)
+        return {"unscheduled": unscheduled, "scheduled": scheduled}
+    finally:
+        await server.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chats", type=int, default=60)
+    parser.add_argument("--answers", type=int, default=5, help="answers per chat")
+    parser.add_argument("--edits", type=int, default=5, help="edits per chat")
+    parser.add_argument("--think-time", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--min-utilization", type=float, default=0.8)
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    print(json.dumps({"settings": vars(args), **results}, indent=2))
+    scheduled = results["scheduled"]
+    limit = FloodLimits().global_per_second
+    if (
+        scheduled["flood_limited_429s"]
+        or scheduled["delivered_per_s"] < args.min_utilization * limit
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
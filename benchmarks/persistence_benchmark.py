@@ -0,0 +1,167 @@
+"""Compares SqlitePersistence with PicklePersistence for many stored users.
+
+Usage: poetry run python benchmarks/persistence_benchmark.py [--users 100000]
+
+For each backend a store with `--users` users is created first. A fresh process
+then measures the startup time (constructing the persistence and loading what
+the Application loads at boot), the latency of one persistence run that writes
+`--dirty` changed users, and the peak RSS of that process. Results are printed
+as one JSON object per backend.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "src"))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:benchmark")
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+CONVERSATION_NAMES = [
+    "fact_session",
+    "gpt_session",
+    "talk_session",
+    "quiz_session",
+    "translate_session",
+    "voice_session",
+]
+
+
+def sample_user_data(user_id: int) -> dict:
+    return {
+        "quiz_total_questions": user_id % 20,
+        "quiz_correct_answers": user_id % 7,
+        "quiz_seen_questions": {f"{user_id:016x}", f"{user_id * 7:016x}"},
+        "gpt_system_prompt": "You are an AI assistant.",
+        "gpt_history": [
+            {"role": "user", "content": "What is the capital of France?"},
+            {"role": "assistant", "content": "The capital of France is Paris."},
+        ],
+        "translate_lang": "German",
+    }
+
+
+def create_persistence(backend: str, path: Path):
+    if backend == "sqlite":
+        from utils.sqlite_persistence import SqlitePersistence
+
+        return SqlitePersistence(path)
+    from telegram.ext import PicklePersistence
+
+    return PicklePersistence(path, on_flush=True)
+
+
+async def populate(backend: str, path: Path, users: int) -> None:
+    persistence = create_persistence(backend, path)
+    await persistence.get_user_data()
+    for name in CONVERSATION_NAMES:
+        await persistence.get_conversations(name)
+    await asyncio.gather(
+        *(
+            persistence.update_user_data(user_id, sample_user_data(user_id))
+            for user_id in range(users)
+        )
+    )
+    await asyncio.gather(
+        *(
+            persistence.update_conversation("quiz_session", (user_id, user_id), 5)
+            for user_id in range(users)
+        )
+    )
+    await persistence.flush()
+
+
+async def measure(backend: str, path: Path, users: int, dirty: int) -> dict:
+    started = time.perf_counter()
+    persistence = create_persistence(backend, path)
+    user_data = await persistence.get_user_data()
+    for name in CONVERSATION_NAMES:
+        await persistence.get_conversations(name)
+    startup_time = time.perf_counter() - started
+
+    dirty_ids = range(0, users, max(1, users // dirty))[:dirty]
+    for user_id in dirty_ids:
+        data = user_data.setdefault(user_id, {})
+        await persistence.refresh_user_data(user_id, data)
+        data["quiz_total_questions"] = data.get("quiz_total_questions", 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            persistence.update_user_data(user_id, user_data[user_id])
+            for user_id in dirty_ids
+        )
+    )
+    if backend == "pickle":
+        # PicklePersistence(on_flush=True) only writes its file in flush().
+        await persistence.flush()
+    flush_latency = time.perf_counter() - started
+
+    return {
+        "backend": backend,
+        "users": users,
+        "dirty_users": len(dirty_ids),
+        "startup_s": round(startup_time, 4),
+        "flush_latency_s": round(flush_latency, 4),
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+        "store_size_mb": round(path.stat().st_size / 2**20, 1),
+    }
+
+
+def run_worker(args) -> None:
+    path = Path(args.path)
+    if args.phase == "populate":
+        asyncio.run(populate(args.backend, path, args.users))
+    else:
+        result = asyncio.run(measure(args.backend, path, args.users, args.dirty))
+        print(json.dumps(result))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--dirty", type=int, default=1_000)
+    parser.add_argument("--backend", choices=["sqlite", "pickle"])
+    parser.add_argument("--phase", choices=["populate", "measure"])
+    parser.add_argument("--path")
+    args = parser.parse_args()
+
+    if args.phase:
+        run_worker(args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for backend in ("sqlite", "pickle"):
+            path = Path(tmp_dir) / f"{backend}.store"
+            for phase in ("populate", "measure"):
+                subprocess.run(
+                    [
+                        sys.executable,
+                        __file__,
+                        "--backend",
+                        backend,
+                        "--phase",
+                        phase,
+                        "--path",
+                        str(path),
+                        "--users",
+                        str(args.users),
+                        "--dirty",
+                        str(args.dirty),
+                    ],
+                    check=True,
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Checks which questions the /talk cache matches and how fast it looks them up.
+
+Usage: poetry run python benchmarks/question_cache_benchmark.py [--entries 500]
+
+Caches the first question of each calibration pair and asks the second: real
+paraphrases must hit, questions that only look alike must miss. Then fills a
+cache with `--entries` questions and times lookups of cached and new ones.
+Prints the results as JSON and exits with status 1 if any pair was matched
+wrongly.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "src"))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:benchmark")
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from utils.question_cache import QuestionCache, question_key  # noqa: E402
+
+# (cached question, asked question, whether the cached answer fits)
+CALIBRATION_PAIRS = [
+    ("What is relativity?", "Explain relativity", True),
+    ("What is relativity?", "What is the theory of relativity?", True),
+    ("What is relativity?", "whats relativity", True),
+    ("What is relativity?", "What's relativity", True),
+    ("What do you think of democracy?", "What do you think about democracy?", True),
+    ("Tell me about black holes", "Describe black holes", True),
+    ("Do dogs bite?", "Does a dog bite?", True),
+    ("Does the dog bite the man?", "Does the man bite the dog?", False),
+    ("What do you think about AI?", "What do you think about AI safety?", False),
+    ("Is time travel possible?", "Is time travel impossible?", False),
+    ("Who was your teacher?", "Who was your student?", False),
+    ("Is war ever justified?", "Is war never justified?", False),
+    ("Where were you born?", "When were you born?", False),
+    ("Where were you born?", "Why were you born?", False),
+    ("Where were you born?", "How were you born?", False),
+    ("Where were you born?", "Where was I born?", False),
+    ("Who is the president?", "Who was the president?", False),
+    ("Is it true?", "Is it not true?", False),
+]
+WORDS = (
+    "art science war peace love time space music poetry history power freedom "
+    "god death life truth beauty money friendship family nature justice law "
+    "physics chemistry philosophy religion politics language memory dream"
+).split()
+
+
+def check_pairs() -> list[dict]:
+    results = []
+    for cached, asked, expected in CALIBRATION_PAIRS:
+        cache = QuestionCache(size=10)
+        cache.put("personality", cached, "answer")
+        hit = cache.get("personality", asked) is not None
+        results.append(
+            {
+                "cached": cached,
+                "asked": asked,
+                "cached_key": question_key(cached),
+                "asked_key": question_key(asked),
+                "expected_hit": expected,
+                "hit": hit,
+                "ok": hit == expected,
+            }
+        )
+    return results
+
+
+def time_lookups(entries: int, lookups: int) -> dict:
+    rng = random.Random(1)
+    questions = [
+        f"What do you think about {' and '.join(rng.sample(WORDS, 3))}?"
+        for _ in range(entries)
+    ]
+    cache = QuestionCache(size=entries)
+    for question in questions:
+        cache.put("personality", question, "answer")
+    result = {}
+    for name, asked in (
+        ("cached", [rng.choice(questions) for _ in range(lookups)]),
+        ("new", [f"How old is {rng.choice(WORDS)} {i}?" for i in range(lookups)]),
+    ):
+        started = time.perf_counter()
+        for question in asked:
+            cache.get("personality", question)
+        elapsed = time.perf_counter() - started
+        result[f"{name}_lookup_us"] = round(elapsed / lookups * 1e6, 1)
+    result["stats"] = dict(cache.stats)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=500)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    pairs = check_pairs()
+    result = {
+        "settings": vars(args),
+        "pairs": pairs,
+        "lookups": time_lookups(args.entries, args.lookups),
+    }
+    print(json.dumps(result, indent=2))
+    if not all(pair["ok"] for pair in pairs):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""Measures update throughput of the sharded bot with 1 to N worker processes.
+
+Usage: poetry run python benchmarks/sharding_benchmark.py [--workers 1,2,4]
+       [--chats 2000] [--updates-per-chat 5]
+
+For each worker count, `src/bot.py` is started in webhook mode with SHARD_COUNT
+set, against the fake Bot API of fake_backends.py (in its own process). After
+one warm-up /start per worker, `--chats` chats send `--updates-per-chat` /start
+commands each to the webhook over `--connections` keep-alive connections, and
+the run ends when the fake Bot API has received the reply to every update.
+Throughput and the speedup over the first worker count are printed as JSON.
+
+Scaling is bounded by the CPU cores (reported as `cpu_count`), and the load
+generator, the front process and the fake Bot API need some of them too.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+SRC_DIR = ROOT_DIR / "src"
+sys.path.insert(0, str(SRC_DIR))
+sys.path.insert(0, str(ROOT_DIR / "benchmarks"))
+
+from fake_backends import Profile, run_process  # noqa: E402
+from utils.sharding import shard_of  # noqa: E402
+
+TOKEN = "123:benchmark"
+SECRET = "benchmark-secret"
+WEBHOOK_PATH = "/telegram"
+RATE_LIMITED_FEATURES = ["global", "gpt", "talk", "translate", "voice", "fact", "quiz"]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_update(update_id: int, chat_id: int) -> bytes:
+    user = {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}"}
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": user,
+        "text": "/start",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+    }
+    return json.dumps({"update_id": update_id, "message": message}).encode()
+
+
+def replies(telegram_port: int) -> int:
+    url = f"http://127.0.0.1:{telegram_port}/stats"
+    with urllib.request.urlopen(url) as response:
+        return json.load(response)["telegram"].get("sendMessage", 0)
+
+
+async def wait_for_replies(telegram_port: int, expected: int, timeout: float):
+    deadline = time.perf_counter() + timeout
+    while (count := await asyncio.to_thread(replies, telegram_port)) < expected:
+        if time.perf_counter() > deadline:
+            raise TimeoutError(f"Only {count} of {expected} replies arrived.")
+        await asyncio.sleep(0.05)
+
+
+async def post_updates(port: int, bodies: list[bytes]) -> None:
+    """Sends `bodies` in order over one keep-alive connection."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        for body in bodies:
+            head = (
+                f"POST {WEBHOOK_PATH} HTTP/1.1\r\nHost: bench\r\n"
+                f"Content-Type: application/json\r\n"
+                f"X-Telegram-Bot-Api-Secret-Token: {SECRET}\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n"
+            )
+            writer.write(head.encode() + body)
+            response_head = await reader.readuntil(b"\r\n\r\n")
+            if not response_head.startswith(b"HTTP/1.1 200"):
+                raise RuntimeError(f"Webhook answered {response_head[:40]!r}")
+            length = 0
+            for line in response_head.decode().split("\r\n"):
+                if line.lower().startswith("content-length:"):
+                    length = int(line.split(":", 1)[1])
+            await reader.readexactly(length)
+    finally:
+        writer.close()
+
+
+async def wait_for_port(port: int, timeout: float = 30) -> None:
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+
+
+async def run_once(args, workers: int, telegram_port: int) -> dict:
+    port = free_port()
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = {
+            **os.environ,
+            "TELEGRAM_BOT_TOKEN": TOKEN,
+            "OPENAI_API_KEY": "sk-benchmark",
+            "TELEGRAM_BASE_URL": f"http://127.0.0.1:{telegram_port}/bot",
+            "TELEGRAM_BASE_FILE_URL": f"http://127.0.0.1:{telegram_port}/file/bot",
+            # OpenAI is not used by /start; connections to it fail fast.
+            "OPENAI_BASE_URL": "http://127.0.0.1:9/v1",
+            "OPENAI_PREWARM_CONNECTIONS": "0",
+            "FEATURE_PRELOAD": "false",
+            "DATA_DIR": data_dir,
+            "VOICE_TEMP_DIR": str(Path(data_dir) / "voice"),
+            "BOT_MODE": "webhook",
+            "WEBHOOK_URL": "https://bench.invalid/telegram",
+            "WEBHOOK_SECRET_TOKEN": SECRET,
+            "WEBHOOK_LISTEN": "127.0.0.1",
+            "WEBHOOK_PORT": str(port),
+            "WEBHOOK_PATH": WEBHOOK_PATH,
+            "SHARD_COUNT": str(workers),
+            "METRICS_PORT": "0",
+            "RATE_LIMITS": json.dumps({f: None for f in RATE_LIMITED_FEATURES}),
+            # The outbound scheduler's global limit would cap the throughput.
+            "OUTBOUND_LIMITS": json.dumps(
+                {"global": None, "private": None, "group": None}
+            ),
+        }
+        env.pop("MEDIA_PREWARM_CHAT_ID", None)
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            str(SRC_DIR / "bot.py"),
+            env=env,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        try:
+            await wait_for_port(port)
+            update_ids = itertools.count(1)
+            # Warm up every worker with one chat routed to it.
+            warm_up_chats = {}
+            for chat_id in itertools.count(1):
+                warm_up_chats.setdefault(
+                    shard_of({"message": {"chat": {"id": chat_id}}}, workers), chat_id
+                )
+                if len(warm_up_chats) == workers:
+                    break
+            before = await asyncio.to_thread(replies, telegram_port)
+            await post_updates(
+                port,
+                [start_update(next(update_ids), c) for c in warm_up_chats.values()],
+            )
+            await wait_for_replies(telegram_port, before + workers, args.timeout)
+
+            chats = [1_000_000 + i for i in range(args.chats)]
+            bodies = [
+                start_update(next(update_ids), chat_id)
+                for _ in range(args.updates_per_chat)
+                for chat_id in chats
+            ]
+            total = len(bodies)
+            before = await asyncio.to_thread(replies, telegram_port)
+            started = time.perf_counter()
+            await asyncio.gather(
+                *(
+                    post_updates(port, bodies[i :: args.connections])
+                    for i in range(args.connections)
+                )
+            )
+            await wait_for_replies(telegram_port, before + total, args.timeout)
+            elapsed = time.perf_counter() - started
+        finally:
+            process.terminate()
+            await process.wait()
+    return {
+        "updates": total,
+        "elapsed_s": round(elapsed, 3),
+        "updates_per_s": round(total / elapsed, 1),
+    }
+
+
+async def run(args, telegram_port: int) -> dict:
+    results = {}
+    for workers in args.workers:
+        results[str(workers)] = await run_once(args, workers, telegram_port)
+    base = next(iter(results.values()))["updates_per_s"]
+    for result in results.values():
+        result["speedup"] = round(result["updates_per_s"] / base, 2)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--chats", type=int, default=2000)
+    parser.add_argument("--updates-per-chat", type=int, default=5)
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument("--telegram-latency", type=float, default=0.01)
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+    args.workers = [int(count) for count in args.workers.split(",")]
+
+    ready, ready_child = multiprocessing.Pipe()
+    stop = multiprocessing.Event()
+    fakes = multiprocessing.Process(
+        target=run_process,
+        args=(TOKEN, Profile(args.telegram_latency), Profile(0.0), ready_child, stop),
+    )
+    fakes.start()
+    try:
+        telegram_port, _ = ready.recv()
+        results = asyncio.run(run(args, telegram_port))
+    finally:
+        stop.set()
+        fakes.join()
+
+    report = {
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "chats": args.chats,
+            "updates_per_chat": args.updates_per_chat,
+            "connections": args.connections,
+            "telegram_latency": args.telegram_latency,
+        },
+        "workers": results,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
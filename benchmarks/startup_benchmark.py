@@ -0,0 +1,217 @@
+"""Measures the bot's cold start and fails when it gets slower than a baseline.
+
+Usage: poetry run python benchmarks/startup_benchmark.py [--runs 5]
+       [--baseline data/startup_baseline.json] [--update-baseline]
+
+Each run starts `src/bot.py` in polling mode as a fresh process against the
+fake Bot API and OpenAI servers of fake_backends.py (answering without delay)
+and measures the time from process start to its first getUpdates call. A
+`python -X importtime -c "import bot"` run per iteration gives the import time
+of bot.py and the slowest modules it imports directly.
+
+Medians are printed as JSON and compared with the baseline file, which is
+machine-specific and written with `--update-baseline`. The script exits with
+status 1 if a median is more than `--tolerance` slower than its baseline or
+above `--max-first-get-updates`.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import signal
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+SRC_DIR = ROOT_DIR / "src"
+sys.path.insert(0, str(SRC_DIR))
+sys.path.insert(0, str(ROOT_DIR / "benchmarks"))
+
+from fake_backends import FakeOpenAI, FakeTelegram, Profile  # noqa: E402
+from utils.http_server import HttpServer  # noqa: E402
+
+TOKEN = "123:benchmark"
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+METRICS = ["first_get_updates_s", "import_bot_s"]
+
+
+def bot_environment(telegram_port: int, openai_port: int, data_dir: str) -> dict:
+    env = {
+        **os.environ,
+        "TELEGRAM_BOT_TOKEN": TOKEN,
+        "OPENAI_API_KEY": "sk-benchmark",
+        "TELEGRAM_BASE_URL": f"http://127.0.0.1:{telegram_port}/bot",
+        "TELEGRAM_BASE_FILE_URL": f"http://127.0.0.1:{telegram_port}/file/bot",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "DATA_DIR": data_dir,
+        "VOICE_TEMP_DIR": str(Path(data_dir) / "voice"),
+        "BOT_MODE": "polling",
+        "METRICS_PORT": "0",
+    }
+    env.pop("MEDIA_PREWARM_CHAT_ID", None)
+    return env
+
+
+async def time_to_first_get_updates(env: dict, first_poll: asyncio.Event) -> float:
+    """Starts the bot, returns when it first polled and stops it again."""
+    first_poll.clear()
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        str(SRC_DIR / "bot.py"),
+        env=env,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        await asyncio.wait_for(first_poll.wait(), timeout=60)
+        return time.perf_counter() - started
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            await asyncio.wait_for(process.wait(), timeout=15)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+
+
+async def import_times(env: dict) -> tuple[float, dict[str, float]]:
+    """
+    Returns the cumulative import time of bot.py and of the modules it imports
+    directly, from `python -X importtime`.
+    """
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-X",
+        "importtime",
+        "-c",
+        "import bot",
+        cwd=SRC_DIR,
+        env=env,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    _, stderr = await process.communicate()
+    children: dict[str, float] = {}
+    for line in stderr.decode().splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative = int(match.group(2)) / 1e6
+        depth = len(match.group(3)) // 2
+        name = match.group(4)
+        if depth == 1:
+            children[name] = cumulative
+        elif depth == 0:
+            if name == "bot":
+                return cumulative, children
+            children = {}
+    raise RuntimeError(f"No import time reported for bot.py:\n{stderr.decode()}")
+
+
+async def measure(runs: int) -> dict:
+    fake_telegram = FakeTelegram(TOKEN, Profile(0.0))
+    fake_openai = FakeOpenAI(Profile(0.0))
+    first_poll = asyncio.Event()
+    routes = fake_telegram.routes()
+    get_updates_route = ("POST", f"/bot{TOKEN}/getUpdates")
+    get_updates = routes[get_updates_route]
+
+    async def record_poll(request):
+        first_poll.set()
+        return await get_updates(request)
+
+    routes[get_updates_route] = record_poll
+    telegram_server = HttpServer("127.0.0.1", 0, routes)
+    openai_server = HttpServer("127.0.0.1", 0, fake_openai.routes())
+    await telegram_server.start()
+    await openai_server.start()
+
+    samples = {metric: [] for metric in METRICS}
+    slowest_imports: dict[str, list[float]] = {}
+    try:
+        for _ in range(runs):
+            with tempfile.TemporaryDirectory() as data_dir:
+                env = bot_environment(
+                    telegram_server.port, openai_server.port, data_dir
+                )
+                samples["first_get_updates_s"].append(
+                    await time_to_first_get_updates(env, first_poll)
+                )
+                total, children = await import_times(env)
+            samples["import_bot_s"].append(total)
+            for name, seconds in children.items():
+                slowest_imports.setdefault(name, []).append(seconds)
+    finally:
+        await telegram_server.stop()
+        await openai_server.stop()
+
+    medians = {name: statistics.median(values) for name, values in samples.items()}
+    imports = sorted(
+        ((statistics.median(values), name) for name, values in slowest_imports.items()),
+        reverse=True,
+    )
+    return {
+        "runs": runs,
+        **{name: round(value, 4) for name, value in medians.items()},
+        "slowest_imports_s": {name: round(value, 4) for value, name in imports[:10]},
+    }
+
+
+def regressions(report: dict, baseline: dict | None, args) -> list[str]:
+    failures = []
+    if baseline:
+        for metric in METRICS:
+            limit = baseline[metric] * (1 + args.tolerance)
+            if report[metric] > limit:
+                failures.append(
+                    f"{metric} {report[metric]:.3f}s is above the baseline "
+                    f"{baseline[metric]:.3f}s + {args.tolerance:.0%}"
+                )
+    limit = args.max_first_get_updates
+    if limit and report["first_get_updates_s"] > limit:
+        failures.append(
+            f"first_get_updates_s {report['first_get_updates_s']:.3f}s is above "
+            f"{limit:.3f}s"
+        )
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--baseline", type=Path, default=ROOT_DIR / "data" / "startup_baseline.json"
+    )
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="allowed slowdown, e.g. 0.25"
+    )
+    parser.add_argument(
+        "--max-first-get-updates", type=float, help="absolute limit in seconds"
+    )
+    args = parser.parse_args()
+
+    report = asyncio.run(measure(args.runs))
+    baseline = None
+    if args.baseline.exists() and not args.update_baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        report["baseline"] = {metric: baseline[metric] for metric in METRICS}
+    failures = regressions(report, baseline, args)
+    report["regressions"] = failures
+    print(json.dumps(report, indent=2))
+
+    if args.update_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Measures what tracing costs the bot's handlers.
+
+Usage: poetry run python benchmarks/tracing_benchmark.py [--runs 3]
+       [--users 10] [--steps 3]
+
+Runs load_test.py like logging_benchmark.py does, once per tracing mode: off,
+10% of the updates traced to a JSON lines file, every update traced to the
+file, and every update exported to the fake OTLP collector of fake_backends.py.
+For each mode the medians over `--runs` runs are printed as JSON: CPU time per
+handled update, the median of the handlers' p50 latencies and the wall time,
+plus the overhead relative to tracing off.
+"""
+
+import argparse
+import json
+import statistics
+import tempfile
+from pathlib import Path
+
+from logging_benchmark import run_load_test
+
+METRICS = ["cpu_ms_per_update", "handler_p50_ms", "elapsed_s", "errors"]
+
+
+def modes(trace_file: Path) -> dict:
+    """Tracing mode -> (environment, extra load_test.py arguments)."""
+    return {
+        "off": ({"TRACE_SAMPLE_RATE": "0"}, ()),
+        "file_10pct": ({"TRACE_SAMPLE_RATE": "0.1", "TRACE_FILE": str(trace_file)}, ()),
+        "file_all": ({"TRACE_SAMPLE_RATE": "1", "TRACE_FILE": str(trace_file)}, ()),
+        "otlp_all": ({"TRACE_SAMPLE_RATE": "1"}, ("--trace-collector",)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--users", type=int, default=10, help="users per flow")
+    parser.add_argument("--steps", type=int, default=3, help="messages per user")
+    parser.add_argument("--flows", default="random,gpt,talk,quiz,translate,voice")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as trace_dir:
+        trace_file = Path(trace_dir) / "traces.jsonl"
+        for mode, (settings, extra_args) in modes(trace_file).items():
+            # Logging is off so that it does not blur the difference.
+            settings = {"LOG_LEVEL": "CRITICAL", **settings}
+            runs = [run_load_test(args, settings, extra_args) for _ in range(args.runs)]
+            results[mode] = {
+                key: round(statistics.median(run[key] for run in runs), 3)
+                for key in METRICS
+            }
+
+    off = results["off"]
+    for mode, result in results.items():
+        if mode == "off":
+            continue
+        for name, key in (("cpu", "cpu_ms_per_update"), ("p50", "handler_p50_ms")):
+            overhead = (result[key] / off[key] - 1) * 100 if off[key] else 0.0
+            result[f"{name}_overhead_pct"] = round(overhead, 1)
+
+    print(json.dumps({"settings": vars(args), "modes": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
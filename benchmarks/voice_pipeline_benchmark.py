@@ -0,0 +1,104 @@
+"""Compares time-to-first-audio of the pipelined and the sequential voice reply.
+
+Usage: poetry run python benchmarks/voice_pipeline_benchmark.py [--runs 5]
+
+Both modes run against the same fake backends: a chat completion that streams
+a reply token by token and a TTS call whose latency grows with the text length.
+The sequential mode waits for the whole reply, synthesizes it at once and then
+sends it, like the bot did before. Results are printed as JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "src"))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:benchmark")
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from utils.voice_pipeline import VoicePipeline  # noqa: E402
+
+REPLY = (
+    "Great question! The Moon has no atmosphere to speak of, so its sky looks "
+    "black even during the day. Temperatures swing from about 120 degrees "
+    "Celsius in sunlight to minus 170 at night. Because the Moon is tidally "
+    "locked, we always see the same side of it from Earth. Astronauts left "
+    "retroreflectors there, and scientists still bounce lasers off them to "
+    "measure the distance with millimetre precision. The Moon is also slowly "
+    "drifting away from us, by roughly 3.8 centimetres every year. "
+) * 2
+
+
+async def fake_stream(token_delay: float):
+    for word in REPLY.split(" "):
+        await asyncio.sleep(token_delay)
+        yield word + " "
+
+
+def fake_tts(base_latency: float, per_char: float):
+    async def synthesize(text: str) -> bytes:
+        await asyncio.sleep(base_latency + per_char * len(text))
+        return b"OggS" + text.encode()
+
+    return synthesize
+
+
+async def run_sequential(args) -> tuple[float, float]:
+    started = time.perf_counter()
+    reply = "".join([delta async for delta in fake_stream(args.token_delay)])
+    await fake_tts(args.tts_latency, args.tts_per_char)(reply)
+    first_audio = time.perf_counter() - started
+    return first_audio, first_audio
+
+
+async def run_pipelined(args) -> tuple[float, float]:
+    started = time.perf_counter()
+    sent_at = []
+
+    async def send(_text: str, _audio: bytes | None) -> None:
+        sent_at.append(time.perf_counter() - started)
+
+    pipeline = VoicePipeline(
+        fake_tts(args.tts_latency, args.tts_per_char), send, args.concurrency
+    )
+    await pipeline.run(fake_stream(args.token_delay))
+    return sent_at[0], sent_at[-1]
+
+
+def summarize(samples: list[tuple[float, float]]) -> dict:
+    return {
+        "first_audio_s": round(statistics.median(s[0] for s in samples), 3),
+        "last_audio_s": round(statistics.median(s[1] for s in samples), 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--tts-latency", type=float, default=0.4)
+    parser.add_argument("--tts-per-char", type=float, default=0.002)
+    parser.add_argument("--concurrency", type=int, default=3)
+    args = parser.parse_args()
+
+    sequential = [asyncio.run(run_sequential(args)) for _ in range(args.runs)]
+    pipelined = [asyncio.run(run_pipelined(args)) for _ in range(args.runs)]
+    print(
+        json.dumps(
+            {
+                "reply_chars": len(REPLY),
+                "sequential": summarize(sequential),
+                "pipelined": summarize(pipelined),
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
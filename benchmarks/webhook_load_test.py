@@ -0,0 +1,125 @@
+"""Replays a burst of updates against the local webhook endpoint.
+
+Usage: poetry run python benchmarks/webhook_load_test.py [--updates 5000]
+
+Starts the WebhookServer on a free local port in front of a real Application
+(without contacting Telegram), POSTs `--updates` updates over `--connections`
+keep-alive connections and reports the intake latency (time until the endpoint
+answered 200) and throughput as JSON. A bare asyncio client is used so that the
+numbers reflect the endpoint rather than client overhead.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "src"))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:benchmark")
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from telegram.ext import Application  # noqa: E402
+
+from utils.webhook import WebhookServer, SECRET_TOKEN_HEADER  # noqa: E402
+
+SECRET_TOKEN = "benchmark-secret"
+
+
+def make_update(update_id: int) -> bytes:
+    chat_id = 1000 + update_id % 500
+    return json.dumps(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+                "text": "Hello, bot!",
+            },
+        }
+    ).encode()
+
+
+def percentile(sorted_values: list, share: float) -> float:
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * share))
+    return sorted_values[index]
+
+
+async def send_request(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter, request: bytes
+) -> int:
+    writer.write(request)
+    head = await reader.readuntil(b"\r\n\r\n")
+    status_line, *header_lines = head.decode("latin-1").split("\r\n")
+    length = 0
+    for line in header_lines:
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    if length:
+        await reader.readexactly(length)
+    return int(status_line.split(" ")[1])
+
+
+async def run(updates: int, connections: int) -> dict:
+    application = Application.builder().token(os.environ["TELEGRAM_BOT_TOKEN"]).build()
+    server = WebhookServer(application, "127.0.0.1", 0, "/telegram", SECRET_TOKEN)
+    await server.start()
+    port = server.http_server.port
+
+    requests = []
+    for update_id in range(updates):
+        body = make_update(update_id)
+        head = (
+            f"POST /telegram HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"{SECRET_TOKEN_HEADER}: {SECRET_TOKEN}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n"
+        )
+        requests.append(head.encode() + body)
+    latencies = []
+    statuses = {}
+    next_index = iter(range(updates))
+
+    async def worker() -> None:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for index in next_index:
+            started = time.perf_counter()
+            status = await send_request(reader, writer, requests[index])
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+        writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(connections)))
+    elapsed = time.perf_counter() - started
+
+    await server.stop()
+    latencies.sort()
+    return {
+        "updates": updates,
+        "connections": connections,
+        "statuses": statuses,
+        "queued": application.update_queue.qsize(),
+        "throughput_per_s": round(updates / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--connections", type=int, default=40)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.updates, args.connections))))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,53 +1,72 @@
 """Main entry point for the Telegram bot, which ties all the handlers together."""
 
-from config import TELEGRAM_BOT_TOKEN
+from config import (
+    TELEGRAM_BOT_TOKEN,
+    TELEGRAM_BASE_URL,
+    TELEGRAM_BASE_FILE_URL,
+    MEDIA_PREWARM_CHAT_ID,
+    PERSISTENCE_PATH,
+    PERSISTENCE_FLUSH_INTERVAL,
+    BOT_MODE,
+    WEBHOOK_URL,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET_TOKEN,
+    UPDATE_MAX_CONCURRENT_CHATS,
+    METRICS_PORT,
+    METRICS_LISTEN,
+    FEATURE_PRELOAD,
+    SHARD_COUNT,
+    SHARD_INDEX,
+    SHARD_BUFFER_SIZE,
+    SHARD_MAX_RESTART_DELAY,
+    VOICE_TEMP_DIR,
+    check_config,
+)
 
+import asyncio
 import logging
+import os
+import signal
+import sys
 
+from telegram import Bot, Update
 from telegram.ext import (
     Application,
     CommandHandler,
     ConversationHandler,
     MessageHandler,
     CallbackQueryHandler,
+    TypeHandler,
     filters,
 )
 
 from utils.logger import setup_logger
+from utils.media_cache import media_cache
+from utils.chatgpt_client import chatgpt_client
+from utils.model_router import model_router
+from utils.tracing import tracer
+from utils.sqlite_persistence import SqlitePersistence
+from utils.webhook import WebhookServer
+from utils.update_processor import PerChatUpdateProcessor
+from utils.rate_limiter import rate_limiter
+from utils.outbound_scheduler import outbound_scheduler
+from utils.translation_cache import translation_cache
+from utils.voice_files import clean_voice_temp_dir
+from utils.instrumented_request import InstrumentedRequest
+from utils.metrics import (
+    registry,
+    stats_collector,
+    instrument_application,
+    create_metrics_server,
+)
+from utils.features import Feature, preload
+from utils.sharding import ShardWorker, ShardRouter, open_stdin, feed_updates
 from handlers.start import start_handler
 from handlers.finish import finish_handler
 from handlers.error import error_handler
-from handlers.famous_personality import (
-    start_talk_handler,
-    choose_personality_handler,
-    talk_to_personality_handler,
-    change_personality_handler,
-)
-from handlers.quiz import (
-    start_quiz_handler,
-    choose_topic_handler,
-    ask_question_handler,
-    check_answer_handler,
-    finish_quiz_handler,
-)
-from handlers.chat_interface import (
-    start_gpt_handler,
-    gpt_conversation_handler,
-)
-from handlers.random_fact import (
-    start_random_handler,
-    random_fact_handler,
-)
-from handlers.optional_features.translator import (
-    start_translate_handler,
-    choose_language_handler,
-    translate_text_handler,
-    change_language_handler,
-)
-from handlers.optional_features.voice_chatgpt import (
-    start_voice_handler,
-    process_voice_handler,
-)
+from handlers.admin import purge_translation_cache_handler
 
 
 # --- State Definitions ---
@@ -65,52 +84,154 @@ from handlers.optional_features.voice_chatgpt import (
 ) = range(10)
 
 
+# --- Features, imported on first use ---
+talk = Feature("talk", "handlers.famous_personality")
+quiz = Feature(
+    "quiz", "handlers.quiz", on_load="start_quiz_pool", on_shutdown="stop_quiz_pool"
+)
+gpt = Feature("gpt", "handlers.chat_interface")
+random_fact = Feature(
+    "random",
+    "handlers.random_fact",
+    on_load="start_fact_pool",
+    on_shutdown="stop_fact_pool",
+)
+translator = Feature("translate", "handlers.optional_features.translator")
+voice = Feature("voice", "handlers.optional_features.voice_chatgpt")
+FEATURES = [random_fact, gpt, talk, quiz, translator, voice]
+
 setup_logger("")
 
 logger = logging.getLogger(__name__)
 logger.info("Environment variables loaded.")
 
+metrics_server = (
+    create_metrics_server(METRICS_LISTEN, METRICS_PORT) if METRICS_PORT else None
+)
 
-def main():
-    """Main function to run the bot."""
+
+warm_up_task: asyncio.Task | None = None
+
+
+async def warm_up(application: Application) -> None:
+    """Prepares what the first users would otherwise wait for, once polling runs."""
+    await chatgpt_client.start()
+    if FEATURE_PRELOAD:
+        await preload(FEATURES)
+    if MEDIA_PREWARM_CHAT_ID:
+        await media_cache.prewarm(application.bot, int(MEDIA_PREWARM_CHAT_ID))
+
+
+async def post_init(application: Application) -> None:
+    """
+    Runs once after the application is initialized, before polling starts.
+    Slow preparations run in the background so that updates are received early.
+    """
+    global warm_up_task
+    clean_voice_temp_dir()
+    if metrics_server:
+        await metrics_server.start()
+    warm_up_task = asyncio.create_task(warm_up(application))
+
+
+async def post_shutdown(_application: Application) -> None:
+    """Releases shared resources after the application has stopped."""
+    if warm_up_task:
+        warm_up_task.cancel()
+        await asyncio.gather(warm_up_task, return_exceptions=True)
+    for feature in FEATURES:
+        await feature.shutdown()
+    await chatgpt_client.close()
+    await translation_cache.close()
+    await asyncio.to_thread(tracer.shutdown)
+    if metrics_server:
+        await metrics_server.stop()
+
+
+def build_application() -> Application:
+    """Creates the application and registers all handlers."""
+    check_config()
     token = TELEGRAM_BOT_TOKEN
 
-    application = Application.builder().token(token).build()
+    persistence = SqlitePersistence(
+        PERSISTENCE_PATH, update_interval=PERSISTENCE_FLUSH_INTERVAL
+    )
+    application = (
+        Application.builder()
+        .token(token)
+        .base_url(TELEGRAM_BASE_URL)
+        .base_file_url(TELEGRAM_BASE_FILE_URL)
+        .request(InstrumentedRequest(connection_pool_size=256))
+        .rate_limiter(outbound_scheduler)
+        .persistence(persistence)
+        .concurrent_updates(PerChatUpdateProcessor(UPDATE_MAX_CONCURRENT_CHATS))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+
+    # --- Rate limiting, runs before every other handler ---
+    application.add_handler(TypeHandler(Update, rate_limiter.handle), group=-1)
+    rate_limiter.track("gpt", gpt.handler("gpt_conversation_handler"))
+    rate_limiter.track("talk", talk.handler("talk_to_personality_handler"))
+    rate_limiter.track("translate", translator.handler("translate_text_handler"))
+    rate_limiter.track("voice", voice.handler("process_voice_handler"))
+    rate_limiter.track(
+        "fact",
+        random_fact.handler("start_random_handler"),
+        random_fact.handler("random_fact_handler"),
+    )
+    rate_limiter.track(
+        "quiz",
+        quiz.handler("choose_topic_handler"),
+        quiz.handler("ask_question_handler"),
+        quiz.handler("explain_answer_handler"),
+    )
 
     application.add_handler(CommandHandler("start", start_handler))
+    application.add_handler(
+        CommandHandler("purge_translations", purge_translation_cache_handler)
+    )
     application.add_handler(CallbackQueryHandler(finish_handler, pattern="^finish$"))
 
     # --- ConversationHandler for /random ---
     random_handler = ConversationHandler(
         name="fact_session",
         entry_points=[
-            CommandHandler("random", start_random_handler),
+            CommandHandler("random", random_fact.handler("start_random_handler")),
             MessageHandler(
-                filters.Regex("^💡 Interesting Fact$"), start_random_handler
+                filters.Regex("^💡 Interesting Fact$"),
+                random_fact.handler("start_random_handler"),
             ),
         ],
         states={
             RANDOM_FACT: [
-                CallbackQueryHandler(random_fact_handler, pattern="^random_more$"),
+                CallbackQueryHandler(
+                    random_fact.handler("random_fact_handler"), pattern="^random_more$"
+                ),
                 CallbackQueryHandler(finish_handler, pattern="^finish_random$"),
             ],
         },
         fallbacks=[CommandHandler("start", start_handler)],
         allow_reentry=True,
         per_message=False,
+        persistent=True,
     )
 
     # --- ConversationHandler for /gpt ---
     gpt_handler = ConversationHandler(
         name="gpt_session",
         entry_points=[
-            CommandHandler("gpt", start_gpt_handler),
-            MessageHandler(filters.Regex("^🤖 ChatGPT$"), start_gpt_handler),
+            CommandHandler("gpt", gpt.handler("start_gpt_handler")),
+            MessageHandler(
+                filters.Regex("^🤖 ChatGPT$"), gpt.handler("start_gpt_handler")
+            ),
         ],
         states={
             GPT_INTERFACE: [
                 MessageHandler(
-                    filters.TEXT & ~filters.COMMAND, gpt_conversation_handler
+                    filters.TEXT & ~filters.COMMAND,
+                    gpt.handler("gpt_conversation_handler"),
                 ),
                 CallbackQueryHandler(finish_handler, pattern="^finish_gpt_dialog$"),
             ],
@@ -118,27 +239,33 @@ def main():
         fallbacks=[CommandHandler("start", start_handler)],
         allow_reentry=True,
         per_message=False,
+        persistent=True,
     )
 
     # --- ConversationHandler for /talk ---
     talk_handler = ConversationHandler(
         name="talk_session",
         entry_points=[
-            CommandHandler("talk", start_talk_handler),
+            CommandHandler("talk", talk.handler("start_talk_handler")),
             MessageHandler(
-                filters.Regex("^👥 Chat with Personality$"), start_talk_handler
+                filters.Regex("^👥 Chat with Personality$"),
+                talk.handler("start_talk_handler"),
             ),
         ],
         states={
             CHOOSE_PERSONALITY: [
-                CallbackQueryHandler(choose_personality_handler, pattern="^talk_")
+                CallbackQueryHandler(
+                    talk.handler("choose_personality_handler"), pattern="^talk_"
+                )
             ],
             TALK_TO_PERSONALITY: [
                 MessageHandler(
-                    filters.TEXT & ~filters.COMMAND, talk_to_personality_handler
+                    filters.TEXT & ~filters.COMMAND,
+                    talk.handler("talk_to_personality_handler"),
                 ),
                 CallbackQueryHandler(
-                    change_personality_handler, pattern="^change_personality$"
+                    talk.handler("change_personality_handler"),
+                    pattern="^change_personality$",
                 ),
                 CallbackQueryHandler(finish_handler, pattern="^finish_talk_dialog$"),
             ],
@@ -146,73 +273,105 @@ def main():
         fallbacks=[CommandHandler("start", start_handler)],
         allow_reentry=True,
         per_message=False,
+        persistent=True,
     )
 
     # --- ConversationHandler for /quiz ---
     quiz_handler = ConversationHandler(
         name="quiz_session",
         entry_points=[
-            CommandHandler("quiz", start_quiz_handler),
-            MessageHandler(filters.Regex("^❓ Quiz$"), start_quiz_handler),
+            CommandHandler("quiz", quiz.handler("start_quiz_handler")),
+            MessageHandler(
+                filters.Regex("^❓ Quiz$"), quiz.handler("start_quiz_handler")
+            ),
         ],
         states={
             CHOOSE_TOPIC: [
-                CallbackQueryHandler(choose_topic_handler, pattern="^quiz_topic_")
+                CallbackQueryHandler(
+                    quiz.handler("choose_topic_handler"), pattern="^quiz_topic_"
+                )
             ],
             ASK_QUESTION: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, check_answer_handler)
+                MessageHandler(
+                    filters.TEXT & ~filters.COMMAND,
+                    quiz.handler("check_answer_handler"),
+                )
             ],
             QUIZ_NEXT: [
-                CallbackQueryHandler(ask_question_handler, pattern="^quiz_more$"),
-                CallbackQueryHandler(start_quiz_handler, pattern="^quiz_change$"),
-                CallbackQueryHandler(finish_quiz_handler, pattern="^finish_quiz$"),
+                CallbackQueryHandler(
+                    quiz.handler("ask_question_handler"), pattern="^quiz_more$"
+                ),
+                CallbackQueryHandler(
+                    quiz.handler("explain_answer_handler"), pattern="^quiz_explain$"
+                ),
+                CallbackQueryHandler(
+                    quiz.handler("start_quiz_handler"), pattern="^quiz_change$"
+                ),
+                CallbackQueryHandler(
+                    quiz.handler("finish_quiz_handler"), pattern="^finish_quiz$"
+                ),
             ],
         },
         fallbacks=[CommandHandler("start", start_handler)],
         allow_reentry=True,
         per_message=False,
+        persistent=True,
     )
 
     # --- ConversationHandler for /translate ---
     translate_handler = ConversationHandler(
         name="translate_session",
         entry_points=[
-            CommandHandler("translate", start_translate_handler),
-            MessageHandler(filters.Regex("^🌐 Translator$"), start_translate_handler),
+            CommandHandler("translate", translator.handler("start_translate_handler")),
+            MessageHandler(
+                filters.Regex("^🌐 Translator$"),
+                translator.handler("start_translate_handler"),
+            ),
         ],
         states={
             CHOOSE_LANGUAGE: [
-                CallbackQueryHandler(choose_language_handler, pattern="^lang_")
+                CallbackQueryHandler(
+                    translator.handler("choose_language_handler"), pattern="^lang_"
+                )
             ],
             TRANSLATING: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, translate_text_handler),
-                CallbackQueryHandler(change_language_handler, pattern="^change_lang$"),
+                MessageHandler(
+                    filters.TEXT & ~filters.COMMAND,
+                    translator.handler("translate_text_handler"),
+                ),
+                CallbackQueryHandler(
+                    translator.handler("change_language_handler"),
+                    pattern="^change_lang$",
+                ),
                 CallbackQueryHandler(finish_handler, pattern="^finish_translate$"),
             ],
         },
         fallbacks=[CommandHandler("start", start_handler)],
         allow_reentry=True,
         per_message=False,
+        persistent=True,
     )
 
     # --- ConversationHandler for /voice ---
     voice_handler = ConversationHandler(
         name="voice_session",
         entry_points=[
-            CommandHandler("voice", start_voice_handler),
+            CommandHandler("voice", voice.handler("start_voice_handler")),
             MessageHandler(
-                filters.Regex("^🎤 Voice-to-Voice Conversations$"), start_voice_handler
+                filters.Regex("^🎤 Voice-to-Voice Conversations$"),
+                voice.handler("start_voice_handler"),
             ),
         ],
         states={
             PROCESSING_VOICE: [
-                MessageHandler(filters.VOICE, process_voice_handler),
+                MessageHandler(filters.VOICE, voice.handler("process_voice_handler")),
                 CallbackQueryHandler(finish_handler, pattern="^finish_voice$"),
             ],
         },
         fallbacks=[CommandHandler("start", start_handler)],
         allow_reentry=True,
         per_message=False,
+        persistent=True,
     )
 
     application.add_handler(random_handler)
@@ -224,8 +383,155 @@ def main():
 
     application.add_error_handler(error_handler)
 
-    logger.info("Starting the bot...")
-    application.run_polling()
+    instrument_application(application)
+    registry.add_collector(
+        stats_collector(
+            "bot_component_events_total",
+            "Events counted by the bot's caches, pools and rate limiter.",
+            {
+                "rate_limiter": rate_limiter.stats,
+                "outbound": outbound_scheduler.stats,
+                "quiz_pool": quiz.stats("quiz_pool"),
+                "fact_pool": random_fact.stats("fact_pool"),
+                "translation_cache": translation_cache.stats,
+                "talk_cache": talk.stats("talk_cache"),
+                "model_router": model_router.stats,
+                "openai_client": chatgpt_client.stats,
+                "openai_circuit": chatgpt_client.breaker.stats,
+                "tracing": lambda: tracer.stats,
+            },
+        )
+    )
+    return application
+
+
+async def run_webhook(application: Application) -> None:
+    """Receives updates through the built-in webhook endpoint until stopped."""
+    webhook_server = WebhookServer(
+        application, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN
+    )
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for stop_signal in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(stop_signal, stop_event.set)
+
+    async with application:
+        await post_init(application)
+        await application.bot.set_webhook(
+            url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET_TOKEN,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        await application.start()
+        await webhook_server.start()
+        await stop_event.wait()
+
+        logger.info("Stopping the bot...")
+        await webhook_server.stop()
+        await application.stop()
+    await post_shutdown(application)
+
+
+def shard_environment(index: int) -> dict[str, str]:
+    """
+    Environment of worker `index`: its own state file, metrics port and voice
+    temp dir, which it empties when it (re)starts.
+    """
+    path = PERSISTENCE_PATH
+    env = {
+        **os.environ,
+        "SHARD_INDEX": str(index),
+        "PERSISTENCE_PATH": str(
+            path.with_name(f"{path.stem}.shard{index}{path.suffix}")
+        ),
+        "VOICE_TEMP_DIR": str(VOICE_TEMP_DIR / f"shard{index}"),
+    }
+    if METRICS_PORT:
+        env["METRICS_PORT"] = str(METRICS_PORT + index)
+    if index:
+        # Media is uploaded once, by the first worker.
+        env.pop("MEDIA_PREWARM_CHAT_ID", None)
+    return env
+
+
+async def run_sharded() -> None:
+    """Runs the webhook front and supervises SHARD_COUNT worker processes."""
+    workers = [
+        ShardWorker(
+            index,
+            [sys.executable, os.path.abspath(__file__)],
+            shard_environment(index),
+            SHARD_BUFFER_SIZE,
+            SHARD_MAX_RESTART_DELAY,
+        )
+        for index in range(SHARD_COUNT)
+    ]
+    router = ShardRouter(
+        workers, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN
+    )
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for stop_signal in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(stop_signal, stop_event.set)
+
+    for worker in workers:
+        await worker.start()
+    await router.start()
+    bot = Bot(
+        TELEGRAM_BOT_TOKEN,
+        base_url=TELEGRAM_BASE_URL,
+        base_file_url=TELEGRAM_BASE_FILE_URL,
+    )
+    async with bot:
+        await bot.set_webhook(
+            url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET_TOKEN,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    await stop_event.wait()
+
+    logger.info("Stopping the bot...")
+    await router.stop()
+    await asyncio.gather(*(worker.stop() for worker in workers))
+
+
+async def run_shard_worker(application: Application) -> None:
+    """Handles the updates the front process forwards until it closes stdin."""
+    loop = asyncio.get_running_loop()
+    # The front process decides when workers stop.
+    loop.add_signal_handler(signal.SIGINT, lambda: None)
+    reader = await open_stdin()
+
+    async with application:
+        await post_init(application)
+        await application.start()
+        feeding = asyncio.create_task(feed_updates(reader, application))
+        loop.add_signal_handler(signal.SIGTERM, feeding.cancel)
+        await asyncio.gather(feeding, return_exceptions=True)
+
+        logger.info("Stopping shard %s...", SHARD_INDEX)
+        await application.stop()
+    await post_shutdown(application)
+
+
+def main():
+    """Main function to run the bot."""
+    if SHARD_INDEX is not None:
+        asyncio.run(run_shard_worker(build_application()))
+        return
+    if SHARD_COUNT > 1:
+        check_config()
+        logger.info("Starting the bot with %s shards...", SHARD_COUNT)
+        asyncio.run(run_sharded())
+        return
+
+    application = build_application()
+    if BOT_MODE == "webhook":
+        logger.info("Starting the bot in webhook mode on port %s...", WEBHOOK_PORT)
+        asyncio.run(run_webhook(application))
+    else:
+        logger.info("Starting the bot...")
+        application.run_polling()
 
 
 if __name__ == "__main__":
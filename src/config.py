@@ -3,19 +3,392 @@
 Loads environment variables and defines project-wide constants.
 """
 
+import json
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
 ROOT_DIR = Path(__file__).resolve().parent.parent
 
+
+def _env_flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+# Invalid settings found at import, reported by check_config().
+_config_errors: list[str] = []
+
+
+def _json_setting(name: str, text: str | None) -> dict:
+    """Parses the JSON object `text` of setting `name`; {} if unset or invalid."""
+    if not text:
+        return {}
+    try:
+        value = json.loads(text)
+    except ValueError as e:
+        _config_errors.append(f"{name} is not valid JSON: {e}")
+        return {}
+    if not isinstance(value, dict):
+        _config_errors.append(f"{name} must be a JSON object.")
+        return {}
+    return value
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _limits_setting(name: str, defaults: dict) -> dict:
+    """
+    `defaults` overridden by the JSON object in setting `name`, whose values
+    are null (no limit) or {"burst": ..., "per_minute": ...}. Invalid values
+    are reported by check_config() and leave the default in place.
+    """
+    limits = dict(defaults)
+    for key, limit in _json_setting(name, os.getenv(name)).items():
+        if limit is not None and not (
+            isinstance(limit, dict)
+            and _is_number(limit.get("burst"))
+            and _is_number(limit.get("per_minute"))
+        ):
+            _config_errors.append(
+                f'{name}["{key}"] must be null or {{"burst": ..., "per_minute": ...}}.'
+            )
+            continue
+        limits[key] = limit
+    return limits
+
+
 dotenv_path = ROOT_DIR / ".env"
 load_dotenv(dotenv_path=dotenv_path)
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-if not TELEGRAM_BOT_TOKEN:
-    raise ValueError("TELEGRAM_BOT_TOKEN not found. Check your environment variables.")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY not found. Check your environment variables.")
+# Bot API endpoints; point them at a local Bot API server or a test double.
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL", "https://api.telegram.org/bot")
+TELEGRAM_BASE_FILE_URL = os.getenv(
+    "TELEGRAM_BASE_FILE_URL", "https://api.telegram.org/file/bot"
+)
+
+IMAGES_DIR = ROOT_DIR / "images"
+DATA_DIR = Path(os.getenv("DATA_DIR", ROOT_DIR / "data"))
+
+# --- Media cache ---
+MEDIA_CACHE_PATH = DATA_DIR / "media_cache.json"
+# Chat used to upload images ahead of time; uploads are deleted right after.
+MEDIA_PREWARM_CHAT_ID = os.getenv("MEDIA_PREWARM_CHAT_ID")
+
+# --- Streaming replies ---
+# Minimum seconds between edits of a streamed message and minimum new characters
+# per edit; Telegram rejects edits that come in too fast.
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))
+STREAM_EDIT_MIN_CHARS = int(os.getenv("STREAM_EDIT_MIN_CHARS", "40"))
+
+# --- OpenAI connection pool ---
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "50"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20")
+)
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+# HTTP/2 needs the optional `h2` package; without it HTTP/1.1 is used.
+OPENAI_HTTP2 = _env_flag("OPENAI_HTTP2")
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "30"))
+# Number of connections opened at startup so the first requests skip the handshake.
+OPENAI_PREWARM_CONNECTIONS = int(os.getenv("OPENAI_PREWARM_CONNECTIONS", "2"))
+
+# --- OpenAI model routing ---
+# Model and request settings per feature; features without a route, and settings
+# a route leaves out, use "default". Override with the JSON in OPENAI_ROUTES or in
+# the file OPENAI_ROUTES_FILE, e.g. '{"talk": {"model": "gpt-4o-mini"}}'. A route
+# with "fallback_model" and "p95_threshold" (seconds) switches to the fallback
+# while the p95 latency of its model over OPENAI_LATENCY_WINDOW seconds is above
+# the threshold. Latency is the time to the first token for streamed replies.
+# With "hedge", a request still running after the model's p95 latency is sent a
+# second time and the first reply wins (streamed replies are not hedged).
+OPENAI_ROUTES = {
+    "default": {
+        "model": "gpt-3.5-turbo",
+        "max_tokens": 1500,
+        "temperature": 0.7,
+        "timeout": OPENAI_READ_TIMEOUT,
+    },
+    "gpt": {},
+    "talk": {"max_tokens": 800, "temperature": 0.8},
+    "voice": {"max_tokens": 400},
+    "translate": {"temperature": 0.2, "timeout": 20, "hedge": True},
+    "quiz_generate": {"temperature": 0.9, "timeout": 60},
+    "quiz_explain": {"max_tokens": 200, "timeout": 15, "hedge": True},
+    "random": {"max_tokens": 1000, "temperature": 1.0, "timeout": 60},
+    "gpt_summary": {"max_tokens": 300, "temperature": 0.3},
+}
+_route_overrides = {}
+if os.getenv("OPENAI_ROUTES_FILE"):
+    try:
+        _route_overrides.update(
+            _json_setting(
+                "OPENAI_ROUTES_FILE",
+                Path(os.environ["OPENAI_ROUTES_FILE"]).read_text(encoding="utf-8"),
+            )
+        )
+    except OSError as e:
+        _config_errors.append(f"OPENAI_ROUTES_FILE cannot be read: {e}")
+_route_overrides.update(_json_setting("OPENAI_ROUTES", os.getenv("OPENAI_ROUTES")))
+for _feature, _settings in _route_overrides.items():
+    if not isinstance(_settings, dict):
+        _config_errors.append(f"Route '{_feature}' must be a JSON object.")
+        continue
+    OPENAI_ROUTES[_feature] = {**OPENAI_ROUTES.get(_feature, {}), **_settings}
+ROUTE_SETTINGS = {
+    "model",
+    "max_tokens",
+    "temperature",
+    "timeout",
+    "fallback_model",
+    "p95_threshold",
+    "hedge",
+}
+OPENAI_LATENCY_WINDOW = float(os.getenv("OPENAI_LATENCY_WINDOW", "300"))
+# Latency samples a model needs within the window before a fallback can kick in.
+OPENAI_LATENCY_MIN_SAMPLES = int(os.getenv("OPENAI_LATENCY_MIN_SAMPLES", "20"))
+# Most recent latency samples kept per feature, model and streamed or not.
+OPENAI_LATENCY_MAX_SAMPLES = int(os.getenv("OPENAI_LATENCY_MAX_SAMPLES", "1000"))
+
+# --- OpenAI resilience ---
+# Retries of failed OpenAI requests (timeouts, connection errors, 429 and 5xx),
+# with jittered exponential backoff from OPENAI_RETRY_BASE_DELAY up to
+# OPENAI_RETRY_MAX_DELAY seconds. A Retry-After longer than the maximum delay
+# fails the request at once instead.
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+OPENAI_RETRY_BASE_DELAY = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.5"))
+OPENAI_RETRY_MAX_DELAY = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "8"))
+# After this many consecutive failed requests, requests fail immediately for
+# OPENAI_CIRCUIT_RESET_TIMEOUT seconds, then one probe request is let through.
+# 0 disables the circuit breaker.
+OPENAI_CIRCUIT_FAILURE_THRESHOLD = int(
+    os.getenv("OPENAI_CIRCUIT_FAILURE_THRESHOLD", "5")
+)
+OPENAI_CIRCUIT_RESET_TIMEOUT = float(os.getenv("OPENAI_CIRCUIT_RESET_TIMEOUT", "30"))
+
+# --- Quiz question pool ---
+# Ready questions kept per topic, the size at which a background refill starts,
+# and how many questions are requested from ChatGPT per call.
+QUIZ_POOL_SIZE = int(os.getenv("QUIZ_POOL_SIZE", "10"))
+QUIZ_POOL_REFILL_THRESHOLD = int(os.getenv("QUIZ_POOL_REFILL_THRESHOLD", "4"))
+QUIZ_POOL_BATCH_SIZE = int(os.getenv("QUIZ_POOL_BATCH_SIZE", "5"))
+
+# --- Random fact pool ---
+# Facts shared by all users, how many unseen facts a user may have left before
+# a new batch is requested, and how many facts are requested per call.
+FACT_POOL_MAX_SIZE = int(os.getenv("FACT_POOL_MAX_SIZE", "500"))
+FACT_POOL_REFILL_THRESHOLD = int(os.getenv("FACT_POOL_REFILL_THRESHOLD", "5"))
+FACT_POOL_BATCH_SIZE = int(os.getenv("FACT_POOL_BATCH_SIZE", "10"))
+
+# --- /gpt conversation memory ---
+# Token budget for the history sent with each /gpt request, per model, e.g.
+# GPT_HISTORY_TOKEN_BUDGETS='{"gpt-4o-mini": 8000}'. Older turns are summarized.
+GPT_HISTORY_TOKEN_BUDGETS = {
+    "gpt-3.5-turbo": 3000,
+    "gpt-4o-mini": 8000,
+    "gpt-4o": 8000,
+    **_json_setting(
+        "GPT_HISTORY_TOKEN_BUDGETS", os.getenv("GPT_HISTORY_TOKEN_BUDGETS")
+    ),
+}
+GPT_HISTORY_DEFAULT_TOKEN_BUDGET = int(
+    os.getenv("GPT_HISTORY_DEFAULT_TOKEN_BUDGET", "3000")
+)
+
+# --- Persistence ---
+# user_data and conversation states are kept in SQLite; changed users are written
+# in one batch every PERSISTENCE_FLUSH_INTERVAL seconds.
+PERSISTENCE_PATH = Path(os.getenv("PERSISTENCE_PATH", DATA_DIR / "bot_state.sqlite3"))
+PERSISTENCE_FLUSH_INTERVAL = float(os.getenv("PERSISTENCE_FLUSH_INTERVAL", "30"))
+
+# --- Update intake ---
+# "polling" (default, handy for development) or "webhook".
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+# Public HTTPS URL Telegram sends updates to, e.g. https://bot.example.com/telegram.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN")
+
+# --- Update processing ---
+# Chats whose updates are processed in parallel; each chat's updates stay in order.
+UPDATE_MAX_CONCURRENT_CHATS = int(os.getenv("UPDATE_MAX_CONCURRENT_CHATS", "64"))
+
+# --- Rate limiting ---
+# Token buckets per user and feature: `burst` updates at once, then `per_minute`.
+# "global" applies to every update; override with e.g.
+# RATE_LIMITS='{"gpt": {"burst": 10, "per_minute": 20}}'.
+RATE_LIMITS = _limits_setting(
+    "RATE_LIMITS",
+    {
+        "global": {"burst": 30, "per_minute": 60},
+        "gpt": {"burst": 5, "per_minute": 12},
+        "talk": {"burst": 5, "per_minute": 12},
+        "translate": {"burst": 5, "per_minute": 12},
+        "voice": {"burst": 3, "per_minute": 6},
+        "fact": {"burst": 10, "per_minute": 30},
+        "quiz": {"burst": 10, "per_minute": 30},
+    },
+)
+# Reply once with a "slow down" message when a user hits a limit; otherwise
+# over-limit updates are dropped silently.
+RATE_LIMIT_NOTIFY = _env_flag("RATE_LIMIT_NOTIFY", "true")
+
+# --- Outbound Bot API requests ---
+# Token buckets for the bot's requests to chats, below Telegram's flood limits:
+# "global" for all chats together, "private" and "group" per chat. Override with
+# e.g. OUTBOUND_LIMITS='{"global": {"burst": 10, "per_minute": 1500}}'; null
+# disables a limit.
+OUTBOUND_LIMITS = _limits_setting(
+    "OUTBOUND_LIMITS",
+    {
+        "global": {"burst": 5, "per_minute": 1800},
+        "private": {"burst": 3, "per_minute": 60},
+        "group": {"burst": 3, "per_minute": 20},
+    },
+)
+# Retries of a request after Telegram answered with RetryAfter.
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+# Chat actions ("typing…") that cannot be sent within this many seconds are dropped.
+OUTBOUND_CHAT_ACTION_MAX_WAIT = float(os.getenv("OUTBOUND_CHAT_ACTION_MAX_WAIT", "2"))
+
+# --- Translation cache ---
+# Translations are kept for TRANSLATION_CACHE_TTL seconds: the most recently used
+# ones in memory, up to TRANSLATION_CACHE_MAX_ENTRIES in SQLite. Longer texts
+# rarely repeat and are not cached.
+TRANSLATION_CACHE_PATH = Path(
+    os.getenv("TRANSLATION_CACHE_PATH", DATA_DIR / "translation_cache.sqlite3")
+)
+TRANSLATION_CACHE_TTL = float(os.getenv("TRANSLATION_CACHE_TTL", str(7 * 24 * 3600)))
+TRANSLATION_CACHE_MEMORY_SIZE = int(os.getenv("TRANSLATION_CACHE_MEMORY_SIZE", "2000"))
+TRANSLATION_CACHE_MAX_ENTRIES = int(
+    os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", "100000")
+)
+TRANSLATION_CACHE_MAX_TEXT_LENGTH = int(
+    os.getenv("TRANSLATION_CACHE_MAX_TEXT_LENGTH", "500")
+)
+# Texts up to this length are translated into several languages at once with one
+# request returning JSON; longer ones with one concurrent request per language.
+TRANSLATE_COMBINED_MAX_CHARS = int(os.getenv("TRANSLATE_COMBINED_MAX_CHARS", "300"))
+
+# --- /talk answer cache ---
+# Answers kept per personality (0 disables the cache); a question gets a cached
+# answer if it has the same words in the same order as the cached question, not
+# counting request phrasing, articles and the like. Longer questions are always
+# sent to ChatGPT.
+TALK_CACHE_SIZE = int(os.getenv("TALK_CACHE_SIZE", "500"))
+TALK_CACHE_MAX_QUESTION_LENGTH = int(os.getenv("TALK_CACHE_MAX_QUESTION_LENGTH", "200"))
+
+# --- Administration ---
+# Comma-separated Telegram user ids allowed to use admin commands.
+ADMIN_USER_IDS = {
+    int(user_id)
+    for user_id in os.getenv("ADMIN_USER_IDS", "").split(",")
+    if user_id.strip()
+}
+
+# --- Voice messages ---
+# Voice notes up to VOICE_SPILL_THRESHOLD bytes are processed in memory; larger
+# ones are written to VOICE_TEMP_DIR (tmpfs when available), which is emptied at
+# startup.
+VOICE_SPILL_THRESHOLD = int(os.getenv("VOICE_SPILL_THRESHOLD", str(5 * 1024 * 1024)))
+_DEFAULT_TEMP_ROOT = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+VOICE_TEMP_DIR = Path(
+    os.getenv("VOICE_TEMP_DIR", Path(_DEFAULT_TEMP_ROOT) / "telegram-bot-voice")
+)
+# Voice replies are spoken in sentence chunks of at least VOICE_CHUNK_MIN_CHARS
+# (the first chunk is a single sentence), with up to VOICE_TTS_CONCURRENCY chunks
+# synthesized at once. tts-1 answers faster than tts-1-hd.
+VOICE_TTS_MODEL = os.getenv("VOICE_TTS_MODEL", "tts-1-hd")
+VOICE_TTS_VOICE = os.getenv("VOICE_TTS_VOICE", "nova")
+VOICE_TTS_CONCURRENCY = int(os.getenv("VOICE_TTS_CONCURRENCY", "3"))
+VOICE_CHUNK_MIN_CHARS = int(os.getenv("VOICE_CHUNK_MIN_CHARS", "150"))
+VOICE_CHUNK_MAX_CHARS = int(os.getenv("VOICE_CHUNK_MAX_CHARS", "1000"))
+
+# --- Metrics ---
+# Prometheus-format metrics are served at http://METRICS_LISTEN:METRICS_PORT/metrics
+# when METRICS_PORT is set.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+
+# --- Sharding ---
+# In webhook mode, SHARD_COUNT > 1 runs that many worker processes behind the
+# webhook endpoint. Updates are routed by chat id, so each worker owns the state
+# of its chats, kept in its own copy of PERSISTENCE_PATH (".shardN" is added to
+# the name); changing SHARD_COUNT moves chats away from their state. SHARD_INDEX
+# is set by the front process for its workers.
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+SHARD_INDEX = int(os.environ["SHARD_INDEX"]) if os.getenv("SHARD_INDEX") else None
+# Updates kept per worker while it restarts, and the longest restart backoff.
+SHARD_BUFFER_SIZE = int(os.getenv("SHARD_BUFFER_SIZE", "10000"))
+SHARD_MAX_RESTART_DELAY = float(os.getenv("SHARD_MAX_RESTART_DELAY", "30"))
+
+# --- Logging ---
+# LOG_FORMAT is "json" (one object per line) or "text". Records are written by a
+# background thread from a queue of LOG_QUEUE_SIZE; when it is full, records
+# are dropped rather than blocking the bot.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Only every n-th occurrence of a noisy per-update line is logged.
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "10"))
+# Message bodies (user text, prompts, API payloads) are logged as a length only,
+# or, with LOG_REDACT_BODIES=false, cut to LOG_MAX_BODY_LENGTH characters.
+LOG_REDACT_BODIES = _env_flag("LOG_REDACT_BODIES", "true")
+LOG_MAX_BODY_LENGTH = int(os.getenv("LOG_MAX_BODY_LENGTH", "200"))
+LOG_MAX_MESSAGE_LENGTH = int(os.getenv("LOG_MAX_MESSAGE_LENGTH", "2000"))
+
+# --- Tracing ---
+# TRACE_SAMPLE_RATE (0..1) of the updates are traced: a span per update with
+# child spans for its handler, OpenAI and Bot API calls. Spans are appended as
+# JSON lines to TRACE_FILE and/or posted as OTLP/HTTP JSON to TRACE_OTLP_ENDPOINT
+# (e.g. http://localhost:4318/v1/traces); without either, tracing is off.
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+TRACE_FILE = Path(os.environ["TRACE_FILE"]) if os.getenv("TRACE_FILE") else None
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT")
+# Finished spans waiting for export (more are dropped), and the export interval.
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+TRACE_EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", "2"))
+
+# --- Startup ---
+# Import every feature in the background right after startup; when disabled, a
+# feature is imported by the first update that needs it.
+FEATURE_PRELOAD = _env_flag("FEATURE_PRELOAD", "true")
+
+
+def check_config() -> None:
+    """
+    Raises ValueError if required settings are missing or invalid. Called by
+    the entry points rather than at import, so importing modules stays cheap.
+    """
+    if _config_errors:
+        raise ValueError(" ".join(_config_errors))
+    if not TELEGRAM_BOT_TOKEN:
+        raise ValueError(
+            "TELEGRAM_BOT_TOKEN not found. Check your environment variables."
+        )
+    if not OPENAI_API_KEY:
+        raise ValueError("OPENAI_API_KEY not found. Check your environment variables.")
+    if BOT_MODE not in ("polling", "webhook"):
+        raise ValueError(f"Unknown BOT_MODE '{BOT_MODE}'. Use 'polling' or 'webhook'.")
+    if BOT_MODE == "webhook" and not (WEBHOOK_URL and WEBHOOK_SECRET_TOKEN):
+        raise ValueError("Webhook mode needs WEBHOOK_URL and WEBHOOK_SECRET_TOKEN.")
+    if LOG_FORMAT not in ("json", "text"):
+        raise ValueError(f"Unknown LOG_FORMAT '{LOG_FORMAT}'. Use 'json' or 'text'.")
+    if not 0 <= TRACE_SAMPLE_RATE <= 1:
+        raise ValueError("TRACE_SAMPLE_RATE must be between 0 and 1.")
+    if SHARD_COUNT > 1 and BOT_MODE != "webhook":
+        raise ValueError("SHARD_COUNT > 1 needs BOT_MODE=webhook.")
+    for feature, settings in OPENAI_ROUTES.items():
+        unknown = set(settings) - ROUTE_SETTINGS
+        if unknown:
+            raise ValueError(
+                f"Unknown settings {sorted(unknown)} in route '{feature}'."
+            )
@@ -0,0 +1,39 @@
+"""Commands for bot administrators listed in ADMIN_USER_IDS."""
+
+import logging
+from collections import Counter
+
+from telegram import Update
+from telegram.ext import CallbackContext
+
+from config import ADMIN_USER_IDS
+from utils.translation_cache import translation_cache
+
+logger = logging.getLogger(__name__)
+
+# Translation cache stats at the last /purge_translations.
+_stats_at_last_purge = Counter()
+
+
+async def purge_translation_cache_handler(
+    update: Update, _context: CallbackContext
+) -> None:
+    """Handles /purge_translations: clears the translation cache."""
+    user = update.effective_user
+    if not user or user.id not in ADMIN_USER_IDS:
+        logger.warning(
+            "User %s tried to purge the translation cache.", user.id if user else None
+        )
+        return
+
+    # The stats are exported as counters, so they are never reset; the reply
+    # shows what they counted since the last purge.
+    stats = translation_cache.stats.copy()
+    removed = await translation_cache.purge()
+    since_purge = dict(stats - _stats_at_last_purge)
+    _stats_at_last_purge.clear()
+    _stats_at_last_purge.update(stats)
+    await update.effective_message.reply_text(
+        f"Translation cache purged: {removed} entries removed.\n"
+        f"Stats since the last purge: {since_purge}"
+    )
@@ -2,18 +2,22 @@
 
 import logging
 
-import aiofiles
 from telegram import Update
 from telegram.ext import CallbackContext, ConversationHandler
-from utils.chatgpt_client import ChatGPTClient
+from utils.chatgpt_client import chatgpt_client
+from utils.resilience import ChatGPTError, ChatGPTBadResponse
+from utils.conversation_memory import ConversationMemory
+from utils.media_cache import media_cache
+from utils.progressive_message import ProgressiveMessage
+from utils.logger import SAMPLED
 from keyboards.inline_keyboards import get_finish_keyboard
 
-from config import ROOT_DIR
+from config import IMAGES_DIR
 
 logger = logging.getLogger(__name__)
-chatgpt_client = ChatGPTClient()
 GPT_INTERFACE = 1
-IMAGE_PATH = ROOT_DIR / "images" / "ChatGPT.jpg"
+IMAGE_PATH = IMAGES_DIR / "ChatGPT.jpg"
+gpt_memory = ConversationMemory(history_key="gpt_history", summary_key="gpt_summary")
 
 
 async def start_gpt_handler(update: Update, context: CallbackContext) -> int:
@@ -22,71 +26,79 @@ async def start_gpt_handler(update: Update, context: CallbackContext) -> int:
     context.user_data["gpt_system_prompt"] = (
         "You are an AI assistant. Try to answer completely and friendly."
     )
-    context.user_data["gpt_history"] = []
+    gpt_memory.reset(context.user_data)
 
     logger.info(
-        f"User {chat_id} started a /gpt session. System prompt set. History cleared."
+        "User %s started a /gpt session. System prompt set. History cleared.",
+        chat_id,
+        extra=SAMPLED,
     )
 
     try:
-        async with aiofiles.open(IMAGE_PATH, "rb") as f:
-            photo_bytes = await f.read()
-            await context.bot.send_photo(chat_id=chat_id, photo=photo_bytes)
-            keyboard = get_finish_keyboard(finish_callback="finish_gpt_dialog")
-        await message.reply_text(
-            "I am ready to answer your questions. What would you like to know?",
+        keyboard = get_finish_keyboard(finish_callback="finish_gpt_dialog")
+        await media_cache.send_photo(
+            context.bot,
+            chat_id,
+            IMAGE_PATH,
+            caption="I am ready to answer your questions. What would you like to know?",
             reply_markup=keyboard,
         )
-        logger.info(
-            f"CHAT_DATA at end of start_gpt_handler "
-            f"(returning GPT_INTERFACE): {context.chat_data}"
-        )
         return GPT_INTERFACE
     except FileNotFoundError as e:
-        logger.error(f"Error sending image (file not found): {e}")
+        logger.error("Error sending image (file not found): %s", e)
         await message.reply_text(
             "Failed to load the picture, but I am ready to answer "
             "your questions! To exit, use /start."
         )
         return GPT_INTERFACE
     except Exception as e:
-        logger.error(f"General error in start_gpt_handler: {e}")
+        logger.error("General error in start_gpt_handler: %s", e)
         await message.reply_text("An error occurred while starting GPT. Try /start.")
         return ConversationHandler.END
 
 
 async def gpt_conversation_handler(update: Update, context: CallbackContext) -> int:
     user_message = update.message.text
-    chat_id = update.message.chat.id
+    placeholder = None
     try:
-        await context.bot.send_chat_action(chat_id=chat_id, action="typing")
-        history = context.user_data.get("gpt_history", [])
+        route = chatgpt_client.route_for("gpt", stream=True)
+        history = gpt_memory.bounded_history(context.user_data, route.model)
         system_prompt_for_session = context.user_data.get("gpt_system_prompt")
 
-        response = await chatgpt_client.ask(
+        placeholder = await update.message.reply_text("…")
+        streamed_message = ProgressiveMessage(placeholder)
+
+        chunks = []
+        async for delta in chatgpt_client.ask_stream(
             current_user_prompt=user_message,
             history=history,
             system_prompt=system_prompt_for_session,
-        )
+            feature="gpt",
+            route=route,
+        ):
+            chunks.append(delta)
+            await streamed_message.update("".join(chunks))
 
-        history.append({"role": "user", "content": user_message})
-        history.append({"role": "assistant", "content": response})
-        context.user_data["gpt_history"] = history
+        response = "".join(chunks).strip()
+        if not response:
+            raise ChatGPTBadResponse("ChatGPT streamed an empty response.")
 
-        max_history_turns = 5
-        if len(context.user_data["gpt_history"]) > max_history_turns * 2:
-            context.user_data["gpt_history"] = context.user_data["gpt_history"][
-                -(max_history_turns * 2) :
-            ]
+        gpt_memory.add_turn(context.user_data, user_message, response)
 
         keyboard = get_finish_keyboard(finish_callback="finish_gpt_dialog")
-        await update.message.reply_text(response, reply_markup=keyboard)
+        await streamed_message.finish(response, reply_markup=keyboard)
+        context.application.create_task(
+            gpt_memory.compact(context.user_data, route.model), update=update
+        )
         return GPT_INTERFACE
     except Exception as e:
-        logger.error(f"Error in gpt_conversation_handler: {e}")
+        logger.error("Error in gpt_conversation_handler: %s", e)
         keyboard = get_finish_keyboard(finish_callback="finish_gpt_dialog")
-        await update.message.reply_text(
-            "Failed to get a response. Try /start or press 'Finish'.",
-            reply_markup=keyboard,
-        )
+        error_text = "Failed to get a response. Try /start or press 'Finish'."
+        if isinstance(e, ChatGPTError):
+            error_text = f"{e.user_message} You can also press 'Finish'."
+        if placeholder:
+            await placeholder.edit_text(error_text, reply_markup=keyboard)
+        else:
+            await update.message.reply_text(error_text, reply_markup=keyboard)
         return GPT_INTERFACE
@@ -2,6 +2,7 @@
 
 import logging
 from telegram import Update
+from telegram.error import RetryAfter
 from telegram.ext import CallbackContext
 
 logger = logging.getLogger(__name__)
@@ -9,6 +10,11 @@ logger = logging.getLogger(__name__)
 
 async def error_handler(update: Update, context: CallbackContext) -> None:
     """Logs errors and sends a message to the user."""
+    if isinstance(context.error, RetryAfter):
+        # Flood control outlasted the outbound scheduler's retries; another
+        # message to the chat would only be rejected as well.
+        logger.warning("Flood limit still exceeded after retries: %s", context.error)
+        return
     logger.error(msg="An error occurred:", exc_info=context.error)
     if update and update.effective_message:
         try:
@@ -18,7 +24,7 @@ async def error_handler(update: Update, context: CallbackContext) -> None:
             )
         except Exception as e:
             logger.error(
-                f"Failed to send error message to user (effective_message): {e}"
+                "Failed to send error message to user (effective_message): %s", e
             )
     elif update and update.callback_query:
         try:
@@ -28,4 +34,4 @@ async def error_handler(update: Update, context: CallbackContext) -> None:
                 "Please try again a little later or use /start.",
             )
         except Exception as e:
-            logger.error(f"Failed to send error message to user (callback_query): {e}")
+            logger.error("Failed to send error message to user (callback_query): %s", e)
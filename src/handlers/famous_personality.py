@@ -2,22 +2,24 @@
 
 import logging
 
-import aiofiles
 from telegram import Update
 from telegram.ext import CallbackContext, ConversationHandler
-from utils.chatgpt_client import ChatGPTClient
+from utils.chatgpt_client import chatgpt_client
+from utils.resilience import ChatGPTError
+from utils.media_cache import media_cache, edit_query_message
+from utils.question_cache import talk_cache
+from utils.logger import body
 from keyboards.inline_keyboards import (
     get_personality_keyboard,
     get_finish_keyboard,
     get_talk_action_keyboard,
 )
 
-from config import ROOT_DIR
+from config import IMAGES_DIR
 
 logger = logging.getLogger(__name__)
-chatgpt_client = ChatGPTClient()
 CHOOSE_PERSONALITY, TALK_TO_PERSONALITY = 2, 3
-IMAGE_PATH = ROOT_DIR / "images" / "Famous_people.jpg"
+IMAGE_PATH = IMAGES_DIR / "Famous_people.jpg"
 PERSONALITIES = {
     "Albert Einstein": (
         "You are Albert Einstein. Respond as a thoughtful, brilliant physicist. "
@@ -61,22 +63,16 @@ async def start_talk_handler(update: Update, context: CallbackContext) -> int:
     )
 
     try:
-        async with aiofiles.open(IMAGE_PATH, "rb") as f:
-            photo_bytes = await f.read()
-            await context.bot.send_photo(chat_id=chat_id, photo=photo_bytes)
-        if message_to_reply:
-            await message_to_reply.reply_text(
-                "Choose who you want to talk to:", reply_markup=personality_keyboard
-            )
-        else:
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="Choose who you want to talk to:",
-                reply_markup=personality_keyboard,
-            )
+        await media_cache.send_photo(
+            context.bot,
+            chat_id,
+            IMAGE_PATH,
+            caption="Choose who you want to talk to:",
+            reply_markup=personality_keyboard,
+        )
         return CHOOSE_PERSONALITY
     except FileNotFoundError as e:
-        logger.error(f"Error sending image (file not found): {e}")
+        logger.error("Error sending image (file not found): %s", e)
         if message_to_reply:
             await message_to_reply.reply_text(
                 "Couldn't load the image, but no worries! Who do you want to talk to?",
@@ -92,7 +88,7 @@ async def start_talk_handler(update: Update, context: CallbackContext) -> int:
 
         return CHOOSE_PERSONALITY
     except Exception as e:
-        logger.error(f"Unexpected error in start_talk_handler: {e}")
+        logger.error("Unexpected error in start_talk_handler: %s", e)
         if message_to_reply:
             await message_to_reply.reply_text(
                 "Oops, something went wrong! Please try /start."
@@ -111,10 +107,11 @@ async def choose_personality_handler(update: Update, context: CallbackContext) -
 
     if chosen_key not in PERSONALITIES:
         logger.error(
-            f"Invalid personality key received from callback_data: {chosen_key}"
+            "Invalid personality key received from callback_data: %s", chosen_key
         )
-        await query.edit_message_text(
-            "An error occurred while selecting the personality. Please try again."
+        await edit_query_message(
+            query,
+            "An error occurred while selecting the personality. Please try again.",
         )
         return CHOOSE_PERSONALITY
 
@@ -122,7 +119,8 @@ async def choose_personality_handler(update: Update, context: CallbackContext) -
     context.user_data["personality_name"] = chosen_key
 
     finish_keyboard = get_finish_keyboard(finish_callback="finish_talk_dialog")
-    await query.edit_message_text(
+    await edit_query_message(
+        query,
         text=f"{chosen_key} - great choice! Ask your question.",
         reply_markup=finish_keyboard,
     )
@@ -145,15 +143,24 @@ async def talk_to_personality_handler(update: Update, context: CallbackContext)
 
     talk_action_keyboard = get_talk_action_keyboard()
     try:
-        await context.bot.send_chat_action(chat_id=chat_id, action="typing")
-        logger.info(f"Extracted personality_prompt: '{personality_prompt}'")
-        response = await chatgpt_client.ask(
-            user_message, system_prompt=personality_prompt
-        )
+        response = talk_cache.get(personality_prompt, user_message)
+        if response is None:
+            await context.bot.send_chat_action(chat_id=chat_id, action="typing")
+            logger.debug("Extracted personality_prompt: %s", body(personality_prompt))
+            response = await chatgpt_client.ask(
+                user_message, system_prompt=personality_prompt, feature="talk"
+            )
+            talk_cache.put(personality_prompt, user_message, response)
         await update.message.reply_text(response, reply_markup=talk_action_keyboard)
         return TALK_TO_PERSONALITY
+    except ChatGPTError as e:
+        logger.error("ChatGPT request failed in talk_to_personality_handler: %s", e)
+        await update.message.reply_text(
+            e.user_message, reply_markup=talk_action_keyboard
+        )
+        return TALK_TO_PERSONALITY
     except Exception as e:
-        logger.error(f"Error in talk_to_personality_handler: {e}")
+        logger.error("Error in talk_to_personality_handler: %s", e)
         await update.message.reply_text(
             "Failed to get a response.", reply_markup=talk_action_keyboard
         )
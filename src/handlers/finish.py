@@ -4,6 +4,7 @@ import logging
 from telegram import Update
 from telegram.ext import CallbackContext, ConversationHandler
 from handlers.start import start_handler
+from utils.logger import SAMPLED
 
 logger = logging.getLogger(__name__)
 
@@ -22,16 +23,21 @@ async def finish_handler(update: Update, context: CallbackContext) -> int:
                 if query and query.message:
                     msg_id = query.message.message_id
                 logger.error(
-                    f"Failed to remove the inline keyboard in finish_handler "
-                    f"(message ID: {msg_id}): {e}"
+                    "Failed to remove the inline keyboard in finish_handler "
+                    "(message ID: %s): %s",
+                    msg_id,
+                    e,
                 )
 
     keys_to_clear = [
         "personality_prompt",
         "personality_name",
         "gpt_history",
+        "gpt_summary",
         "gpt_system_prompt",
         "translate_lang",
+        "translate_langs",
+        "translate_selection",
     ]
 
     for key in keys_to_clear:
@@ -39,8 +45,9 @@ async def finish_handler(update: Update, context: CallbackContext) -> int:
 
     if query or update.message:
         logger.info(
-            f"User data for the conversation (keys: {keys_to_clear}) "
-            f"cleared in finish_handler."
+            "User data for the conversation (keys: %s) cleared in finish_handler.",
+            keys_to_clear,
+            extra=SAMPLED,
         )
 
     await start_handler(update, context)
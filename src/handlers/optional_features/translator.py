@@ -1,19 +1,27 @@
 """Handlers for the text translator feature (/translate command)."""
 
+import asyncio
+import json
 import logging
+from collections.abc import AsyncIterator
 from telegram import Update
 from telegram.ext import CallbackContext, ConversationHandler
-from utils.chatgpt_client import ChatGPTClient
+from utils.chatgpt_client import chatgpt_client
+from utils.translation_cache import translation_cache
+from utils.progressive_message import ProgressiveMessage
 from keyboards.inline_keyboards import (
     get_language_keyboard,
+    get_language_multiselect_keyboard,
     get_translate_keyboard,
     TARGET_LANGUAGES,
 )
 
+from config import TRANSLATE_COMBINED_MAX_CHARS
 
 logger = logging.getLogger(__name__)
-chatgpt_client = ChatGPTClient()
 CHOOSE_LANGUAGE, TRANSLATING = 7, 8
+PENDING = "…"
+FAILED = "Failed to translate."
 
 
 async def start_translate_handler(update: Update, _context: CallbackContext) -> int:
@@ -30,58 +38,194 @@ async def start_translate_handler(update: Update, _context: CallbackContext) ->
 
 
 async def choose_language_handler(update: Update, context: CallbackContext) -> int:
-    """Handles language selection."""
+    """
+    Handles language selection: a single language, all languages, or several
+    languages toggled one by one and confirmed with 'Done'.
+    """
     query = update.callback_query
     await query.answer()
-    lang_name = query.data.split("_")[1]
-    if lang_name not in TARGET_LANGUAGES:
-        logger.warning(f"Unknown language selected: {lang_name}")
+    choice = query.data.removeprefix("lang_")
+
+    if choice == "multi":
+        context.user_data["translate_selection"] = []
+        await query.edit_message_text(
+            "Select the languages to translate to:",
+            reply_markup=get_language_multiselect_keyboard([]),
+        )
+        return CHOOSE_LANGUAGE
+
+    if choice.startswith("toggle_"):
+        code = choice.removeprefix("toggle_")
+        selection = context.user_data.setdefault("translate_selection", [])
+        if code in selection:
+            selection.remove(code)
+        elif code in TARGET_LANGUAGES:
+            selection.append(code)
+        await query.edit_message_reply_markup(
+            reply_markup=get_language_multiselect_keyboard(selection)
+        )
+        return CHOOSE_LANGUAGE
+
+    if choice == "done":
+        selection = context.user_data.pop("translate_selection", [])
+        languages = [code for code in TARGET_LANGUAGES if code in selection]
+        if not languages:
+            await query.edit_message_text(
+                "Select at least one language.",
+                reply_markup=get_language_multiselect_keyboard([]),
+            )
+            return CHOOSE_LANGUAGE
+    elif choice == "all":
+        languages = list(TARGET_LANGUAGES)
+    elif choice in TARGET_LANGUAGES:
+        languages = [choice]
+    else:
+        logger.warning("Unknown language selected: %s", choice)
         await query.edit_message_text(
             "An error occurred, please select a language from the list."
         )
         return CHOOSE_LANGUAGE
 
-    context.user_data["translate_lang"] = lang_name
-    lang_display_name = TARGET_LANGUAGES[lang_name]
+    context.user_data["translate_langs"] = languages
+    lang_display_names = ", ".join(TARGET_LANGUAGES[code] for code in languages)
     await query.edit_message_text(
-        f"You have selected {lang_display_name}. Send the text."
+        f"You have selected {lang_display_names}. Send the text."
     )
     return TRANSLATING
 
 
+def _translation_prompt(text: str, dest_lang: str) -> str:
+    return (
+        f"Translate the following text into {dest_lang}. "
+        f"Return only the translation itself, "
+        f"without any extra phrases or comments:\n\n{text}"
+    )
+
+
+def _combined_prompt(text: str, dest_langs: list[str]) -> str:
+    return (
+        f"Translate the following text into each of these languages: "
+        f"{', '.join(dest_langs)}. Reply with a JSON object that maps each "
+        f"language name to the translation itself, without any extra phrases "
+        f"or comments:\n\n{text}"
+    )
+
+
+async def _translate(text: str, dest_lang: str) -> tuple[str, str | None]:
+    """Translates into one language; returns it with the translation or None."""
+    try:
+        translation = await chatgpt_client.ask(
+            _translation_prompt(text, dest_lang), feature="translate"
+        )
+    except Exception as e:
+        logger.error("Translation into %s failed: %s", dest_lang, e)
+        return dest_lang, None
+    translation_cache.put(text, dest_lang, translation)
+    return dest_lang, translation
+
+
+async def _translate_combined(text: str, dest_langs: list[str]) -> dict[str, str]:
+    """Translates into several languages with one JSON request; may miss some."""
+    try:
+        reply = await chatgpt_client.ask(
+            _combined_prompt(text, dest_langs),
+            response_format={"type": "json_object"},
+            feature="translate",
+        )
+        data = json.loads(reply)
+    except Exception as e:
+        logger.error("Combined translation into %s failed: %s", dest_langs, e)
+        return {}
+
+    translations = {}
+    for dest_lang in dest_langs:
+        translation = data.get(dest_lang) if isinstance(data, dict) else None
+        if isinstance(translation, str) and translation.strip():
+            translations[dest_lang] = translation.strip()
+            translation_cache.put(text, dest_lang, translations[dest_lang])
+    return translations
+
+
+async def translate_many(
+    text: str, dest_langs: list[str]
+) -> AsyncIterator[tuple[str, str | None]]:
+    """
+    Yields (language, translation or None) as the translations arrive. Short
+    texts are translated with one combined request; longer ones, and languages
+    the combined reply missed, with concurrent per-language requests.
+    """
+    remaining = list(dest_langs)
+    if len(remaining) > 1 and len(text) <= TRANSLATE_COMBINED_MAX_CHARS:
+        translations = await _translate_combined(text, remaining)
+        for dest_lang, translation in translations.items():
+            yield dest_lang, translation
+        remaining = [lang for lang in remaining if lang not in translations]
+
+    for next_result in asyncio.as_completed(
+        [_translate(text, dest_lang) for dest_lang in remaining]
+    ):
+        yield await next_result
+
+
+def _render(dest_langs: list[str], results: dict[str, str | None]) -> str:
+    sections = []
+    for code in dest_langs:
+        translation = results.get(code, PENDING) or FAILED
+        sections.append(f"{TARGET_LANGUAGES[code]}:\n{translation}")
+    return "Translations:\n\n" + "\n\n".join(sections)
+
+
 async def translate_text_handler(update: Update, context: CallbackContext) -> int:
-    """Receives text from the user and translates it."""
+    """
+    Receives text from the user and translates it into the selected languages.
+    Several translations share one reply, which is filled in as they arrive.
+    """
     user_message = update.message.text
     chat_id = update.message.chat.id
-    dest_lang = context.user_data.get("translate_lang")
+    dest_langs = context.user_data.get("translate_langs")
+    if not dest_langs and context.user_data.get("translate_lang"):
+        # Sessions started before several languages could be selected.
+        dest_langs = [context.user_data["translate_lang"]]
 
-    if not dest_lang:
+    if not dest_langs:
         logger.warning(
             "translate_text_handler called without a selected language in user_data."
         )
         await update.message.reply_text("First, select a language using /translate.")
         return ConversationHandler.END
 
-    prompt = (
-        f"Translate the following text into {dest_lang}. "
-        f"Return only the translation itself, "
-        f"without any extra phrases or comments:\n\n{user_message}"
-    )
     translate_keyboard = get_translate_keyboard()
-    try:
-        await context.bot.send_chat_action(chat_id=chat_id, action="typing")
-        translated_text = await chatgpt_client.ask(prompt)
-        await update.message.reply_text(
-            f"Translation:\n\n{translated_text}", reply_markup=translate_keyboard
-        )
+    cached = await asyncio.gather(
+        *(translation_cache.get(user_message, lang) for lang in dest_langs)
+    )
+    results = {lang: text for lang, text in zip(dest_langs, cached) if text is not None}
+    missing = [lang for lang in dest_langs if lang not in results]
+
+    if len(dest_langs) == 1:
+        if missing:
+            await context.bot.send_chat_action(chat_id=chat_id, action="typing")
+            _, results[dest_langs[0]] = await _translate(user_message, dest_langs[0])
+        translated_text = results[dest_langs[0]]
+        reply = f"Translation:\n\n{translated_text}" if translated_text else FAILED
+        await update.message.reply_text(reply, reply_markup=translate_keyboard)
         return TRANSLATING
-    except Exception as e:
-        logger.error(f"Translation error: {e}")
+
+    if not missing:
         await update.message.reply_text(
-            "Failed to translate.", reply_markup=translate_keyboard()
+            _render(dest_langs, results), reply_markup=translate_keyboard
         )
         return TRANSLATING
 
+    sent_message = await update.message.reply_text(_render(dest_langs, results))
+    progressive = ProgressiveMessage(sent_message)
+    async for lang, translated_text in translate_many(user_message, missing):
+        results[lang] = translated_text
+        await progressive.update(_render(dest_langs, results))
+    await progressive.finish(
+        _render(dest_langs, results), reply_markup=translate_keyboard
+    )
+    return TRANSLATING
+
 
 async def change_language_handler(update: Update, context: CallbackContext) -> int:
     """Handles the 'Change language' button."""
@@ -1,30 +1,21 @@
 """Handlers for the voice-to-voice conversation feature (/voice command)."""
 
 import logging
-import aiofiles.os as aio_os
 from telegram import Update
 from telegram.ext import CallbackContext, ConversationHandler
 
 from keyboards.inline_keyboards import get_finish_keyboard
-from utils.chatgpt_client import ChatGPTClient
+from utils.chatgpt_client import chatgpt_client
+from utils.voice_files import open_voice_file
+from utils.voice_pipeline import VoicePipeline
 
-logger = logging.getLogger(__name__)
+from config import VOICE_TTS_MODEL, VOICE_TTS_VOICE
 
-chatgpt_client = ChatGPTClient()
+logger = logging.getLogger(__name__)
 
 PROCESSING_VOICE = 9
 
 
-async def remove_file_async(file_path: str) -> None:
-    """Asynchronously and safely deletes a file from the disk."""
-    try:
-        if await aio_os.path.exists(file_path):
-            await aio_os.remove(file_path)
-            logger.info(f"Temporary file {file_path} successfully deleted.")
-    except Exception as e:
-        logger.error(f"Failed to delete temporary file {file_path}: {e}")
-
-
 async def start_voice_handler(update: Update, _context: CallbackContext) -> int:
     """Starts the voice interaction."""
     await update.message.reply_text("Send me a voice message. To exit, press /start.")
@@ -34,13 +25,14 @@ async def start_voice_handler(update: Update, _context: CallbackContext) -> int:
 async def process_voice_handler(update: Update, context: CallbackContext) -> int:
     """
     Full cycle of voice message processing: Speech-to-Text -> Chat -> Text-to-Speech.
+    The reply is streamed and spoken sentence by sentence, in several voice messages.
     """
     message = update.message
     chat_id = update.effective_chat.id if update.effective_chat else None
 
     if not message or not message.voice or not chat_id:
         user_id = update.effective_user.id if update.effective_user else "unknown"
-        logger.warning(f"User {user_id} sent a non-voice message in /voice mode.")
+        logger.warning("User %s sent a non-voice message in /voice mode.", user_id)
         await context.bot.send_message(
             chat_id=chat_id,
             text="I am expecting a voice message 🎤. "
@@ -49,15 +41,13 @@ async def process_voice_handler(update: Update, context: CallbackContext) -> int
         return PROCESSING_VOICE
 
     voice = message.voice
-    file_path = f"voice_temp_{voice.file_id}.ogg"
 
     try:
         await context.bot.send_chat_action(chat_id=chat_id, action="record_voice")
         voice_file = await context.bot.get_file(voice.file_id)
-        await voice_file.download_to_drive(file_path)
-
-        await context.bot.send_chat_action(chat_id=chat_id, action="typing")
-        transcription = await chatgpt_client.transcribe(file_path)
+        async with open_voice_file(voice_file) as audio:
+            await context.bot.send_chat_action(chat_id=chat_id, action="typing")
+            transcription = await chatgpt_client.transcribe(audio)
 
         if not transcription:
             await message.reply_text(
@@ -68,33 +58,46 @@ async def process_voice_handler(update: Update, context: CallbackContext) -> int
 
         await message.reply_text(f"You said: *{transcription}*", parse_mode="Markdown")
 
-        await context.bot.send_chat_action(chat_id=chat_id, action="typing")
-        chatgpt_response = await chatgpt_client.ask(transcription)
-
         await context.bot.send_chat_action(chat_id=chat_id, action="record_voice")
-        audio_response_bytes = await chatgpt_client.text_to_speech(chatgpt_response)
-        keyboard = get_finish_keyboard(finish_callback="finish_voice")
-
-        if audio_response_bytes:
-            await context.bot.send_voice(
-                chat_id=chat_id, voice=audio_response_bytes, reply_markup=keyboard
+        sent_messages = []
+
+        async def synthesize(text: str) -> bytes | None:
+            return await chatgpt_client.text_to_speech(
+                text,
+                model=VOICE_TTS_MODEL,
+                voice=VOICE_TTS_VOICE,
+                response_format="opus",
             )
+
+        async def send(text: str, audio: bytes | None) -> None:
+            if audio:
+                sent = await context.bot.send_voice(chat_id=chat_id, voice=audio)
+            else:
+                logger.warning("Failed to convert text to speech, sending as text.")
+                sent = await context.bot.send_message(
+                    chat_id=chat_id,
+                    text=f"ChatGPT response (audio was not generated):\n{text}",
+                )
+            sent_messages.append(sent)
+
+        pipeline = VoicePipeline(synthesize, send)
+        await pipeline.run(chatgpt_client.ask_stream(transcription, feature="voice"))
+
+        keyboard = get_finish_keyboard(finish_callback="finish_voice")
+        if sent_messages:
+            # The last chunk is only known once the stream ends.
+            await sent_messages[-1].edit_reply_markup(reply_markup=keyboard)
         else:
-            logger.warning("Failed to convert text to speech, sending as text.")
             await message.reply_text(
-                f"ChatGPT response (audio was not generated):\n{chatgpt_response}",
-                reply_markup=keyboard,
+                "ChatGPT returned an empty response.", reply_markup=keyboard
             )
 
         return PROCESSING_VOICE
 
     except Exception as e:
-        logger.error(f"Critical error during voice processing: {e}")
+        logger.error("Critical error during voice processing: %s", e)
         if chat_id:
             await context.bot.send_message(
                 chat_id=chat_id, text="An unexpected error occurred. Please try /start."
             )
         return ConversationHandler.END
-
-    finally:
-        await remove_file_async(file_path)
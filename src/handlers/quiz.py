@@ -1,33 +1,37 @@
 """Handlers for the interactive quiz feature (/quiz command)."""
 
-import asyncio
 import logging
 
-import aiofiles
 from telegram import Update, ReplyKeyboardRemove
 from telegram.ext import CallbackContext, ConversationHandler
 
 from handlers.start import start_handler
-from utils.chatgpt_client import ChatGPTClient
-from keyboards.inline_keyboards import get_topic_keyboard, get_quiz_next_keyboard
-
-from config import ROOT_DIR
+from utils.chatgpt_client import chatgpt_client
+from utils.media_cache import media_cache, edit_query_message
+from utils.quiz_pool import QuizQuestionPool, format_question
+from utils.quiz_grading import resolve_answer
+from utils.logger import SAMPLED
+from keyboards.inline_keyboards import (
+    get_topic_keyboard,
+    get_quiz_next_keyboard,
+    QUIZ_TOPICS,
+)
+
+from config import IMAGES_DIR
 
 logger = logging.getLogger(__name__)
-chatgpt_client = ChatGPTClient()
 CHOOSE_TOPIC, ASK_QUESTION, QUIZ_NEXT = 4, 5, 6
-IMAGE_PATH = ROOT_DIR / "images" / "Quiz.jpg"
+IMAGE_PATH = IMAGES_DIR / "Quiz.jpg"
+quiz_pool = QuizQuestionPool(QUIZ_TOPICS)
+
+
+async def start_quiz_pool() -> None:
+    """Starts generating questions in the background once the feature is loaded."""
+    quiz_pool.start()
 
 
-def parse_chatgpt_verdict(text: str) -> bool | None:
-    """Tries to understand ChatGPT's 'Yes' or 'No' answer."""
-    text_lower = text.strip().lower()
-    if "yes" in text_lower and "no" not in text_lower:
-        return True
-    if "no" in text_lower and "yes" not in text_lower:
-        return False
-    logger.warning(f"Could not definitively determine ChatGPT's verdict: {text}")
-    return None
+async def stop_quiz_pool() -> None:
+    await quiz_pool.stop()
 
 
 async def start_quiz_handler(update: Update, context: CallbackContext) -> int:
@@ -43,12 +47,16 @@ async def start_quiz_handler(update: Update, context: CallbackContext) -> int:
 
     if "quiz_total_questions" not in context.user_data:
         context.user_data["quiz_total_questions"] = 0
-        logger.info(f"User {chat_id}: quiz_total_questions initialized to 0.")
+        logger.info(
+            "User %s: quiz_total_questions initialized to 0.", chat_id, extra=SAMPLED
+        )
     if "quiz_correct_answers" not in context.user_data:
         context.user_data["quiz_correct_answers"] = 0
-        logger.info(f"User {chat_id}: quiz_correct_answers initialized to 0.")
-    if "quiz_generation_history" not in context.user_data:
-        context.user_data["quiz_generation_history"] = []
+        logger.info(
+            "User %s: quiz_correct_answers initialized to 0.", chat_id, extra=SAMPLED
+        )
+    if "quiz_seen_questions" not in context.user_data:
+        context.user_data["quiz_seen_questions"] = set()
     if "quiz_photo_sent_this_session" not in context.user_data:
         context.user_data["quiz_photo_sent_this_session"] = False
 
@@ -58,37 +66,44 @@ async def start_quiz_handler(update: Update, context: CallbackContext) -> int:
     keyboard = get_topic_keyboard()
     text_to_send = f"Your current score: {score} out of {total_q}.\nSelect a topic:"
 
+    if query:
+        await query.answer()
+        try:
+            if query.message:
+                await query.edit_message_reply_markup(reply_markup=None)
+        except Exception as e:
+            logger.error(
+                "Failed to remove the keyboard "
+                "when changing the topic (this is not critical): %s",
+                e,
+            )
+
     if not context.user_data.get("quiz_photo_sent_this_session", False):
         try:
-            async with aiofiles.open(IMAGE_PATH, "rb") as f:
-                photo_bytes = await f.read()
-                await context.bot.send_photo(chat_id=chat_id, photo=photo_bytes)
+            await media_cache.send_photo(
+                context.bot,
+                chat_id,
+                IMAGE_PATH,
+                caption=text_to_send,
+                reply_markup=keyboard,
+            )
             context.user_data["quiz_photo_sent_this_session"] = True
+            return CHOOSE_TOPIC
         except FileNotFoundError as e:
-            logger.error(f"Error sending quiz image (file not found): {e}")
+            logger.error("Error sending quiz image (file not found): %s", e)
             await context.bot.send_message(
                 chat_id=chat_id,
                 text="Failed to load the image, but let's start the quiz!",
             )
             context.user_data["quiz_photo_sent_this_session"] = True
 
-    if query:
-        await query.answer()
-        try:
-            if query.message:
-                await query.edit_message_reply_markup(reply_markup=None)
-        except Exception as e:
-            logger.error(
-                f"Failed to remove the keyboard "
-                f"when changing the topic (this is not critical): {e}"
-            )
     try:
         await context.bot.send_message(
             chat_id=chat_id, text=text_to_send, reply_markup=keyboard
         )
     except Exception as e:
         logger.error(
-            f"Critical error: failed to send the topic selection message. Error: {e}"
+            "Critical error: failed to send the topic selection message. Error: %s", e
         )
         await context.bot.send_message(
             chat_id=chat_id,
@@ -104,20 +119,16 @@ async def choose_topic_handler(update: Update, context: CallbackContext) -> int:
     await query.answer()
     topic = query.data.split("_")[-1]
     context.user_data["quiz_topic"] = topic
-    context.user_data["quiz_generation_history"] = []
-    logger.info(
-        f"User {query.from_user.id} chose topic '{topic}'. "
-        f"Quiz question history cleared."
-    )
+    logger.info("User %s chose topic '%s'.", query.from_user.id, topic, extra=SAMPLED)
 
-    await query.edit_message_text(
-        f"Topic: {context.user_data['quiz_topic']}. Preparing a question..."
+    await edit_query_message(
+        query, f"Topic: {context.user_data['quiz_topic']}. Preparing a question..."
     )
     return await ask_question_handler(update, context)
 
 
 async def ask_question_handler(update: Update, context: CallbackContext) -> int:
-    """Asks a question received from ChatGPT, with options A, B, C, D in the text."""
+    """Asks the next question from the topic's pool, with options A, B, C, D."""
     query = update.callback_query
     message = update.message or (query.message if query else None)
 
@@ -129,79 +140,15 @@ async def ask_question_handler(update: Update, context: CallbackContext) -> int:
 
     chat_id = message.chat.id
     topic = context.user_data.get("quiz_topic", "General Knowledge")
-    quiz_history = context.user_data.get("quiz_generation_history", [])
-    if not quiz_history:
-        prompt_for_question = f"""
-    Generate a quiz question on the topic '{topic}'.
-    In the response, first write the question itself.
-    Then, on new lines, write four answer options, labeled A), B), C), D).
-    The answer options must not be repeated.
-    After that, on a COMPLETELY NEW LINE, after the marker 'CORRECT ANSWER:',
-    provide only the LETTER of the correct answer (A, B, C, or D).
-
-    Example:
-    What city is the capital of France?
-    A) Berlin
-    B) Madrid
-    C) Paris
-    D) Rome
-    CORRECT ANSWER: C
-    """
-    else:
-        prompt_for_question = (
-            f"Great, now generate another, completely different "
-            f"question on the same topic ('{topic}'), in the same format."
-        )
-    max_attempts = 3
-    question_text_with_options = None
-    correct_answer_letter = None
+    seen_questions = context.user_data.setdefault("quiz_seen_questions", set())
 
     try:
-        await context.bot.send_chat_action(chat_id=chat_id, action="typing")
-
-        for attempt in range(1, max_attempts + 1):
-            logger.info(
-                f"Generating question (attempt {attempt}/{max_attempts}): "
-                f"topic '{topic}'"
-            )
-            full_response_text = await chatgpt_client.ask(
-                current_user_prompt=prompt_for_question, history=quiz_history
-            )
-
-            parts = full_response_text.split("CORRECT ANSWER:")
-            if len(parts) == 2:
-                parsed_question = parts[0].strip()
-                parsed_letter = parts[1].strip().upper()
-
-                if parsed_letter in ["A", "B", "C", "D"]:
-                    question_text_with_options = parsed_question
-                    correct_answer_letter = parsed_letter
-
-                    quiz_history.append(
-                        {"role": "user", "content": prompt_for_question}
-                    )
-                    quiz_history.append(
-                        {"role": "assistant", "content": full_response_text}
-                    )
-                    context.user_data["quiz_generation_history"] = quiz_history
-                    logger.info("Question successfully generated and saved to history.")
-                    break
-                else:
-                    logger.warning(
-                        f"Incorrect answer letter from ChatGPT: {parsed_letter}"
-                    )
-
-            logger.warning(
-                f"Attempt {attempt} failed: could not split ChatGPT's response or "
-                f"incorrect letter format. Response: {full_response_text[:200]}..."
-            )
-            if attempt < max_attempts:
-                await asyncio.sleep(1)
+        if not quiz_pool.has_unseen(topic, seen_questions):
+            await context.bot.send_chat_action(chat_id=chat_id, action="typing")
+        question = await quiz_pool.get_question(topic, seen_questions)
 
-        if not question_text_with_options or not correct_answer_letter:
-            logger.error(
-                f"Failed to generate a valid question after {max_attempts} attempts."
-            )
+        if not question:
+            logger.error("No quiz question available for topic '%s'.", topic)
             await context.bot.send_message(
                 chat_id=chat_id,
                 text="Unfortunately, a question could not be generated. "
@@ -216,13 +163,16 @@ async def ask_question_handler(update: Update, context: CallbackContext) -> int:
             )
             return QUIZ_NEXT
 
+        seen_questions.add(question["fingerprint"])
+        question_text_with_options = format_question(question)
         context.user_data["current_quiz_question_text"] = question_text_with_options
-        context.user_data["current_quiz_correct_letter"] = correct_answer_letter
+        context.user_data["current_quiz_correct_letter"] = question["correct"]
+        context.user_data["current_quiz_options"] = question["options"]
 
-        await context.bot.send_message(chat_id=chat_id, text=question_text_with_options)
         await context.bot.send_message(
             chat_id=chat_id,
-            text="Type the letter of your answer (A, B, C, or D):",
+            text=f"{question_text_with_options}\n\n"
+            "Type the letter of your answer (A, B, C, or D) or the answer itself:",
             reply_markup=ReplyKeyboardRemove(),
         )
 
@@ -230,13 +180,15 @@ async def ask_question_handler(update: Update, context: CallbackContext) -> int:
             context.user_data.get("quiz_total_questions", 0) + 1
         )
         logger.info(
-            f"User {chat_id}: total questions updated "
-            f"to {context.user_data['quiz_total_questions']}."
+            "User %s: total questions updated to %s.",
+            chat_id,
+            context.user_data["quiz_total_questions"],
+            extra=SAMPLED,
         )
 
         return ASK_QUESTION
     except Exception as e:
-        logger.error(f"Critical error in ask_question_handler: {e}")
+        logger.error("Critical error in ask_question_handler: %s", e)
         await context.bot.send_message(
             chat_id=chat_id,
             text="An error occurred while generating the question. Please try /start.",
@@ -245,12 +197,13 @@ async def ask_question_handler(update: Update, context: CallbackContext) -> int:
 
 
 async def check_answer_handler(update: Update, context: CallbackContext) -> int:
-    """Sends the user's answer and the question to ChatGPT for verification."""
-    user_answer_text = update.message.text.strip().upper()
+    """Grades the user's answer locally against the stored correct letter."""
+    user_answer_text = update.message.text
     chat_id = update.message.chat.id
 
     question_asked = context.user_data.get("current_quiz_question_text")
     correct_letter = context.user_data.get("current_quiz_correct_letter")
+    options = context.user_data.get("current_quiz_options")
 
     if not question_asked or not correct_letter:
         logger.error(
@@ -262,54 +215,84 @@ async def check_answer_handler(update: Update, context: CallbackContext) -> int:
         )
         return QUIZ_NEXT
 
-    if user_answer_text not in ["A", "B", "C", "D"]:
+    answer_letter = resolve_answer(user_answer_text, options)
+    if not answer_letter:
         await update.message.reply_text(
             f"Please answer with one of the letters: "
-            f"A, B, C, or D.\n\n{question_asked}",
+            f"A, B, C, or D, or type the answer option.\n\n{question_asked}",
             reply_markup=ReplyKeyboardRemove(),
         )
         return ASK_QUESTION
 
-    prompt_for_checking = f"""
-    The correct answer option was marked with the letter: {correct_letter}.
-    The user answered: {user_answer_text}.
-    Did the user answer correctly? Answer with a single word: 'Yes' or 'No'.
-    """
+    current_correct_answers = context.user_data.get("quiz_correct_answers", 0)
+    total_questions_asked = context.user_data.get("quiz_total_questions", 0)
+
+    correct_option = correct_letter
+    if options:
+        correct_option = f"{correct_letter}) {options[correct_letter]}"
+    if answer_letter == correct_letter:
+        current_correct_answers += 1
+        context.user_data["quiz_correct_answers"] = current_correct_answers
+        result_text = "Correct! ✅\n"
+    else:
+        result_text = f"Incorrect. ❌ The correct answer was: {correct_option}.\n"
+
+    result_text += (
+        f"Total score: {current_correct_answers} out of {total_questions_asked}."
+    )
+    logger.info(
+        "User %s: score updated to %s/%s.",
+        chat_id,
+        current_correct_answers,
+        total_questions_asked,
+        extra=SAMPLED,
+    )
+
+    await update.message.reply_text(
+        result_text, reply_markup=get_quiz_next_keyboard(with_explanation=True)
+    )
+    return QUIZ_NEXT
+
+
+async def explain_answer_handler(update: Update, context: CallbackContext) -> int:
+    """Asks ChatGPT to explain the correct answer, only when the user requests it."""
+    query = update.callback_query
+    await query.answer()
+    chat_id = update.effective_chat.id
+
+    question_asked = context.user_data.get("current_quiz_question_text")
+    correct_letter = context.user_data.get("current_quiz_correct_letter")
 
     try:
-        await context.bot.send_chat_action(chat_id=chat_id, action="typing")
-        verdict_text = await chatgpt_client.ask(prompt_for_checking, max_tokens=10)
-        is_correct = parse_chatgpt_verdict(verdict_text)
-
-        current_correct_answers = context.user_data.get("quiz_correct_answers", 0)
-        total_questions_asked = context.user_data.get("quiz_total_questions", 0)
-
-        if is_correct is True:
-            current_correct_answers += 1
-            context.user_data["quiz_correct_answers"] = current_correct_answers
-            result_text = "Correct! ✅\n"
-        elif is_correct is False:
-            result_text = f"Incorrect. ❌ The correct answer was: {correct_letter}.\n"
-        else:
-            logger.info("ChatGPT verdict unclear.")
-            result_text = (
-                "ChatGPT could not determine if you answered the question correctly. "
-                "Therefore, it will not be counted in the quiz score.\n"
-            )
+        await query.edit_message_reply_markup(reply_markup=get_quiz_next_keyboard())
+    except Exception as e:
+        logger.info("Failed to update the keyboard in explain_answer_handler: %s", e)
 
-        result_text += (
-            f"Total score: {current_correct_answers} out of {total_questions_asked}."
-        )
-        logger.info(
-            f"User {chat_id}: "
-            f"score updated to {current_correct_answers}/{total_questions_asked}."
+    if not question_asked or not correct_letter:
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text="There is no question to explain.",
+            reply_markup=get_quiz_next_keyboard(),
         )
+        return QUIZ_NEXT
 
+    prompt_for_explanation = (
+        f"Here is a quiz question:\n\n{question_asked}\n\n"
+        f"The correct answer is {correct_letter}. "
+        f"Briefly explain why, in two or three sentences."
+    )
+    try:
+        await context.bot.send_chat_action(chat_id=chat_id, action="typing")
+        explanation = await chatgpt_client.ask(
+            prompt_for_explanation, feature="quiz_explain"
+        )
     except Exception as e:
-        logger.error(f"Error in check_answer_handler when contacting ChatGPT: {e}")
-        result_text = "Could not check your answer. Let's try the next question."
+        logger.error("Error in explain_answer_handler when contacting ChatGPT: %s", e)
+        explanation = "Could not get an explanation right now."
 
-    await update.message.reply_text(result_text, reply_markup=get_quiz_next_keyboard())
+    await context.bot.send_message(
+        chat_id=chat_id, text=explanation, reply_markup=get_quiz_next_keyboard()
+    )
     return QUIZ_NEXT
 
 
@@ -327,7 +310,7 @@ async def finish_quiz_handler(update: Update, context: CallbackContext) -> int:
                 await query.edit_message_reply_markup(reply_markup=None)
             except Exception as e:
                 logger.info(
-                    f"Failed to remove the inline keyboard in finish_quiz_handler: {e}"
+                    "Failed to remove the inline keyboard in finish_quiz_handler: %s", e
                 )
 
     score = context.user_data.get("quiz_correct_answers", 0)
@@ -364,12 +347,13 @@ async def finish_quiz_handler(update: Update, context: CallbackContext) -> int:
         "quiz_topic",
         "current_quiz_question_text",
         "current_quiz_correct_letter",
+        "current_quiz_options",
         "quiz_photo_sent_this_session",
-        "quiz_generation_history",
+        "quiz_seen_questions",
     ]
     for key in quiz_keys_to_clear:
         context.user_data.pop(key, None)
-    logger.info(f"Quiz data (keys: {quiz_keys_to_clear}) cleared.")
+    logger.info("Quiz data (keys: %s) cleared.", quiz_keys_to_clear, extra=SAMPLED)
 
     await start_handler(update, context)
 
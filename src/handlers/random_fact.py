@@ -2,18 +2,28 @@
 
 import logging
 
-import aiofiles
 from telegram import Update
 from telegram.ext import CallbackContext, ConversationHandler
-from utils.chatgpt_client import ChatGPTClient
+from utils.fact_pool import FactPool
+from utils.media_cache import media_cache
+from utils.logger import SAMPLED
 from keyboards.inline_keyboards import get_random_fact_keyboard
 
-from config import ROOT_DIR
+from config import IMAGES_DIR
 
 logger = logging.getLogger(__name__)
-chatgpt_client = ChatGPTClient()
 RANDOM_FACT = 0
-IMAGE_PATH = ROOT_DIR / "images" / "Fact.jpg"
+IMAGE_PATH = IMAGES_DIR / "Fact.jpg"
+fact_pool = FactPool()
+
+
+async def start_fact_pool() -> None:
+    """Starts generating facts in the background once the feature is loaded."""
+    fact_pool.start()
+
+
+async def stop_fact_pool() -> None:
+    await fact_pool.stop()
 
 
 async def start_random_handler(update: Update, context: CallbackContext) -> int:
@@ -24,42 +34,30 @@ async def start_random_handler(update: Update, context: CallbackContext) -> int:
 
     chat_id = message.chat.id
 
-    context.user_data["fact_history"] = []
-    logger.info(f"User {chat_id} started /random. Fact history cleared.")
+    context.user_data["fact_seen_ids"] = set()
+    logger.info("User %s started /random. Seen facts cleared.", chat_id, extra=SAMPLED)
 
     try:
-        async with aiofiles.open(IMAGE_PATH, "rb") as f:
-            photo_bytes = await f.read()
-            await context.bot.send_photo(chat_id=chat_id, photo=photo_bytes)
+        await media_cache.send_photo(context.bot, chat_id, IMAGE_PATH)
     except FileNotFoundError as e:
-        logger.error(f"Error sending image (file not found): {e}")
+        logger.error("Error sending image (file not found): %s", e)
         await message.reply_text("Oops, the picture is lost... But no worries!")
     except Exception as e_photo:
-        logger.error(f"Another error when sending photo for the fact: {e_photo}")
+        logger.error("Another error when sending photo for the fact: %s", e_photo)
 
-    prompt = (
-        "Tell me one interesting fact. Start your answer strictly with "
-        "'Interesting fact:' without any other words or expressions."
-    )
     try:
-        await context.bot.send_chat_action(chat_id=chat_id, action="typing")
-        fact = await chatgpt_client.ask(
-            prompt, history=context.user_data["fact_history"]
-        )
-        if fact:
-            context.user_data["fact_history"].append(
-                {"role": "user", "content": prompt}
-            )
-            context.user_data["fact_history"].append(
-                {"role": "assistant", "content": fact}
-            )
+        if not fact_pool.has_unseen(context.user_data["fact_seen_ids"]):
+            await context.bot.send_chat_action(chat_id=chat_id, action="typing")
+        fact = await fact_pool.get_fact(context.user_data["fact_seen_ids"])
+        if not fact:
+            raise LookupError("the fact pool is empty")
 
         keyboard = get_random_fact_keyboard()
         await message.reply_text(fact, reply_markup=keyboard)
         return RANDOM_FACT
 
     except Exception as e:
-        logger.error(f"Error in start_random_handler: {e}")
+        logger.error("Error in start_random_handler: %s", e)
         await message.reply_text(
             "Oops, I can't find an interesting fact. Please try /start."
         )
@@ -79,26 +77,19 @@ async def random_fact_handler(update: Update, context: CallbackContext) -> int:
         return RANDOM_FACT
 
     chat_id = message.chat.id
-    fact_history = context.user_data.get("fact_history", [])
-
-    prompt = (
-        "Tell me another interesting fact, different from the previous ones. "
-        "Start your answer strictly with 'Interesting fact:'"
-    )
+    seen_ids = context.user_data.setdefault("fact_seen_ids", set())
     try:
-        await context.bot.send_chat_action(chat_id=chat_id, action="typing")
-        fact = await chatgpt_client.ask(prompt, history=fact_history)
-        if fact:
-            fact_history.append({"role": "user", "content": prompt})
-            fact_history.append({"role": "assistant", "content": fact})
-
-        context.user_data["fact_history"] = fact_history
+        if not fact_pool.has_unseen(seen_ids):
+            await context.bot.send_chat_action(chat_id=chat_id, action="typing")
+        fact = await fact_pool.get_fact(seen_ids)
+        if not fact:
+            raise LookupError("the fact pool is empty")
 
         keyboard = get_random_fact_keyboard()
         await query.edit_message_text(fact, reply_markup=keyboard)
         return RANDOM_FACT
     except Exception as e:
-        logger.error(f"Error in random_fact_handler: {e}")
+        logger.error("Error in random_fact_handler: %s", e)
         await query.edit_message_text(
             "Oops, I can't find a new fact right now. Try again?",
             reply_markup=get_random_fact_keyboard(),
@@ -69,14 +69,18 @@ def get_topic_keyboard():
     return InlineKeyboardMarkup(buttons)
 
 
-def get_quiz_next_keyboard():
-    return InlineKeyboardMarkup(
-        [
-            [InlineKeyboardButton("Another question", callback_data="quiz_more")],
-            [InlineKeyboardButton("Change topic", callback_data="quiz_change")],
-            [InlineKeyboardButton("Finish quiz", callback_data="finish_quiz")],
-        ]
-    )
+def get_quiz_next_keyboard(with_explanation=False):
+    buttons = [
+        [InlineKeyboardButton("Another question", callback_data="quiz_more")],
+        [InlineKeyboardButton("Change topic", callback_data="quiz_change")],
+        [InlineKeyboardButton("Finish quiz", callback_data="finish_quiz")],
+    ]
+    if with_explanation:
+        buttons.insert(
+            0,
+            [InlineKeyboardButton("Explain the answer", callback_data="quiz_explain")],
+        )
+    return InlineKeyboardMarkup(buttons)
 
 
 # --- Translator ---
@@ -85,6 +89,27 @@ def get_language_keyboard():
         [InlineKeyboardButton(name, callback_data=f"lang_{code}")]
         for code, name in TARGET_LANGUAGES.items()
     ]
+    buttons.append([InlineKeyboardButton("🌍 All languages", callback_data="lang_all")])
+    buttons.append(
+        [InlineKeyboardButton("Select several…", callback_data="lang_multi")]
+    )
+    return InlineKeyboardMarkup(buttons)
+
+
+def get_language_multiselect_keyboard(selected):
+    """Language toggles for a multi-language translation, plus 'Done'."""
+    buttons = [
+        [
+            InlineKeyboardButton(
+                f"{'✅' if code in selected else '▫️'} {name}",
+                callback_data=f"lang_toggle_{code}",
+            )
+        ]
+        for code, name in TARGET_LANGUAGES.items()
+    ]
+    buttons.append(
+        [InlineKeyboardButton(f"Done ({len(selected)})", callback_data="lang_done")]
+    )
     return InlineKeyboardMarkup(buttons)
 
 
@@ -0,0 +1,35 @@
+"""Uploads the bot's images to Telegram ahead of time and caches their file_ids.
+
+Usage: poetry run python src/prewarm_media.py <chat_id>
+The uploaded messages are deleted from the chat right after the upload.
+"""
+
+import asyncio
+import logging
+import sys
+
+from telegram import Bot
+
+from config import TELEGRAM_BOT_TOKEN, MEDIA_PREWARM_CHAT_ID
+from utils.logger import setup_logger
+from utils.media_cache import media_cache
+
+setup_logger("")
+logger = logging.getLogger(__name__)
+
+
+async def prewarm(chat_id: int) -> None:
+    async with Bot(TELEGRAM_BOT_TOKEN) as bot:
+        await media_cache.prewarm(bot, chat_id)
+
+
+def main():
+    chat_id = sys.argv[1] if len(sys.argv) > 1 else MEDIA_PREWARM_CHAT_ID
+    if not chat_id:
+        logger.error("Pass a chat id or set MEDIA_PREWARM_CHAT_ID.")
+        sys.exit(1)
+    asyncio.run(prewarm(int(chat_id)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,178 @@
 """Module containing the client for interacting with the OpenAI API."""
 
-from config import OPENAI_API_KEY
-import os
-from openai import AsyncOpenAI
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    OPENAI_KEEPALIVE_EXPIRY,
+    OPENAI_HTTP2,
+    OPENAI_CONNECT_TIMEOUT,
+    OPENAI_READ_TIMEOUT,
+    OPENAI_PREWARM_CONNECTIONS,
+    OPENAI_MAX_RETRIES,
+    OPENAI_RETRY_BASE_DELAY,
+    OPENAI_RETRY_MAX_DELAY,
+    OPENAI_CIRCUIT_FAILURE_THRESHOLD,
+    OPENAI_CIRCUIT_RESET_TIMEOUT,
+)
+import asyncio
+import importlib
+import importlib.util
+import httpx
+import itertools
 import logging
-import aiofiles
+import time
+from collections import Counter
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import TYPE_CHECKING, BinaryIO, TypeVar
+
+from utils.metrics import (
+    timed,
+    record_token_usage,
+    openai_latency,
+    openai_in_flight,
+    openai_errors,
+)
+from utils.model_router import model_router, Route
+from utils.logger import SAMPLED, body
+from utils.tracing import tracer
+from utils.resilience import (
+    ChatGPTError,
+    ChatGPTBadResponse,
+    ChatGPTTimeout,
+    CircuitBreaker,
+    backoff_delay,
+    classify_error,
+)
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_MODEL = model_router.default.model
+T = TypeVar("T")
+
 
 class ChatGPTClient:
     def __init__(self):
-        """Initializes the client using openai.AsyncOpenAI."""
+        """
+        Prepares the client. The openai SDK, which is slow to import, and the
+        underlying openai.AsyncOpenAI with its connection pool are loaded by
+        start() (or lazily on first use) and shared by all features. Retries
+        are done here rather than by the SDK, behind one circuit breaker.
+        """
         self.api_key = OPENAI_API_KEY
+        self._client: "AsyncOpenAI | None" = None
+        self.breaker = CircuitBreaker(
+            OPENAI_CIRCUIT_FAILURE_THRESHOLD, OPENAI_CIRCUIT_RESET_TIMEOUT
+        )
+        self.stats = Counter()
 
-        self.client = AsyncOpenAI(api_key=self.api_key, timeout=30.0)
-        logger.info("ChatGPTClient (openai.AsyncClient) initialized.")
+    @property
+    def client(self) -> "AsyncOpenAI":
+        if self._client is None:
+            self._client = self._create_client()
+        return self._client
 
-    async def ask(
-        self,
-        current_user_prompt: str,
-        history: list = None,
-        system_prompt: str = None,
-        model: str = "gpt-3.5-turbo",
-        max_tokens: int = 1500,
-    ) -> str:
+    def _create_client(self) -> "AsyncOpenAI":
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+        http2 = OPENAI_HTTP2
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning(
+                "OPENAI_HTTP2 is set but 'h2' is not installed; using HTTP/1.1."
+            )
+            http2 = False
+
+        timeout = httpx.Timeout(OPENAI_READ_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+        http_client = DefaultAsyncHttpxClient(
+            http2=http2,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+            ),
+        )
+        logger.info(
+            "ChatGPTClient (openai.AsyncClient) initialized: "
+            "pool=%s, "
+            "keepalive=%s, http2=%s.",
+            OPENAI_MAX_CONNECTIONS,
+            OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            http2,
+        )
+        return AsyncOpenAI(
+            api_key=self.api_key,
+            timeout=timeout,
+            max_retries=0,
+            http_client=http_client,
+        )
+
+    async def start(self) -> None:
+        """Creates the shared client and opens connections ahead of the first user."""
+        # Import the SDK in a worker thread so the event loop keeps serving updates.
+        await asyncio.to_thread(importlib.import_module, "openai")
+        client = self.client
+        if OPENAI_PREWARM_CONNECTIONS <= 0:
+            return
+
+        results = await asyncio.gather(
+            *(
+                client.with_options(
+                    timeout=OPENAI_CONNECT_TIMEOUT * 2, max_retries=0
+                ).models.list()
+                for _ in range(OPENAI_PREWARM_CONNECTIONS)
+            ),
+            return_exceptions=True,
+        )
+        failed = [r for r in results if isinstance(r, Exception)]
+        if failed:
+            logger.warning("OpenAI connection prewarm failed: %s", failed[0])
+        else:
+            logger.info("Prewarmed %s OpenAI connection(s).", len(results))
+
+    async def close(self) -> None:
+        """Closes the shared client and its connection pool."""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+            logger.info("ChatGPTClient closed.")
+
+    @staticmethod
+    def route_for(feature: str, stream: bool = False) -> Route:
         """
-        Asynchronously sends a request to ChatGPT via the official SDK.
+        Resolves the route of `feature`, for callers that need its model before
+        the request; pass it on as `route` so it is not resolved twice. Set
+        `stream` for routes passed to ask_stream().
+        """
+        return model_router.route(feature, stream)
+
+    @staticmethod
+    def _request_options(
+        feature: str,
+        route: Route | None,
+        model: str | None,
+        max_tokens: int | None,
+        stream: bool = False,
+    ) -> tuple[Route, dict]:
+        """
+        Resolves the route of `feature` unless given; explicit `model` and
+        `max_tokens` override it. Returns the route and the request parameters.
         """
+        route = route or model_router.route(feature, stream)
+        return route, {
+            "model": model or route.model,
+            "max_tokens": max_tokens or route.max_tokens,
+            "temperature": route.temperature,
+            "timeout": httpx.Timeout(route.timeout, connect=OPENAI_CONNECT_TIMEOUT),
+        }
+
+    @staticmethod
+    def _build_messages(
+        current_user_prompt: str, history: list = None, system_prompt: str = None
+    ) -> list:
         messages = []
         if system_prompt:
             messages.append({"role": "system", "content": system_prompt})
@@ -36,64 +181,339 @@ class ChatGPTClient:
             messages.extend(history)
 
         messages.append({"role": "user", "content": current_user_prompt})
+        return messages
 
-        logger.debug(f"Sending request to OpenAI SDK: {messages}")
+    async def _attempt(
+        self,
+        method: str,
+        request: Callable[[], Awaitable[T]],
+        model: str | None,
+        feature: str | None = None,
+        observe_cancelled: bool = False,
+    ) -> T:
+        """
+        Makes one API call; raises a ChatGPTError. Its latency, or the time
+        until it timed out, is observed for the routing of `feature` to
+        `model`; with `observe_cancelled` also the time until it was cancelled.
+        """
+        started = time.perf_counter()
+        try:
+            with tracer.span("openai.attempt", model=model), timed(
+                openai_latency, openai_in_flight, openai_errors, method=method
+            ):
+                result = await request()
+        except asyncio.CancelledError:
+            if model and observe_cancelled:
+                model_router.observe(feature, model, time.perf_counter() - started)
+            raise
+        except Exception as e:
+            error = classify_error(e)
+            if model and isinstance(error, ChatGPTTimeout):
+                model_router.observe(feature, model, time.perf_counter() - started)
+            if error is e:
+                raise
+            raise error from e
+        if model:
+            model_router.observe(feature, model, time.perf_counter() - started)
+        return result
 
+    async def _hedged(
+        self, attempt: Callable[[bool], Awaitable[T]], feature: str | None, model: str
+    ) -> T:
+        """
+        Runs `attempt`, and once more if the first run is slower than the p95
+        latency of `feature`'s requests to `model`; returns the first result,
+        or raises the last error. `attempt` is told whether it is the first
+        run: when a hedge wins, the first run's time until it is cancelled
+        must still count towards the p95, or the p95 would keep falling and
+        hedge ever more requests.
+        """
+        delay = model_router.p95(feature, model)
+        if delay is None:
+            return await attempt(True)
+
+        tasks = [asyncio.create_task(attempt(True))]
         try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.stats["hedged"] += 1
+                tasks.append(asyncio.create_task(attempt(False)))
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        if task is not tasks[0]:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _retry_delay(
+        self, error: ChatGPTError, attempt: int, probe: bool
+    ) -> float | None:
+        """
+        Records failed attempt number `attempt` (from 0), the breaker's probe
+        if `probe`, with the circuit breaker; returns the delay before the next
+        one, or None to give up.
+        """
+        if not error.retryable:
+            if probe:
+                # OpenAI answered, so it is up; the request itself was at fault.
+                # Other calls' rejections say nothing about an open breaker.
+                self.breaker.record_success()
+            return None
+        self.breaker.record_failure()
+        if attempt >= OPENAI_MAX_RETRIES or self.breaker.is_open:
+            return None
+        if error.retry_after is not None and error.retry_after > OPENAI_RETRY_MAX_DELAY:
+            return None
+        delay = backoff_delay(
+            attempt, OPENAI_RETRY_BASE_DELAY, OPENAI_RETRY_MAX_DELAY, error.retry_after
+        )
+        self.stats["retries"] += 1
+        logger.warning(
+            "OpenAI request failed (%s: %s); retry %s in %.2fs.",
+            type(error).__name__,
+            error,
+            attempt + 1,
+            delay,
+        )
+        return delay
+
+    async def _call(
+        self,
+        method: str,
+        request: Callable[[], Awaitable[T]],
+        model: str | None = None,
+        hedge: bool = False,
+        feature: str | None = None,
+    ) -> T:
+        """
+        Makes the API call `request` through the circuit breaker, retrying
+        transient failures; raises a ChatGPTError. With `hedge`, each attempt
+        is hedged against the p95 latency of `model`. The call is traced as a
+        span with one child span per attempt.
+        """
+        with tracer.span(f"openai.{method}", model=model, route=feature) as span:
+            for attempt in itertools.count():
+                span.set_attribute("attempts", attempt + 1)
+                probe = self.breaker.before_call()
+                try:
+                    if hedge and model:
+                        result = await self._hedged(
+                            lambda first: self._attempt(
+                                method, request, model, feature, observe_cancelled=first
+                            ),
+                            feature,
+                            model,
+                        )
+                    else:
+                        result = await self._attempt(method, request, model, feature)
+                except ChatGPTError as e:
+                    delay = self._retry_delay(e, attempt, probe)
+                    if delay is None:
+                        raise
+                    await asyncio.sleep(delay)
+                    continue
+                self.breaker.record_success()
+                return result
+
+    async def ask(
+        self,
+        current_user_prompt: str,
+        history: list = None,
+        system_prompt: str = None,
+        model: str | None = None,
+        max_tokens: int | None = None,
+        response_format: dict | None = None,
+        feature: str = "other",
+        route: Route | None = None,
+    ) -> str:
+        """
+        Asynchronously sends a request to ChatGPT via the official SDK.
+        Pass response_format={"type": "json_object"} to request a JSON reply;
+        `feature` selects the route (model, max_tokens, temperature, timeout,
+        hedging) unless `route` is given, and labels the token usage metrics.
+        Raises a ChatGPTError once retries are exhausted, or at once while the
+        circuit is open.
+        """
+        messages = self._build_messages(current_user_prompt, history, system_prompt)
+        logger.debug("Sending request to OpenAI SDK: %s", body(messages))
+
+        route, params = self._request_options(feature, route, model, max_tokens)
+        if response_format:
+            params["response_format"] = response_format
+
+        async def request() -> str:
             chat_completion = await self.client.chat.completions.create(
-                messages=messages,
-                model=model,
-                max_tokens=max_tokens,
-                temperature=0.7,
+                messages=messages, **params
+            )
+            logger.debug("Response from OpenAI SDK: %s", body(chat_completion))
+            record_token_usage(chat_completion.usage, feature)
+            choices = chat_completion.choices
+            if choices and choices[0].message and choices[0].message.content:
+                return choices[0].message.content.strip()
+            raise ChatGPTBadResponse(
+                f"Unexpected response format from OpenAI: {chat_completion}"
             )
 
-            logger.debug(f"Response from OpenAI SDK: {chat_completion}")
+        return await self._call(
+            "chat", request, params["model"], route.hedge, feature=feature
+        )
 
-            if chat_completion.choices and chat_completion.choices[0].message:
-                return chat_completion.choices[0].message.content.strip()
-            else:
-                logger.error(
-                    f"Unexpected response format from OpenAI SDK: {chat_completion}"
-                )
-                return "Sorry, I received a strange response."
+    async def ask_stream(
+        self,
+        current_user_prompt: str,
+        history: list = None,
+        system_prompt: str = None,
+        model: str | None = None,
+        max_tokens: int | None = None,
+        feature: str = "other",
+        route: Route | None = None,
+    ) -> AsyncIterator[str]:
+        """
+        Streams the ChatGPT response, yielding text deltas as they arrive.
+        Failures before the first delta are retried like in ask(); errors are
+        raised as ChatGPTError. The time to the first token counts as the
+        latency of the route's model.
+        """
+        messages = self._build_messages(current_user_prompt, history, system_prompt)
+        logger.debug("Sending streaming request to OpenAI SDK: %s", body(messages))
+        _, params = self._request_options(
+            feature, route, model, max_tokens, stream=True
+        )
 
-        except Exception as e:
-            logger.exception("Error calling OpenAI API via SDK:")
-            return f"An error occurred while contacting ChatGPT: {e}"
+        span = tracer.span("openai.chat_stream", model=params["model"], route=feature)
+        try:
+            for attempt in itertools.count():
+                span.set_attribute("attempts", attempt + 1)
+                probe = self.breaker.before_call()
+                started = time.perf_counter()
+                first_token = None
+                try:
+                    with timed(
+                        openai_latency,
+                        openai_in_flight,
+                        openai_errors,
+                        method="chat_stream",
+                    ):
+                        stream = await self.client.chat.completions.create(
+                            messages=messages,
+                            stream=True,
+                            stream_options={"include_usage": True},
+                            **params,
+                        )
+                        async for chunk in stream:
+                            if chunk.choices and chunk.choices[0].delta.content:
+                                if first_token is None:
+                                    first_token = time.perf_counter() - started
+                                    model_router.observe(
+                                        feature,
+                                        params["model"],
+                                        first_token,
+                                        stream=True,
+                                    )
+                                    span.set_attribute(
+                                        "first_token_ms", round(first_token * 1000, 1)
+                                    )
+                                yield chunk.choices[0].delta.content
+                            if chunk.usage:
+                                record_token_usage(chunk.usage, feature)
+                except Exception as e:
+                    error = classify_error(e)
+                    if first_token is not None:
+                        # Deltas already shown to the user cannot be taken back.
+                        if error.retryable:
+                            self.breaker.record_failure()
+                        delay = None
+                    else:
+                        if isinstance(error, ChatGPTTimeout):
+                            elapsed = time.perf_counter() - started
+                            model_router.observe(
+                                feature, params["model"], elapsed, stream=True
+                            )
+                        delay = self._retry_delay(error, attempt, probe)
+                    if delay is None:
+                        logger.error(
+                            "Error streaming from OpenAI API via SDK: %s", error
+                        )
+                        if error is e:
+                            raise
+                        raise error from e
+                    await asyncio.sleep(delay)
+                    continue
+                self.breaker.record_success()
+                span.end()
+                return
+        except BaseException as e:
+            span.end(e)
+            raise
 
-    async def transcribe(self, file_path: str) -> str | None:
+    async def transcribe(
+        self, audio: bytes | BinaryIO, filename: str = "voice.ogg"
+    ) -> str | None:
         """
-        Asynchronously transcribes speech from an audio file using the Whisper API.
+        Asynchronously transcribes speech using the Whisper API. `audio` is the
+        audio data or a binary file object, which is streamed without copying;
+        `filename` tells Whisper the audio format.
         """
-        logger.info(f"Sending file {file_path} to Whisper for transcription.")
-        try:
-            async with aiofiles.open(file_path, "rb") as audio_file:
-                audio_bytes = await audio_file.read()
+        logger.info("Sending %s to Whisper for transcription.", filename, extra=SAMPLED)
 
-            transcription = await self.client.audio.transcriptions.create(
+        async def request():
+            if not isinstance(audio, bytes):
+                audio.seek(0)  # A retry uploads the file again.
+            return await self.client.audio.transcriptions.create(
                 model="whisper-1",
-                file=(os.path.basename(file_path), audio_bytes),
+                file=(filename, audio),
                 response_format="text",
             )
-            return transcription.strip() if isinstance(transcription, str) else None
-        except Exception:
-            logger.exception("Error calling Whisper API via SDK:")
+
+        try:
+            transcription = await self._call("transcribe", request)
+        except ChatGPTError as e:
+            logger.error("Error calling Whisper API via SDK: %s", e)
             return None
+        return transcription.strip() if isinstance(transcription, str) else None
 
     async def text_to_speech(
-        self, text_to_convert: str, model: str = "tts-1-hd", voice: str = "nova"
+        self,
+        text_to_convert: str,
+        model: str = "tts-1-hd",
+        voice: str = "nova",
+        response_format: str = "mp3",
     ) -> bytes | None:
         """
         Converts text to speech using the OpenAI TTS API and returns audio (bytes).
+        Use response_format="opus" for audio Telegram can send as a voice message.
         """
         logger.info(
-            f"Converting text to speech (voice: {voice}): '{text_to_convert[:50]}...'"
+            "Converting text to speech (voice: %s): %s",
+            voice,
+            body(text_to_convert),
+            extra=SAMPLED,
         )
-        try:
-            response = await self.client.audio.speech.create(
-                model=model, voice=voice, input=text_to_convert
+
+        async def request():
+            return await self.client.audio.speech.create(
+                model=model,
+                voice=voice,
+                input=text_to_convert,
+                response_format=response_format,
             )
-            return response.content
-        except Exception:
-            logger.exception("Error calling OpenAI TTS API via SDK:")
+
+        try:
+            response = await self._call("tts", request)
+        except ChatGPTError as e:
+            logger.error("Error calling OpenAI TTS API via SDK: %s", e)
             return None
+        return response.content
+
+
+chatgpt_client = ChatGPTClient()
@@ -0,0 +1,152 @@
+"""Token-budgeted conversation history with a rolling summary of older turns."""
+
+import logging
+from functools import lru_cache
+
+from config import GPT_HISTORY_TOKEN_BUDGETS, GPT_HISTORY_DEFAULT_TOKEN_BUDGET
+from utils.chatgpt_client import chatgpt_client, DEFAULT_MODEL
+
+try:
+    import tiktoken
+except ImportError:  # optional dependency, a character-based estimate is used
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_OVERHEAD_TOKENS = 4
+# After compaction the history is trimmed below this share of the budget, so
+# that a summary is not requested again on the very next turn.
+COMPACTION_TARGET_RATIO = 0.75
+SUMMARY_MAX_TOKENS = 300
+SUMMARY_PROMPT = (
+    "Update the summary of a conversation between a user and an AI assistant. "
+    "Keep names, facts, decisions and user preferences; drop small talk. "
+    "Answer with the summary only, in at most 150 words.\n\n"
+    "Current summary:\n{summary}\n\nNew conversation turns:\n{turns}"
+)
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_text_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
+    if tiktoken is None:
+        return len(text) // 4 + 1
+    return len(_get_encoding(model).encode(text))
+
+
+def count_message_tokens(messages: list, model: str = DEFAULT_MODEL) -> int:
+    return sum(
+        MESSAGE_OVERHEAD_TOKENS + count_text_tokens(m["content"], model)
+        for m in messages
+    )
+
+
+class ConversationMemory:
+    def __init__(self, history_key: str, summary_key: str):
+        """Manages the history stored under the given user_data keys."""
+        self.history_key = history_key
+        self.summary_key = summary_key
+        self._compacting: set[int] = set()
+
+    @staticmethod
+    def budget_for(model: str) -> int:
+        return GPT_HISTORY_TOKEN_BUDGETS.get(model, GPT_HISTORY_DEFAULT_TOKEN_BUDGET)
+
+    def reset(self, user_data: dict) -> None:
+        user_data[self.history_key] = []
+        user_data.pop(self.summary_key, None)
+
+    def _summary_message(self, user_data: dict) -> list:
+        summary = user_data.get(self.summary_key)
+        if not summary:
+            return []
+        return [
+            {
+                "role": "system",
+                "content": f"Summary of the earlier conversation: {summary}",
+            }
+        ]
+
+    def bounded_history(self, user_data: dict, model: str = DEFAULT_MODEL) -> list:
+        """
+        Returns the summary (if any) followed by the newest turns that fit into
+        the model's token budget.
+        """
+        summary = self._summary_message(user_data)
+        remaining = self.budget_for(model) - count_message_tokens(summary, model)
+
+        recent = []
+        for message in reversed(user_data.get(self.history_key, [])):
+            remaining -= count_message_tokens([message], model)
+            if remaining < 0:
+                break
+            recent.append(message)
+        recent.reverse()
+        if recent and recent[0]["role"] == "assistant":
+            recent = recent[1:]
+        return summary + recent
+
+    def add_turn(self, user_data: dict, user_text: str, reply_text: str) -> None:
+        history = user_data.setdefault(self.history_key, [])
+        history.append({"role": "user", "content": user_text})
+        history.append({"role": "assistant", "content": reply_text})
+
+    async def compact(self, user_data: dict, model: str = DEFAULT_MODEL) -> None:
+        """
+        Moves the oldest turns out of the history once it exceeds the budget and
+        folds them into the running summary. Meant to run after the reply has
+        been sent, off the critical path. The turns are only dropped once the
+        summary exists, and only if the conversation was not reset meanwhile.
+        """
+        history = user_data.get(self.history_key, [])
+        budget = self.budget_for(model)
+        summary_tokens = count_message_tokens(self._summary_message(user_data), model)
+        # Each message is counted once; dropped turns are subtracted from the total.
+        sizes = [count_message_tokens([message], model) for message in history]
+        history_tokens = sum(sizes)
+        if summary_tokens + history_tokens <= budget:
+            return
+        if id(user_data) in self._compacting:
+            return
+
+        target = int(budget * COMPACTION_TARGET_RATIO) - summary_tokens
+        evict_count = 0
+        while evict_count < len(history) and history_tokens > target:
+            history_tokens -= sum(sizes[evict_count : evict_count + 2])
+            evict_count += 2
+        evicted = history[:evict_count]
+        if not evicted:
+            return
+
+        self._compacting.add(id(user_data))
+        try:
+            turns = "\n".join(f"{m['role']}: {m['content']}" for m in evicted)
+            prompt = SUMMARY_PROMPT.format(
+                summary=user_data.get(self.summary_key) or "(empty)", turns=turns
+            )
+            summary = await chatgpt_client.ask(
+                prompt, max_tokens=SUMMARY_MAX_TOKENS, feature="gpt_summary"
+            )
+            # add_turn() only appends, so a history that is another list or no
+            # longer starts with the evicted turns belongs to a new session.
+            if (
+                user_data.get(self.history_key) is not history
+                or history[:evict_count] != evicted
+            ):
+                logger.info("Conversation was reset; discarding its summary.")
+                return
+            del history[:evict_count]
+            user_data[self.summary_key] = summary
+            logger.info(
+                "Conversation compacted: %s message(s) summarized.", len(evicted)
+            )
+        except Exception as e:
+            logger.error("Failed to summarize evicted conversation turns: %s", e)
+        finally:
+            self._compacting.discard(id(user_data))
@@ -0,0 +1,185 @@
+"""Shared pool of deduplicated interesting facts, filled in background batches."""
+
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+from collections import Counter
+
+from config import FACT_POOL_MAX_SIZE, FACT_POOL_REFILL_THRESHOLD, FACT_POOL_BATCH_SIZE
+from utils.chatgpt_client import chatgpt_client
+from utils.logger import body
+
+logger = logging.getLogger(__name__)
+
+FACT_PREFIX = "Interesting fact:"
+FACT_FIELDS = [
+    "science",
+    "history",
+    "nature",
+    "space",
+    "art",
+    "geography",
+    "technology",
+    "the human body",
+    "animals",
+    "food",
+    "language",
+    "sports",
+]
+FACT_BATCH_PROMPT = """
+    Tell me {count} different interesting facts about {fields}.
+    Each fact must be one or two sentences long and start strictly with
+    'Interesting fact:'.
+    Respond only with JSON in the following format:
+    {{"facts": ["Interesting fact: ...", "Interesting fact: ..."]}}
+    """
+
+
+def fact_fingerprint(fact_text: str) -> str:
+    """Returns a short hash of the fact text, ignoring case, punctuation and prefix."""
+    text = fact_text.strip()
+    if text.lower().startswith(FACT_PREFIX.lower()):
+        text = text[len(FACT_PREFIX) :]
+    normalized = " ".join(re.findall(r"\w+", text.lower()))
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_fact_batch(raw_response: str) -> list[str]:
+    """Parses a JSON batch of facts, normalizing the 'Interesting fact:' prefix."""
+    try:
+        items = json.loads(raw_response).get("facts", [])
+    except (ValueError, AttributeError):
+        logger.warning("Fact batch is not valid JSON: %s", body(raw_response))
+        return []
+    if not isinstance(items, list):
+        return []
+
+    facts = []
+    for item in items:
+        if not isinstance(item, str) or not item.strip():
+            continue
+        fact = item.strip()
+        if not fact.lower().startswith(FACT_PREFIX.lower()):
+            fact = f"{FACT_PREFIX} {fact}"
+        facts.append(fact)
+    return facts
+
+
+class FactPool:
+    def __init__(
+        self,
+        max_size: int = FACT_POOL_MAX_SIZE,
+        refill_threshold: int = FACT_POOL_REFILL_THRESHOLD,
+        batch_size: int = FACT_POOL_BATCH_SIZE,
+    ):
+        """
+        Keeps up to `max_size` unique facts shared by all users, evicting the
+        oldest ones. A background batch is requested whenever a user has
+        `refill_threshold` or fewer facts left that they have not seen.
+        """
+        self.max_size = max_size
+        self.refill_threshold = refill_threshold
+        self.batch_size = batch_size
+        # Facts by fingerprint, which users' seen sets store: unlike a counter,
+        # it identifies the same fact again after a restart.
+        self._facts: dict[str, str] = {}
+        self._refill_task: asyncio.Task | None = None
+        self.stats = Counter()
+
+    def __len__(self) -> int:
+        return len(self._facts)
+
+    def start(self) -> None:
+        """Starts filling the pool in the background."""
+        self._schedule_refill()
+
+    async def stop(self) -> None:
+        """Cancels a running refill."""
+        if self._refill_task:
+            self._refill_task.cancel()
+            await asyncio.gather(self._refill_task, return_exceptions=True)
+            self._refill_task = None
+
+    def _schedule_refill(self) -> asyncio.Task:
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self._generate_batch())
+        return self._refill_task
+
+    def _add(self, fact: str) -> bool:
+        fingerprint = fact_fingerprint(fact)
+        if fingerprint in self._facts:
+            return False
+
+        while len(self._facts) >= self.max_size:
+            del self._facts[next(iter(self._facts))]
+            self.stats["evicted"] += 1
+
+        self._facts[fingerprint] = fact
+        return True
+
+    async def _generate_batch(self) -> int:
+        """Asks ChatGPT for a batch of facts and adds the new ones to the pool."""
+        fields = ", ".join(random.sample(FACT_FIELDS, 3))
+        prompt = FACT_BATCH_PROMPT.format(count=self.batch_size, fields=fields)
+        try:
+            raw_response = await chatgpt_client.ask(
+                prompt, response_format={"type": "json_object"}, feature="random"
+            )
+        except Exception as e:
+            logger.error("Fact pool: batch generation failed: %s", e)
+            return 0
+
+        facts = parse_fact_batch(raw_response)
+        added = sum(self._add(fact) for fact in facts)
+        self.stats["batches"] += 1
+        self.stats["generated"] += added
+        self.stats["duplicates"] += len(facts) - added
+        logger.info(
+            "Fact pool: batch added %s fact(s), %s duplicate(s), pool size %s.",
+            added,
+            len(facts) - added,
+            len(self._facts),
+        )
+        return added
+
+    def _pick_unseen(self, seen: set) -> tuple[str, str] | None:
+        unseen = [fingerprint for fingerprint in self._facts if fingerprint not in seen]
+        if len(unseen) <= self.refill_threshold:
+            self._schedule_refill()
+        if not unseen:
+            return None
+        fingerprint = random.choice(unseen)
+        return fingerprint, self._facts[fingerprint]
+
+    def has_unseen(self, seen: set) -> bool:
+        return any(fingerprint not in seen for fingerprint in self._facts)
+
+    async def get_fact(self, seen: set) -> str | None:
+        """
+        Returns a random fact the user has not seen yet and records its
+        fingerprint in `seen`, which is kept to at most `max_size` entries.
+        Waits for a batch only when every pooled fact was already seen.
+        """
+        picked = self._pick_unseen(seen)
+        if picked:
+            self.stats["hits"] += 1
+        else:
+            self.stats["misses"] += 1
+            await asyncio.shield(self._schedule_refill())
+            picked = self._pick_unseen(seen)
+            if not picked:
+                await self._generate_batch()
+                picked = self._pick_unseen(seen)
+        if not picked:
+            return None
+
+        fingerprint, fact = picked
+        seen.add(fingerprint)
+        if len(seen) > self.max_size:
+            # Facts no longer pooled, e.g. from before a restart, go first.
+            seen.intersection_update(self._facts)
+        self.stats["served"] += 1
+        return fact
@@ -0,0 +1,101 @@
+"""Features whose handler modules are imported on first use.
+
+A Feature names the module that holds a feature's handlers and hands out lazy
+callbacks for them, which can be registered with handlers right away. The module
+is imported in a worker thread by the first update that reaches one of them (or
+by preload() once the bot is running), so the bot starts receiving updates
+without importing every feature and the OpenAI SDK first.
+"""
+
+import asyncio
+import importlib
+import logging
+import time
+from collections.abc import Callable
+from types import ModuleType
+
+logger = logging.getLogger(__name__)
+
+
+class LazyCallback:
+    def __init__(self, feature: "Feature", name: str):
+        """Handler callback `name` of `feature`; loads the feature when called."""
+        self.feature = feature
+        self.__name__ = self.__qualname__ = name
+        self.__module__ = feature.module_name
+
+    async def __call__(self, update, context):
+        module = await self.feature.load()
+        return await getattr(module, self.__name__)(update, context)
+
+    def __repr__(self) -> str:
+        return f"<LazyCallback {self.__module__}.{self.__name__}>"
+
+
+class Feature:
+    def __init__(
+        self,
+        name: str,
+        module_name: str,
+        on_load: str | None = None,
+        on_shutdown: str | None = None,
+    ):
+        """
+        Feature `name`, implemented in the module `module_name`. `on_load` and
+        `on_shutdown` name coroutine functions of that module, awaited right
+        after it is imported and when the bot stops (if it was loaded).
+        """
+        self.name = name
+        self.module_name = module_name
+        self.on_load = on_load
+        self.on_shutdown = on_shutdown
+        self.module: ModuleType | None = None
+        self._callbacks: dict[str, LazyCallback] = {}
+        self._lock = asyncio.Lock()
+
+    def handler(self, name: str) -> LazyCallback:
+        """Returns the lazy callback for the function `name` of the module."""
+        if name not in self._callbacks:
+            self._callbacks[name] = LazyCallback(self, name)
+        return self._callbacks[name]
+
+    async def load(self) -> ModuleType:
+        """Imports the module (once) and runs its `on_load` hook."""
+        if self.module is not None:
+            return self.module
+        async with self._lock:
+            if self.module is None:
+                started = time.perf_counter()
+                module = await asyncio.to_thread(
+                    importlib.import_module, self.module_name
+                )
+                if self.on_load:
+                    await getattr(module, self.on_load)()
+                self.module = module
+                logger.info(
+                    "Feature '%s' loaded in %.3fs.",
+                    self.name,
+                    time.perf_counter() - started,
+                )
+        return self.module
+
+    async def shutdown(self) -> None:
+        """Runs the `on_shutdown` hook if the feature was loaded."""
+        if self.module is not None and self.on_shutdown:
+            await getattr(self.module, self.on_shutdown)()
+
+    def stats(self, attribute: str) -> Callable[[], dict]:
+        """
+        Returns a function giving the `stats` of the module-level object
+        `attribute`, or nothing while the feature is not loaded.
+        """
+        return lambda: getattr(self.module, attribute).stats if self.module else {}
+
+
+async def preload(features: list[Feature]) -> None:
+    """Loads the features one by one; failures are logged and left for later."""
+    for feature in features:
+        try:
+            await feature.load()
+        except Exception:
+            logger.exception("Failed to preload feature '%s':", feature.name)
@@ -0,0 +1,188 @@
+"""Minimal asyncio HTTP/1.1 server for the bot's small internal endpoints.
+
+Supports keep-alive and requests with a Content-Length body, which is all the
+webhook and metrics endpoints need. Connections that send nothing, or send a
+request too slowly, are closed after a timeout, and connections beyond a limit
+are answered with 503, so idle or slow clients cannot use up the server.
+"""
+
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+logger = logging.getLogger(__name__)
+
+MAX_HEADER_SIZE = 16 * 1024
+DEFAULT_MAX_BODY_SIZE = 1024 * 1024
+# Seconds a connection may take to send a request's head or body; also how long
+# an idle keep-alive connection is kept open.
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_MAX_CONNECTIONS = 100
+
+
+@dataclass
+class HttpRequest:
+    method: str
+    path: str
+    query: dict
+    headers: dict
+    body: bytes
+
+
+@dataclass
+class HttpResponse:
+    status: int = 200
+    body: bytes = b""
+    content_type: str = "text/plain; charset=utf-8"
+    headers: dict = field(default_factory=dict)
+
+
+Handler = Callable[[HttpRequest], Awaitable[HttpResponse]]
+
+
+class HttpServer:
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        routes: dict[tuple[str, str], Handler],
+        max_body_size: int = DEFAULT_MAX_BODY_SIZE,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    ):
+        """
+        Serves `routes`, a mapping of (method, path) to async handlers, on up
+        to `max_connections` connections at a time. A connection is closed when
+        the head or the body of a request takes longer than `read_timeout`
+        seconds to arrive.
+        """
+        self.host = host
+        self.port = port
+        self.routes = routes
+        self.max_body_size = max_body_size
+        self.read_timeout = read_timeout
+        self.max_connections = max_connections
+        self._server: asyncio.AbstractServer | None = None
+        self._connections: dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port, limit=MAX_HEADER_SIZE
+        )
+        if self.port == 0:
+            self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("HTTP server listening on %s:%s.", self.host, self.port)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._connections):
+                writer.close()
+            await asyncio.gather(*self._connections.values(), return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+            logger.info("HTTP server on %s:%s stopped.", self.host, self.port)
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> HttpRequest | None:
+        try:
+            head = await asyncio.wait_for(
+                reader.readuntil(b"\r\n\r\n"), self.read_timeout
+            )
+        except asyncio.IncompleteReadError:
+            return None
+
+        request_line, *header_lines = head.decode("latin-1").split("\r\n")
+        method, target, _version = request_line.split(" ", 2)
+        headers = {}
+        for line in header_lines:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", "0"))
+        if length > self.max_body_size:
+            raise ValueError("request body too large")
+        body = (
+            await asyncio.wait_for(reader.readexactly(length), self.read_timeout)
+            if length
+            else b""
+        )
+
+        url = urlsplit(target)
+        return HttpRequest(
+            method=method.upper(),
+            path=url.path,
+            query=parse_qs(url.query),
+            headers=headers,
+            body=body,
+        )
+
+    @staticmethod
+    def _write_response(
+        writer: asyncio.StreamWriter, response: HttpResponse, keep_alive: bool
+    ) -> None:
+        reason = HTTPStatus(response.status).phrase
+        headers = {
+            "Content-Type": response.content_type,
+            "Content-Length": str(len(response.body)),
+            "Connection": "keep-alive" if keep_alive else "close",
+            **response.headers,
+        }
+        head = f"HTTP/1.1 {response.status} {reason}\r\n" + "".join(
+            f"{name}: {value}\r\n" for name, value in headers.items()
+        )
+        writer.write(head.encode("latin-1") + b"\r\n" + response.body)
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        if len(self._connections) >= self.max_connections:
+            logger.warning(
+                "Rejected HTTP connection: %s connections open.", len(self._connections)
+            )
+            self._write_response(
+                writer, HttpResponse(503, b"Service Unavailable"), False
+            )
+            writer.close()
+            return
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except (ValueError, asyncio.LimitOverrunError) as e:
+                    logger.warning("Rejected malformed HTTP request: %s", e)
+                    self._write_response(
+                        writer, HttpResponse(400, b"Bad Request"), False
+                    )
+                    break
+                if request is None:
+                    break
+
+                handler = self.routes.get((request.method, request.path))
+                if handler is None:
+                    response = HttpResponse(404, b"Not Found")
+                else:
+                    try:
+                        response = await handler(request)
+                    except Exception:
+                        logger.exception(
+                            "Error handling %s %s", request.method, request.path
+                        )
+                        response = HttpResponse(500, b"Internal Server Error")
+
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                self._write_response(writer, response, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except TimeoutError:
+            logger.debug("Closed an HTTP connection that timed out.")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
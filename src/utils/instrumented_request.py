@@ -0,0 +1,25 @@
+"""Bot API request backend that records the latency of every call."""
+
+from telegram.request import HTTPXRequest
+
+from utils.metrics import timed, telegram_latency, telegram_in_flight, telegram_errors
+from utils.tracing import tracer
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """
+    HTTPXRequest that reports Bot API calls to the telegram_request_* metrics
+    and traces them as spans of the current update.
+    """
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        # File downloads are labelled as one method, not by their file path.
+        api_method = "downloadFile" if "/file/bot" in url else url.rsplit("/", 1)[-1]
+        with tracer.span(f"telegram.{api_method}") as span, timed(
+            telegram_latency, telegram_in_flight, telegram_errors, method=api_method
+        ):
+            status, payload = await super().do_request(url, method, *args, **kwargs)
+            span.set_attribute("http.status_code", status)
+        if status >= 400:
+            telegram_errors.inc(method=api_method)
+        return status, payload
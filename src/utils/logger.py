@@ -1,22 +1,186 @@
-"""Module for setting up the application's logger."""
+"""Module for setting up the application's logger.
 
+Records are put on a queue by the logging call and written by a QueueListener
+thread, so a slow stderr never blocks the event loop. Output is JSON lines or
+plain text (LOG_FORMAT). Noisy per-update lines are sampled, secrets are
+redacted, and message bodies passed through body() are redacted or shortened.
+"""
+
+import atexit
+import copy
+import json
 import logging
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from config import (
+    LOG_LEVEL,
+    LOG_FORMAT,
+    LOG_QUEUE_SIZE,
+    LOG_SAMPLE_EVERY,
+    LOG_REDACT_BODIES,
+    LOG_MAX_BODY_LENGTH,
+    LOG_MAX_MESSAGE_LENGTH,
+    TELEGRAM_BOT_TOKEN,
+    OPENAI_API_KEY,
+)
+
+# Pass as `extra=SAMPLED` to log only every LOG_SAMPLE_EVERY-th such line.
+SAMPLED = {"sampled": True}
+# Loggers whose lines below WARNING are always sampled (httpx logs every request).
+SAMPLED_LOGGERS = ("httpx",)
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# Attributes every LogRecord has; any others came in through `extra`.
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener: QueueListener | None = None
+
+
+def _shorten(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}… ({len(text) - limit} more chars)"
+
+
+def _describe(value) -> str:
+    if isinstance(value, str):
+        return f"<{len(value)} chars>"
+    if isinstance(value, list) and all(isinstance(item, dict) for item in value):
+        chars = sum(len(str(item.get("content", ""))) for item in value)
+        return f"<{len(value)} message(s), {chars} chars>"
+    return f"<{type(value).__name__}>"
+
+
+class body:
+    """
+    Wraps a message body (user text, prompts, API payloads) for a log call; it
+    is formatted only if the record is emitted, as a short description while
+    LOG_REDACT_BODIES is set, otherwise capped to LOG_MAX_BODY_LENGTH chars.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self) -> str:
+        if LOG_REDACT_BODIES:
+            return _describe(self.value)
+        text = self.value if isinstance(self.value, str) else repr(self.value)
+        return _shorten(text, LOG_MAX_BODY_LENGTH)
+
+    __repr__ = __str__
+
 
+class SamplingFilter(logging.Filter):
+    def __init__(self, every: int = LOG_SAMPLE_EVERY):
+        """Lets through the first and then every `every`-th sampled line."""
+        super().__init__()
+        self.every = max(every, 1)
+        self._counts: dict[tuple, int] = {}
 
-def setup_logger(name: str, level=logging.INFO) -> logging.Logger:
-    """Configures and returns a logger."""
+    def filter(self, record: logging.LogRecord) -> bool:
+        sampled = getattr(record, "sampled", False) or (
+            record.levelno < logging.WARNING and record.name.startswith(SAMPLED_LOGGERS)
+        )
+        if not sampled:
+            return True
+        # Lines are counted per call site, not per formatted message.
+        key = (record.name, record.msg)
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+        return count % self.every == 0
+
+
+class _QueueHandler(QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Merges the arguments into the message while they are current, but
+        leaves the formatting to the listener thread.
+        """
+        record = copy.copy(record)
+        record.msg = _shorten(record.getMessage(), LOG_MAX_MESSAGE_LENGTH)
+        record.args = None
+        if record.exc_info:
+            # Tracebacks hold frames; render them now rather than keeping those.
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # The writer cannot keep up; dropping beats blocking the event loop.
+            self.dropped += 1
+
+
+class _RedactingFormatter(logging.Formatter):
+    """Replaces the bot token and the OpenAI key wherever they appear."""
+
+    secrets = [secret for secret in (TELEGRAM_BOT_TOKEN, OPENAI_API_KEY) if secret]
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = self.render(record)
+        for secret in self.secrets:
+            text = text.replace(secret, "<redacted>")
+        return text
+
+    def render(self, record: logging.LogRecord) -> str:
+        return super().format(record)
+
+
+class JsonFormatter(_RedactingFormatter):
+    """One JSON object per line, with the `extra` fields of the record."""
+
+    def render(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key != "sampled":
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logger(name: str, level=LOG_LEVEL) -> logging.Logger:
+    """
+    Configures and returns a logger whose records are written by a background
+    thread; it is stopped (and the queue flushed) at exit.
+    """
+    global _listener
     logger = logging.getLogger(name)
     logger.setLevel(level)
+    if logger.handlers:
+        return logger
 
     console_handler = logging.StreamHandler()
     console_handler.setLevel(level)
-
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    formatter = (
+        JsonFormatter() if LOG_FORMAT == "json" else _RedactingFormatter(TEXT_FORMAT)
     )
     console_handler.setFormatter(formatter)
 
-    if not logger.handlers:
-        logger.addHandler(console_handler)
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+    logger.addHandler(queue_handler)
 
+    _listener = QueueListener(log_queue, console_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
     return logger
@@ -0,0 +1,182 @@
+"""Cache of Telegram file_ids for the static images sent by the bot.
+
+Each image is uploaded once; afterwards it is sent by the file_id Telegram
+returned, which is stored on disk so it survives restarts.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+import aiofiles
+from telegram import Bot, Message
+from telegram.error import BadRequest
+
+from config import IMAGES_DIR, MEDIA_CACHE_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class MediaCache:
+    def __init__(self, store_path: Path):
+        """Creates the cache, loading previously stored file_ids if present."""
+        self.store_path = Path(store_path)
+        self._entries = self._load()
+        self._save_lock = asyncio.Lock()
+        # One lock per image, so concurrent first sends upload it only once.
+        self._upload_locks: dict[str, asyncio.Lock] = {}
+
+    def _load(self) -> dict:
+        try:
+            with open(self.store_path, encoding="utf-8") as f:
+                entries = json.load(f)
+            logger.info(
+                "Loaded %s cached media file_ids from %s.",
+                len(entries),
+                self.store_path,
+            )
+            return entries
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error("Failed to read media cache %s: %s", self.store_path, e)
+            return {}
+
+    async def _save(self) -> None:
+        """Atomically writes the cache to disk."""
+        async with self._save_lock:
+            tmp_path = None
+            try:
+                self.store_path.parent.mkdir(parents=True, exist_ok=True)
+                # Unique name, since shard workers may save at the same time.
+                fd, tmp_path = tempfile.mkstemp(
+                    dir=self.store_path.parent, suffix=".tmp"
+                )
+                os.close(fd)
+                async with aiofiles.open(tmp_path, "w", encoding="utf-8") as f:
+                    await f.write(json.dumps(self._entries, indent=2))
+                os.replace(tmp_path, self.store_path)
+            except OSError as e:
+                logger.error("Failed to write media cache %s: %s", self.store_path, e)
+                if tmp_path is not None:
+                    Path(tmp_path).unlink(missing_ok=True)
+
+    @staticmethod
+    def _fingerprint(path: Path) -> dict:
+        """Identifies the current version of a file; raises FileNotFoundError."""
+        stat = path.stat()
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def get_file_id(self, path: Path) -> str | None:
+        """Returns the cached file_id for the file if it is still up to date."""
+        entry = self._entries.get(path.name)
+        if entry and entry["fingerprint"] == self._fingerprint(path):
+            return entry["file_id"]
+        return None
+
+    async def _remember(self, path: Path, fingerprint: dict, message: Message):
+        self._entries[path.name] = {
+            "file_id": message.photo[-1].file_id,
+            "fingerprint": fingerprint,
+        }
+        await self._save()
+
+    async def _forget(self, path: Path) -> None:
+        if self._entries.pop(path.name, None) is not None:
+            await self._save()
+
+    async def send_photo(
+        self,
+        bot: Bot,
+        chat_id: int,
+        path: Path,
+        caption: str | None = None,
+        reply_markup=None,
+    ) -> Message:
+        """
+        Sends the image by its cached file_id, uploading it only when there is
+        no valid file_id yet or Telegram rejects the stored one.
+        """
+        path = Path(path)
+        message = await self._send_cached(bot, chat_id, path, caption, reply_markup)
+        if message:
+            return message
+
+        lock = self._upload_locks.setdefault(path.name, asyncio.Lock())
+        async with lock:
+            # A concurrent send may have uploaded the image while this one waited.
+            message = await self._send_cached(bot, chat_id, path, caption, reply_markup)
+            if message:
+                return message
+            fingerprint = self._fingerprint(path)
+            async with aiofiles.open(path, "rb") as f:
+                photo_bytes = await f.read()
+            message = await bot.send_photo(
+                chat_id=chat_id,
+                photo=photo_bytes,
+                caption=caption,
+                reply_markup=reply_markup,
+            )
+            await self._remember(path, fingerprint, message)
+        logger.info("Uploaded %s and cached its file_id.", path.name)
+        return message
+
+    async def _send_cached(
+        self, bot: Bot, chat_id: int, path: Path, caption, reply_markup
+    ) -> Message | None:
+        """
+        Sends the image by its cached file_id; returns None if there is none or
+        Telegram rejects it, in which case it is forgotten.
+        """
+        file_id = self.get_file_id(path)
+        if not file_id:
+            return None
+        try:
+            return await bot.send_photo(
+                chat_id=chat_id,
+                photo=file_id,
+                caption=caption,
+                reply_markup=reply_markup,
+            )
+        except BadRequest as e:
+            logger.warning(
+                "Cached file_id for %s was rejected (%s). Re-uploading.",
+                path.name,
+                e,
+            )
+            # Only if no concurrent upload replaced it meanwhile.
+            if self._entries.get(path.name, {}).get("file_id") == file_id:
+                await self._forget(path)
+            return None
+
+    async def prewarm(self, bot: Bot, chat_id: int, images_dir: Path = IMAGES_DIR):
+        """
+        Uploads every image that has no valid cached file_id to the given chat,
+        then deletes the uploaded messages.
+        """
+        uploaded = 0
+        for path in sorted(Path(images_dir).glob("*.jpg")):
+            if self.get_file_id(path):
+                continue
+            try:
+                message = await self.send_photo(bot, chat_id, path)
+                uploaded += 1
+                await bot.delete_message(chat_id=chat_id, message_id=message.message_id)
+            except Exception as e:
+                logger.error("Failed to prewarm media asset %s: %s", path.name, e)
+        logger.info("Media cache prewarm finished: %s image(s) uploaded.", uploaded)
+        return uploaded
+
+
+async def edit_query_message(query, text: str, reply_markup=None) -> None:
+    """Edits the text of a callback query's message, or its caption for photos."""
+    if query.message and query.message.photo:
+        await query.edit_message_caption(caption=text, reply_markup=reply_markup)
+    else:
+        await query.edit_message_text(text=text, reply_markup=reply_markup)
+
+
+media_cache = MediaCache(MEDIA_CACHE_PATH)
@@ -0,0 +1,323 @@
+"""In-process metrics, exposed in the Prometheus text format at /metrics.
+
+A small self-contained implementation of counters, gauges and histograms, so
+the bot needs no extra dependency. All updates happen on the event loop thread.
+"""
+
+import functools
+import logging
+import time
+from collections.abc import Callable
+from contextlib import contextmanager
+
+from telegram.ext import Application, ApplicationHandlerStop, ConversationHandler
+
+from utils.http_server import HttpServer, HttpRequest, HttpResponse
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+            *self.samples(),
+        ]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._function: Callable[[], float] | None = None
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Reads the (unlabelled) value from `function` at every scrape."""
+        self._function = function
+
+    def samples(self) -> list[str]:
+        if self._function is not None:
+            self._values[()] = self._function()
+        return super().samples()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # labels -> [count per bucket..., sum]
+        self._series: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * len(self.buckets) + [0.0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+                break
+        series[-1] += value
+
+    def samples(self) -> list[str]:
+        lines = []
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                labels = _format_labels(self.labelnames, key, le)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[Metric] = []
+        self._collectors: list[Callable[[], list[Metric]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=()) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames))
+
+    def add_collector(self, collector: Callable[[], list[Metric]]) -> None:
+        """Adds a callable that builds extra metrics at every scrape."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        metrics = list(self._metrics)
+        for collector in self._collectors:
+            try:
+                metrics.extend(collector())
+            except Exception:
+                logger.exception("Metrics collector failed:")
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+registry = Registry()
+
+handler_latency = registry.histogram(
+    "bot_handler_duration_seconds", "Time spent in a handler callback.", ("handler",)
+)
+handler_errors = registry.counter(
+    "bot_handler_errors_total", "Handler callbacks that raised.", ("handler",)
+)
+handlers_in_flight = registry.gauge(
+    "bot_handlers_in_flight", "Handler callbacks currently running.", ("handler",)
+)
+updates_in_flight = registry.gauge(
+    "bot_updates_in_flight", "Updates currently being processed."
+)
+update_queue_depth = registry.gauge(
+    "bot_update_queue_depth", "Updates received but not yet picked up."
+)
+openai_latency = registry.histogram(
+    "openai_request_duration_seconds", "Duration of OpenAI API calls.", ("method",)
+)
+openai_errors = registry.counter(
+    "openai_request_errors_total", "OpenAI API calls that failed.", ("method",)
+)
+openai_in_flight = registry.gauge(
+    "openai_requests_in_flight", "OpenAI API calls currently running.", ("method",)
+)
+openai_tokens = registry.counter(
+    "openai_tokens_total", "Tokens used by chat completions.", ("feature", "kind")
+)
+telegram_latency = registry.histogram(
+    "telegram_request_duration_seconds", "Duration of Bot API calls.", ("method",)
+)
+telegram_errors = registry.counter(
+    "telegram_request_errors_total", "Bot API calls that failed.", ("method",)
+)
+telegram_in_flight = registry.gauge(
+    "telegram_requests_in_flight", "Bot API calls currently running.", ("method",)
+)
+
+
+@contextmanager
+def timed(
+    histogram: Histogram,
+    in_flight: Gauge | None = None,
+    errors: Counter | None = None,
+    **labels,
+):
+    """Observes the duration of the block; counts it as in flight meanwhile."""
+    if in_flight is not None:
+        in_flight.inc(**labels)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        if errors is not None:
+            errors.inc(**labels)
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - started, **labels)
+        if in_flight is not None:
+            in_flight.dec(**labels)
+
+
+def record_token_usage(usage, feature: str) -> None:
+    """Counts the prompt and completion tokens of an OpenAI `usage` object."""
+    if usage is None:
+        return
+    openai_tokens.inc(usage.prompt_tokens, feature=feature, kind="prompt")
+    openai_tokens.inc(usage.completion_tokens, feature=feature, kind="completion")
+
+
+def stats_collector(name: str, documentation: str, sources: dict) -> Callable:
+    """
+    Exports Counter-style `stats` of components as one labelled counter.
+    `sources` maps components to their stats or to functions returning them.
+    """
+
+    def collect() -> list[Metric]:
+        metric = Counter(name, documentation, ("component", "event"))
+        for component, stats in sources.items():
+            if callable(stats):
+                stats = stats()
+            for event, value in stats.items():
+                metric.inc(value, component=component, event=event)
+        return [metric]
+
+    return collect
+
+
+def _timed_callback(callback: Callable) -> Callable:
+    name = getattr(callback, "__qualname__", repr(callback))
+    # Lazy feature callbacks know their feature; others are named by module.
+    feature_of = getattr(callback, "feature", None)
+    feature = feature_of.name if feature_of else callback.__module__.rsplit(".", 1)[-1]
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        tracer.set_feature(feature)
+        with tracer.span(f"handler.{name}"), timed(
+            handler_latency, handlers_in_flight, handler=name
+        ):
+            try:
+                return await callback(update, context)
+            except ApplicationHandlerStop:
+                raise
+            except Exception:
+                handler_errors.inc(handler=name)
+                raise
+
+    return wrapper
+
+
+def _walk_handlers(handlers):
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            yield from _walk_handlers(handler.entry_points)
+            for state_handlers in handler.states.values():
+                yield from _walk_handlers(state_handlers)
+            yield from _walk_handlers(handler.fallbacks)
+        else:
+            yield handler
+
+
+def instrument_application(application: Application) -> None:
+    """
+    Times and traces every handler callback and samples the update queue at
+    scrapes. Wrapped callbacks keep the original in `__wrapped__`.
+    """
+    wrapped = {}
+    for group in application.handlers.values():
+        for handler in _walk_handlers(group):
+            callback = handler.callback
+            if callback not in wrapped:
+                wrapped[callback] = _timed_callback(callback)
+            handler.callback = wrapped[callback]
+    update_queue_depth.set_function(application.update_queue.qsize)
+    updates_in_flight.set_function(
+        lambda: application.update_processor.current_concurrent_updates
+    )
+
+
+def create_metrics_server(host: str, port: int) -> HttpServer:
+    """Returns an HttpServer serving the registry at GET /metrics."""
+
+    async def serve_metrics(_request: HttpRequest) -> HttpResponse:
+        return HttpResponse(200, registry.render().encode("utf-8"), CONTENT_TYPE)
+
+    return HttpServer(host, port, {("GET", "/metrics"): serve_metrics})
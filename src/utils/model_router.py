@@ -0,0 +1,165 @@
+"""Chooses the OpenAI model and request settings for each feature.
+
+Routes come from OPENAI_ROUTES in config.py. A route with a fallback model and
+a p95 threshold sends its requests to the fallback while the observed p95
+latency of its model is above the threshold; as the slow samples age out of the
+window, the primary model is tried again.
+
+Latencies are kept per feature, model and kind of request: the time to the
+first token of a stream is not comparable with the time to a whole completion,
+nor are a short and a long feature's replies. Each kind keeps a bounded number
+of recent samples, and its p95 is only sorted again after a sample came or went.
+"""
+
+import logging
+import math
+import time
+from collections import Counter, deque
+from dataclasses import dataclass
+
+from config import (
+    ROUTE_SETTINGS,
+    OPENAI_ROUTES,
+    OPENAI_LATENCY_WINDOW,
+    OPENAI_LATENCY_MIN_SAMPLES,
+    OPENAI_LATENCY_MAX_SAMPLES,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Route:
+    model: str
+    max_tokens: int
+    temperature: float
+    timeout: float
+    fallback_model: str | None = None
+    p95_threshold: float | None = None
+    hedge: bool = False
+
+
+class _LatencyWindow:
+    def __init__(self, window: float, max_samples: int):
+        """The latest `max_samples` latencies of the last `window` seconds."""
+        self.window = window
+        self.samples: deque[tuple[float, float]] = deque(maxlen=max(max_samples, 1))
+        self._p95: float | None = None
+        self._stale = True
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - self.window
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+            self._stale = True
+
+    def add(self, seconds: float) -> None:
+        self.samples.append((time.monotonic(), seconds))
+        self._stale = True
+
+    def p95(self, min_samples: int) -> float | None:
+        self._prune()
+        if len(self.samples) < max(min_samples, 1):
+            return None
+        if self._stale:
+            latencies = sorted(seconds for _, seconds in self.samples)
+            self._p95 = latencies[math.ceil(0.95 * len(latencies)) - 1]
+            self._stale = False
+        return self._p95
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        routes: dict[str, dict] = OPENAI_ROUTES,
+        window: float = OPENAI_LATENCY_WINDOW,
+        min_samples: int = OPENAI_LATENCY_MIN_SAMPLES,
+        max_samples: int = OPENAI_LATENCY_MAX_SAMPLES,
+    ):
+        """
+        Routes features by `routes` (feature -> settings, completed from the
+        "default" entry). Latencies of the last `window` seconds, at most
+        `max_samples` of each kind, decide the fallback once there are at least
+        `min_samples` of them.
+        """
+        # Unknown settings are reported by check_config(), not at import.
+        default = routes.get("default", {})
+        self.routes = {
+            feature: Route(
+                **{
+                    key: value
+                    for key, value in {**default, **settings}.items()
+                    if key in ROUTE_SETTINGS
+                }
+            )
+            for feature, settings in routes.items()
+        }
+        self.default = self.routes.get("default") or Route(**default)
+        self.window = window
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.stats = Counter()
+        self._latencies: dict[tuple[str | None, str, bool], _LatencyWindow] = {}
+        self._degraded: set[str] = set()
+
+    def _window(self, feature: str | None, model: str, stream: bool) -> _LatencyWindow:
+        key = (feature, model, stream)
+        window = self._latencies.get(key)
+        if window is None:
+            window = _LatencyWindow(self.window, self.max_samples)
+            self._latencies[key] = window
+        return window
+
+    def p95(
+        self, feature: str | None, model: str, stream: bool = False
+    ) -> float | None:
+        """
+        The p95 latency of `feature`'s requests to `model` in the window (times
+        to the first token with `stream`), or None without enough data.
+        """
+        return self._window(feature, model, stream).p95(self.min_samples)
+
+    def observe(
+        self, feature: str | None, model: str, seconds: float, stream: bool = False
+    ) -> None:
+        """Records the latency of a request of `feature` to `model`."""
+        self._window(feature, model, stream).add(seconds)
+
+    def route(self, feature: str, stream: bool = False) -> Route:
+        """
+        Returns the settings for `feature`, switched to its fallback if needed;
+        `stream` tells whether the request will be streamed.
+        """
+        route = self.routes.get(feature, self.default)
+        if not route.fallback_model or route.p95_threshold is None:
+            return route
+
+        p95 = self.p95(feature, route.model, stream)
+        slow = p95 is not None and p95 > route.p95_threshold
+        key = f"{feature}:{route.model}:{'stream' if stream else 'batch'}"
+        if slow and key not in self._degraded:
+            self._degraded.add(key)
+            logger.warning(
+                "p95 latency of %s is %.2fs; routing '%s' to %s.",
+                route.model,
+                p95,
+                feature,
+                route.fallback_model,
+            )
+        elif not slow and key in self._degraded:
+            self._degraded.discard(key)
+            logger.info("Routing '%s' back to %s.", feature, route.model)
+
+        if not slow:
+            return route
+        self.stats["fallbacks"] += 1
+        return Route(
+            model=route.fallback_model,
+            max_tokens=route.max_tokens,
+            temperature=route.temperature,
+            timeout=route.timeout,
+            hedge=route.hedge,
+        )
+
+
+model_router = ModelRouter()
@@ -0,0 +1,345 @@
+"""Schedules the bot's outbound Bot API requests below Telegram's flood limits.
+
+Plugged into the Application as its rate limiter, so every request of the bot
+passes through it. Requests to a chat take a token from a global bucket and
+from the chat's bucket (private chats and groups have different limits) and
+wait for them in priority lanes: answers before edits before chat actions.
+A RetryAfter pauses the bucket that was hit and the request is retried.
+
+Chat actions are sent in the background, so handlers do not wait for them; a
+chat action still waiting when an answer or a newer chat action for its chat
+comes in is dropped, like one that cannot be sent within
+OUTBOUND_CHAT_ACTION_MAX_WAIT. A waiting edit is dropped when a newer edit of
+the same message comes in.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import Counter
+from collections.abc import Callable, Coroutine
+from typing import Any
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from config import (
+    OUTBOUND_LIMITS,
+    OUTBOUND_MAX_RETRIES,
+    OUTBOUND_CHAT_ACTION_MAX_WAIT,
+    SHARD_COUNT,
+    SHARD_INDEX,
+)
+from utils.logger import SAMPLED
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes, served in this order when requests wait for tokens.
+ANSWER, EDIT, CHAT_ACTION = 0, 1, 2
+EDIT_METHODS = frozenset(
+    {
+        "editMessageText",
+        "editMessageCaption",
+        "editMessageMedia",
+        "editMessageReplyMarkup",
+    }
+)
+# Seconds between sweeps that drop chat buckets which have refilled completely.
+SWEEP_INTERVAL = 60.0
+
+_sequence = itertools.count()
+
+
+def _seconds(retry_after) -> float:
+    if isinstance(retry_after, (int, float)):
+        return float(retry_after)
+    return retry_after.total_seconds()
+
+
+class TokenBucket:
+    def __init__(self, limit: dict | None):
+        """
+        Allows `burst` requests at once, then `per_minute` per minute; None
+        means no limit. Waiting requests are served by priority, then in order.
+        """
+        self.burst = float(limit["burst"]) if limit else 0.0
+        self.rate = limit["per_minute"] / 60 if limit else 0.0
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+
+    @property
+    def idle(self) -> bool:
+        """Full and without waiting requests: it behaves like a new bucket."""
+        self._refill(time.monotonic())
+        return not self._waiters and self.tokens >= self.burst
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+
+    def _take(self, now: float) -> bool:
+        if now < self._paused_until:
+            return False
+        if self.rate <= 0:
+            return True
+        self._refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def try_acquire(self) -> bool:
+        """Takes a token if one is free and no request is waiting for it."""
+        return not self._waiters and self._take(time.monotonic())
+
+    def release(self) -> None:
+        """Gives back a token that was taken but not used."""
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + 1)
+        if self._waiters:
+            self._reschedule()
+
+    async def acquire(self, priority: int) -> None:
+        """Waits for a token; lower `priority` values are served first."""
+        if self.try_acquire():
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(_sequence), future))
+        if self._timer is None:
+            self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                # Cancelled right after the token was granted.
+                self.release()
+            raise
+
+    def pause(self, seconds: float) -> None:
+        """Hands out no tokens for `seconds`, then one, then at the usual rate."""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self.tokens = 1.0
+        self.updated = max(self.updated, self._paused_until)
+        if self._waiters:
+            self._reschedule()
+
+    def _reschedule(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Grants tokens to waiting requests; sets a timer for the next one."""
+        self._timer = None
+        now = time.monotonic()
+        while self._waiters:
+            future = self._waiters[0][2]
+            if future.done():
+                heapq.heappop(self._waiters)
+            elif self._take(now):
+                heapq.heappop(self._waiters)
+                future.set_result(None)
+            else:
+                break
+        if self._waiters:
+            refill = (1 - self.tokens) / self.rate if self.rate > 0 else 0.0
+            delay = max(self._paused_until - now, refill, 0.001)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+
+class OutboundScheduler(BaseRateLimiter):
+    def __init__(
+        self,
+        limits: dict = OUTBOUND_LIMITS,
+        max_retries: int = OUTBOUND_MAX_RETRIES,
+        chat_action_max_wait: float = OUTBOUND_CHAT_ACTION_MAX_WAIT,
+    ):
+        """
+        `limits` maps "global", "private" and "group" to {"burst": ...,
+        "per_minute": ...} or None. A request is retried up to `max_retries`
+        times after a RetryAfter; chat actions are not retried and are dropped
+        if they cannot be sent within `chat_action_max_wait` seconds.
+        """
+        global_limit = limits.get("global")
+        if global_limit and SHARD_INDEX is not None:
+            # The workers of a sharded bot share the bot's global limit.
+            global_limit = {
+                **global_limit,
+                "per_minute": global_limit["per_minute"] / SHARD_COUNT,
+            }
+        self.limits = limits
+        self.max_retries = max_retries
+        self.chat_action_max_wait = chat_action_max_wait
+        self._global = TokenBucket(global_limit)
+        self._chats: dict[int | str, TokenBucket] = {}
+        # Requests waiting for tokens that a newer request would supersede.
+        self._pending: dict[tuple, asyncio.Task] = {}
+        self._superseded: set[asyncio.Task] = set()
+        self._background: set[asyncio.Task] = set()
+        self._last_sweep = time.monotonic()
+        self.stats = Counter()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        for task in self._background:
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            now = time.monotonic()
+            if now - self._last_sweep >= SWEEP_INTERVAL:
+                self._sweep(now)
+            # Group, supergroup and channel ids are negative or @usernames.
+            group = isinstance(chat_id, str) or chat_id < 0
+            limit = self.limits.get("group" if group else "private")
+            bucket = self._chats[chat_id] = TokenBucket(limit)
+        return bucket
+
+    def _sweep(self, now: float) -> None:
+        """Forgets chat buckets that are full again, they behave like new ones."""
+        self._last_sweep = now
+        for chat_id in [chat_id for chat_id, b in self._chats.items() if b.idle]:
+            del self._chats[chat_id]
+
+    @property
+    def tracked_chats(self) -> int:
+        return len(self._chats)
+
+    async def _acquire(self, chat_bucket: TokenBucket, lane: int) -> None:
+        await chat_bucket.acquire(lane)
+        try:
+            await self._global.acquire(lane)
+        except asyncio.CancelledError:
+            chat_bucket.release()
+            raise
+
+    def _supersede(self, key: tuple) -> None:
+        task = self._pending.pop(key, None)
+        if task is not None and not task.done():
+            self._superseded.add(task)
+            task.cancel()
+
+    async def _wait_turn(self, chat_id: int | str, lane: int, key: tuple | None):
+        """
+        Waits for the tokens of a request to `chat_id`. Returns False if a newer
+        request with the same `key` superseded it meanwhile.
+        """
+        if key is not None:
+            self._supersede(key)
+        chat_bucket = self._chat_bucket(chat_id)
+        if chat_bucket.try_acquire():
+            if self._global.try_acquire():
+                return True
+            chat_bucket.release()
+
+        self.stats["waited"] += 1
+        waiter = asyncio.ensure_future(self._acquire(chat_bucket, lane))
+        if key is not None:
+            self._pending[key] = waiter
+        try:
+            with tracer.span("telegram.wait", lane=lane):
+                await waiter
+            return True
+        except asyncio.CancelledError:
+            if waiter not in self._superseded:
+                raise
+            self._superseded.discard(waiter)
+            return False
+        finally:
+            if key is not None and self._pending.get(key) is waiter:
+                del self._pending[key]
+
+    def _on_retry_after(self, error: RetryAfter, chat_id: int | str | None) -> float:
+        """Pauses the bucket of `chat_id`, if any; returns the pause in seconds."""
+        seconds = _seconds(error.retry_after)
+        self.stats["retry_after"] += 1
+        if chat_id is not None:
+            self._chat_bucket(chat_id).pause(seconds)
+        return seconds
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, bool | dict | list[dict]]],
+        args: Any,
+        kwargs: dict[str, Any],
+        endpoint: str,
+        data: dict[str, Any],
+        rate_limit_args: None,
+    ) -> bool | dict | list[dict]:
+        chat_id = data.get("chat_id")
+        if chat_id is not None and endpoint == "sendChatAction":
+            task = asyncio.create_task(
+                self._send_chat_action(callback, args, kwargs, chat_id)
+            )
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+            return True
+
+        lane, key = ANSWER, None
+        if endpoint in EDIT_METHODS:
+            lane = EDIT
+            message = data.get("message_id") or data.get("inline_message_id")
+            key = (endpoint, chat_id, message)
+        elif chat_id is not None:
+            # The answer makes a chat action still waiting to be sent pointless.
+            self._supersede(("sendChatAction", chat_id))
+
+        for attempt in itertools.count():
+            if chat_id is not None and not await self._wait_turn(chat_id, lane, key):
+                self.stats["edits_superseded"] += 1
+                return True
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                seconds = self._on_retry_after(e, chat_id)
+                if attempt >= self.max_retries:
+                    raise
+                self.stats["retries"] += 1
+                logger.warning(
+                    "Flood limit hit by %s to chat %s; retrying in %.1fs.",
+                    endpoint,
+                    chat_id,
+                    seconds,
+                )
+                if chat_id is None:
+                    await asyncio.sleep(seconds)
+                continue
+            self.stats["sent"] += 1
+            return result
+
+    async def _send_chat_action(self, callback, args, kwargs, chat_id) -> None:
+        key = ("sendChatAction", chat_id)
+        try:
+            async with asyncio.timeout(self.chat_action_max_wait):
+                sending = await self._wait_turn(chat_id, CHAT_ACTION, key)
+        except TimeoutError:
+            sending = False
+        if not sending:
+            self.stats["chat_actions_dropped"] += 1
+            return
+        try:
+            await callback(*args, **kwargs)
+        except RetryAfter as e:
+            self._on_retry_after(e, chat_id)
+            self.stats["chat_actions_dropped"] += 1
+        except Exception as e:
+            logger.warning("Sending a chat action failed: %s", e, extra=SAMPLED)
+        else:
+            self.stats["sent"] += 1
+
+
+outbound_scheduler = OutboundScheduler()
@@ -0,0 +1,99 @@
+"""A Telegram message that is progressively edited while text is streamed in."""
+
+import asyncio
+import logging
+import time
+
+from telegram import Message
+from telegram.constants import MessageLimit
+from telegram.error import BadRequest, RetryAfter
+
+from config import STREAM_EDIT_INTERVAL, STREAM_EDIT_MIN_CHARS
+
+logger = logging.getLogger(__name__)
+
+MAX_TEXT_LENGTH = MessageLimit.MAX_TEXT_LENGTH
+
+
+def split_text(text: str, limit: int = MAX_TEXT_LENGTH) -> list[str]:
+    """Splits text into parts that fit into a single Telegram message."""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip()
+    parts.append(text)
+    return parts
+
+
+class ProgressiveMessage:
+    def __init__(
+        self,
+        message: Message,
+        interval: float = STREAM_EDIT_INTERVAL,
+        min_chars: int = STREAM_EDIT_MIN_CHARS,
+    ):
+        """
+        Wraps an already sent placeholder message. Edits are throttled to at most
+        one per `interval` seconds and only once `min_chars` new characters arrived.
+        """
+        self.message = message
+        self.interval = interval
+        self.min_chars = min_chars
+        self._shown_text = message.text or ""
+        self._next_edit_at = time.monotonic() + interval
+
+    async def _edit(self, text: str, reply_markup=None) -> None:
+        try:
+            await self.message.edit_text(text, reply_markup=reply_markup)
+            self._shown_text = text
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if not isinstance(retry_after, (int, float)):
+                retry_after = retry_after.total_seconds()
+            logger.warning("Edit rate limit hit, pausing edits for %ss.", retry_after)
+            self._next_edit_at = time.monotonic() + retry_after
+            raise
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+
+    async def update(self, text: str) -> None:
+        """Shows the partial text if the throttle allows an edit right now."""
+        now = time.monotonic()
+        if now < self._next_edit_at:
+            return
+        if len(text) - len(self._shown_text) < self.min_chars:
+            return
+
+        self._next_edit_at = now + self.interval
+        if len(text) > MAX_TEXT_LENGTH:
+            text = text[: MAX_TEXT_LENGTH - 1] + "…"
+        try:
+            await self._edit(text)
+        except RetryAfter:
+            pass
+        except Exception as e:
+            logger.warning("Failed to update streamed message: %s", e)
+
+    async def finish(self, text: str, reply_markup=None) -> None:
+        """
+        Shows the complete text. Text longer than one message is continued in
+        follow-up messages; the keyboard is attached to the last one.
+        """
+        parts = split_text(text)
+        first_markup = reply_markup if len(parts) == 1 else None
+        try:
+            await self._edit(parts[0], reply_markup=first_markup)
+        except RetryAfter:
+            await asyncio.sleep(max(0.0, self._next_edit_at - time.monotonic()))
+            await self._edit(parts[0], reply_markup=first_markup)
+
+        for i, part in enumerate(parts[1:], start=2):
+            await self.message.reply_text(
+                part, reply_markup=reply_markup if i == len(parts) else None
+            )
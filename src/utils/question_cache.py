@@ -0,0 +1,118 @@
+"""Cache of /talk answers that also matches questions asked in other words.
+
+A question is reduced to a key: its words in order, with request phrasing
+("explain", "tell me about", "the theory of") turned into "what" and without
+articles, a few auxiliaries and prepositions, and a plural "s". Questions with
+the same key get the same answer, so "Explain relativity" hits a cached "What
+is relativity?". Question words, pronouns, negations, tense and word order are
+kept, since they change the answer: "Where were you born?" and "When were you
+born?", or "dog bites man" and "man bites dog", have different keys. Each
+personality has its own bounded dict; the least recently used entries are
+evicted first.
+"""
+
+import logging
+import re
+from collections import Counter, OrderedDict
+
+from config import TALK_CACHE_SIZE, TALK_CACHE_MAX_QUESTION_LENGTH
+from utils.logger import body
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_CONTRACTIONS = [
+    (re.compile(pattern), replacement)
+    for pattern, replacement in [
+        (r"n't\b", " not"),
+        (r"'s\b", " is"),
+        (r"'re\b", " are"),
+        (r"'m\b", " am"),
+        (r"'ll\b", " will"),
+        (r"'ve\b", " have"),
+        (r"'d\b", " would"),
+    ]
+]
+# Ways of asking "what": "Explain relativity" asks what "What is relativity?"
+# asks. Longer phrases come first, so they win over their prefixes.
+_REQUEST_PHRASES = re.compile(
+    r"\b(?:what do you know about|tell me about|tell me|explain|describe|define"
+    r"|whats|what is|what are)\b"
+)
+_FILLER_PHRASES = re.compile(r"\b(?:the )?theory of\b")
+# Words that may differ between two questions with the same answer.
+STOPWORDS = frozenset("a an the please do does is are am of about".split())
+
+
+def normalize_question(text: str) -> str:
+    """
+    Lowercases, expands English contractions, drops punctuation and collapses
+    whitespace.
+    """
+    text = text.lower().replace("’", "'")
+    for pattern, replacement in _CONTRACTIONS:
+        text = pattern.sub(replacement, text)
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+def _stem(word: str) -> str:
+    """Drops a plural or third-person "s", so "dogs" and "bites" match."""
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def question_key(question: str) -> str:
+    """The words of a question that decide its answer, in order."""
+    text = _FILLER_PHRASES.sub(" ", normalize_question(question))
+    text = _REQUEST_PHRASES.sub("what", text)
+    return " ".join(_stem(word) for word in text.split() if word not in STOPWORDS)
+
+
+class QuestionCache:
+    def __init__(
+        self,
+        size: int = TALK_CACHE_SIZE,
+        max_question_length: int = TALK_CACHE_MAX_QUESTION_LENGTH,
+    ):
+        """
+        Keeps up to `size` answers per personality (0 disables the cache).
+        Longer questions than `max_question_length` characters are neither
+        looked up nor stored.
+        """
+        self.size = size
+        self.max_question_length = max_question_length
+        self._entries: dict[str, OrderedDict[str, str]] = {}
+        self.stats = Counter()
+
+    def _key(self, question: str) -> str | None:
+        if self.size <= 0 or len(question) > self.max_question_length:
+            return None
+        return question_key(question) or None
+
+    def get(self, personality: str, question: str) -> str | None:
+        """Returns the cached answer of `personality` to the same question."""
+        key = self._key(question)
+        entries = self._entries.get(personality)
+        if key is None or entries is None or key not in entries:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        logger.debug("Talk cache hit: %s.", body(key))
+        entries.move_to_end(key)
+        return entries[key]
+
+    def put(self, personality: str, question: str, answer: str) -> None:
+        key = self._key(question)
+        if key is None:
+            return
+        entries = self._entries.setdefault(personality, OrderedDict())
+        entries[key] = answer
+        entries.move_to_end(key)
+        if len(entries) > self.size:
+            entries.popitem(last=False)
+            self.stats["evicted"] += 1
+        self.stats["stored"] += 1
+
+
+talk_cache = QuestionCache()
@@ -0,0 +1,83 @@
+"""Local grading of quiz answers given as a letter or as the option text."""
+
+import re
+from difflib import SequenceMatcher
+
+# The whole answer is a letter: "C", "(C)", "C)", "C." or "C:".
+ANSWER_LETTER_PATTERN = re.compile(r"^(?:\(([A-D])\)|([A-D])[).:]?)$", re.IGNORECASE)
+# A letter followed by an option text: "C) Paris", "c. Paris".
+LETTERED_OPTION_PATTERN = re.compile(r"^\(?([A-D])[).:]\s*(.+)$", re.IGNORECASE)
+MIN_SIMILARITY = 0.8
+MIN_SIMILARITY_MARGIN = 0.1
+# An answer found in an option's text matches it only if the answer's words,
+# without these, make up this share of the option's letters without them.
+MIN_CONTAINED_SHARE = 0.4
+COMMON_WORDS = frozenset("a an the of and or in on at to for by with from".split())
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.findall(r"\w+", text.casefold()))
+
+
+def _content_length(text: str) -> int:
+    """Letters of a normalized text, not counting its common words."""
+    return sum(len(word) for word in text.split() if word not in COMMON_WORDS)
+
+
+def resolve_answer(answer_text: str, options: dict | None) -> str | None:
+    """
+    Maps the user's answer to an option letter: "c", "C)" and "c. Paris" give C,
+    and so does the option text itself ("Paris", "paris", small typos) or a
+    substantial part of it in whole words ("Lewis" for "C.S. Lewis", but not
+    "the" for "The Hobbit"). Option texts are matched first, so "C.S. Lewis"
+    gives the option of that name.
+    Returns None if the answer cannot be matched to exactly one option.
+    """
+    answer_text = answer_text.strip()
+    answer = _normalize(answer_text)
+    normalized_options = {
+        letter: _normalize(text) for letter, text in (options or {}).items()
+    }
+
+    exact = [letter for letter, text in normalized_options.items() if text == answer]
+    if answer and len(exact) == 1:
+        return exact[0]
+
+    letter_match = ANSWER_LETTER_PATTERN.match(answer_text)
+    if letter_match:
+        return (letter_match.group(1) or letter_match.group(2)).upper()
+    lettered_match = LETTERED_OPTION_PATTERN.match(answer_text)
+    if lettered_match:
+        letter = lettered_match.group(1).upper()
+        if normalized_options.get(letter) == _normalize(lettered_match.group(2)):
+            return letter
+    if not answer or not normalized_options:
+        return None
+
+    padded_answer = f" {answer} "
+    answer_length = _content_length(answer)
+    containing = [
+        letter
+        for letter, text in normalized_options.items()
+        if padded_answer in f" {text} "
+        and answer_length > 0
+        and answer_length >= MIN_CONTAINED_SHARE * _content_length(text)
+    ]
+    if len(containing) == 1:
+        return containing[0]
+
+    scores = sorted(
+        (
+            (SequenceMatcher(None, answer, text).ratio(), letter)
+            for letter, text in normalized_options.items()
+        ),
+        reverse=True,
+    )
+    best_score, best_letter = scores[0]
+    runner_up_score = scores[1][0] if len(scores) > 1 else 0.0
+    if (
+        best_score >= MIN_SIMILARITY
+        and best_score - runner_up_score >= MIN_SIMILARITY_MARGIN
+    ):
+        return best_letter
+    return None
@@ -0,0 +1,209 @@
+"""Per-topic pools of validated quiz questions, kept filled by background tasks."""
+
+import asyncio
+import hashlib
+import json
+import logging
+import re
+from collections import Counter, deque
+
+from config import QUIZ_POOL_SIZE, QUIZ_POOL_REFILL_THRESHOLD, QUIZ_POOL_BATCH_SIZE
+from utils.chatgpt_client import chatgpt_client
+from utils.logger import body
+
+logger = logging.getLogger(__name__)
+
+ANSWER_LETTERS = ("A", "B", "C", "D")
+QUESTION_BATCH_PROMPT = """
+    Generate {count} different quiz questions on the topic '{topic}'.
+    Each question must have four different answer options labeled A, B, C, D
+    and exactly one correct answer.
+    Respond only with JSON in the following format:
+    {{"questions": [{{"question": "What city is the capital of France?",
+    "options": {{"A": "Berlin", "B": "Madrid", "C": "Paris", "D": "Rome"}},
+    "correct": "C"}}]}}
+    """
+MAX_ON_DEMAND_ATTEMPTS = 2
+
+
+def question_fingerprint(question_text: str) -> str:
+    """Returns a short hash of the question text, ignoring case and punctuation."""
+    normalized = " ".join(re.findall(r"\w+", question_text.lower()))
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def validate_question(item) -> dict | None:
+    """Returns the question in canonical form, or None if it is malformed."""
+    if not isinstance(item, dict):
+        return None
+    question = item.get("question")
+    options = item.get("options")
+    correct = str(item.get("correct", "")).strip().upper().rstrip(")")
+    if not isinstance(question, str) or not question.strip():
+        return None
+    if not isinstance(options, dict) or correct not in ANSWER_LETTERS:
+        return None
+
+    options = {str(k).strip().upper().rstrip(")"): v for k, v in options.items()}
+    if set(options) != set(ANSWER_LETTERS):
+        return None
+    if not all(isinstance(v, str) and v.strip() for v in options.values()):
+        return None
+    if len({v.strip().lower() for v in options.values()}) != len(ANSWER_LETTERS):
+        return None
+
+    return {
+        "question": question.strip(),
+        "options": {letter: options[letter].strip() for letter in ANSWER_LETTERS},
+        "correct": correct,
+        "fingerprint": question_fingerprint(question),
+    }
+
+
+def parse_question_batch(raw_response: str) -> tuple[list[dict], int]:
+    """Parses a JSON batch of questions. Returns valid questions and rejected count."""
+    try:
+        items = json.loads(raw_response).get("questions", [])
+    except (ValueError, AttributeError):
+        logger.warning("Quiz batch is not valid JSON: %s", body(raw_response))
+        return [], 1
+    if not isinstance(items, list):
+        return [], 1
+
+    questions = [q for q in map(validate_question, items) if q]
+    return questions, len(items) - len(questions)
+
+
+def format_question(question: dict) -> str:
+    """Formats a question with its answer options for sending to the user."""
+    lines = [question["question"], ""]
+    lines += [f"{letter}) {question['options'][letter]}" for letter in ANSWER_LETTERS]
+    return "\n".join(lines)
+
+
+class QuizQuestionPool:
+    def __init__(
+        self,
+        topics,
+        pool_size: int = QUIZ_POOL_SIZE,
+        refill_threshold: int = QUIZ_POOL_REFILL_THRESHOLD,
+        batch_size: int = QUIZ_POOL_BATCH_SIZE,
+    ):
+        """
+        Keeps up to `pool_size` ready questions per topic and starts a background
+        refill whenever a pool drops to `refill_threshold`.
+        """
+        self.topics = list(topics)
+        self.pool_size = pool_size
+        self.refill_threshold = refill_threshold
+        self.batch_size = batch_size
+        self._pools: dict[str, deque] = {}
+        self._refill_tasks: dict[str, asyncio.Task] = {}
+        self.stats = Counter()
+
+    def _pool(self, topic: str) -> deque:
+        return self._pools.setdefault(topic, deque())
+
+    def size(self, topic: str) -> int:
+        return len(self._pool(topic))
+
+    def start(self) -> None:
+        """Starts filling the pools of all known topics in the background."""
+        for topic in self.topics:
+            self._schedule_refill(topic)
+
+    async def stop(self) -> None:
+        """Cancels running refills."""
+        tasks = list(self._refill_tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._refill_tasks.clear()
+
+    def _schedule_refill(self, topic: str) -> None:
+        task = self._refill_tasks.get(topic)
+        if task and not task.done():
+            return
+        self._refill_tasks[topic] = asyncio.create_task(self._refill(topic))
+
+    async def _refill(self, topic: str) -> None:
+        logger.info(
+            "Quiz pool '%s': refill started (size %s).", topic, self.size(topic)
+        )
+        self.stats["refills"] += 1
+        try:
+            while self.size(topic) < self.pool_size:
+                if not await self._generate_batch(topic):
+                    break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Quiz pool '%s': refill failed: %s", topic, e)
+        logger.info(
+            "Quiz pool '%s': refill finished (size %s).", topic, self.size(topic)
+        )
+
+    async def _generate_batch(self, topic: str) -> int:
+        """Asks ChatGPT for a batch of questions and adds the valid ones to the pool."""
+        prompt = QUESTION_BATCH_PROMPT.format(count=self.batch_size, topic=topic)
+        raw_response = await chatgpt_client.ask(
+            prompt, response_format={"type": "json_object"}, feature="quiz_generate"
+        )
+        questions, rejected = parse_question_batch(raw_response)
+
+        pool = self._pool(topic)
+        known = {q["fingerprint"] for q in pool}
+        added = 0
+        for question in questions:
+            if question["fingerprint"] in known:
+                self.stats["duplicates"] += 1
+                continue
+            known.add(question["fingerprint"])
+            pool.append(question)
+            added += 1
+
+        self.stats["batches"] += 1
+        self.stats["generated"] += added
+        self.stats["rejected"] += rejected
+        logger.info(
+            "Quiz pool '%s': batch added %s question(s), rejected %s, pool size %s.",
+            topic,
+            added,
+            rejected,
+            len(pool),
+        )
+        return added
+
+    def _take_unseen(self, topic: str, seen: set) -> dict | None:
+        pool = self._pool(topic)
+        for question in pool:
+            if question["fingerprint"] not in seen:
+                pool.remove(question)
+                return question
+        return None
+
+    async def get_question(self, topic: str, seen: set) -> dict | None:
+        """
+        Returns a question the user has not seen yet. Served instantly from the
+        pool when possible; otherwise a batch is generated on demand.
+        """
+        question = self._take_unseen(topic, seen)
+        if question:
+            self.stats["hits"] += 1
+        else:
+            self.stats["misses"] += 1
+            logger.info("Quiz pool '%s': no unseen question ready.", topic)
+            for _ in range(MAX_ON_DEMAND_ATTEMPTS):
+                await self._generate_batch(topic)
+                question = self._take_unseen(topic, seen)
+                if question:
+                    break
+
+        if self.size(topic) <= self.refill_threshold:
+            self._schedule_refill(topic)
+        if question:
+            self.stats["served"] += 1
+        return question
+
+    def has_unseen(self, topic: str, seen: set) -> bool:
+        return any(q["fingerprint"] not in seen for q in self._pool(topic))
@@ -0,0 +1,147 @@
+"""Per-user token buckets that stop over-limit updates before any handler runs."""
+
+import inspect
+import logging
+import time
+from collections import Counter
+from collections.abc import Callable
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import (
+    ApplicationHandlerStop,
+    CallbackContext,
+    ConversationHandler,
+)
+
+from config import RATE_LIMITS, RATE_LIMIT_NOTIFY
+from utils.logger import SAMPLED
+
+logger = logging.getLogger(__name__)
+
+# Bucket shared by all updates of a user, whatever feature they belong to.
+GLOBAL_FEATURE = "global"
+# Seconds between sweeps that drop buckets which have refilled completely.
+SWEEP_INTERVAL = 60.0
+SLOW_DOWN_TEXT = "You're going a bit fast! Please wait a few seconds and try again."
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "notified")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+        self.notified = False
+
+
+class RateLimiter:
+    def __init__(self, limits: dict = RATE_LIMITS, notify: bool = RATE_LIMIT_NOTIFY):
+        """
+        `limits` maps a feature to {"burst": ..., "per_minute": ...}: a user may
+        send `burst` updates of that feature at once, then `per_minute` per minute.
+        The "global" limit applies to every update; features without a limit
+        are not throttled. Over-limit users get one "slow down" reply per
+        throttled streak if `notify` is set; the rest of their updates are
+        dropped silently.
+        """
+        self.limits = {
+            feature: (float(limit["burst"]), limit["per_minute"] / 60)
+            for feature, limit in limits.items()
+            if limit
+        }
+        self.notify = notify
+        self._features: dict[Callable, str] = {}
+        self._buckets: dict[str, dict[int, _Bucket]] = {
+            feature: {} for feature in self.limits
+        }
+        self._last_sweep = time.monotonic()
+        self.stats = Counter()
+
+    def track(self, feature: str, *callbacks: Callable) -> None:
+        """Charges updates handled by `callbacks` to the bucket of `feature`."""
+        for callback in callbacks:
+            self._features[callback] = feature
+
+    def feature_of(self, update: Update, handlers: list) -> str | None:
+        """Returns the feature of the conversation callback that would handle it."""
+        for handler in handlers:
+            if not isinstance(handler, ConversationHandler):
+                continue
+            match = handler.check_update(update)
+            if match:
+                return self._features.get(inspect.unwrap(match[2].callback))
+        return None
+
+    def _take(self, feature: str, user_id: int, now: float) -> _Bucket | None:
+        """Takes a token; returns the bucket if it was empty, otherwise None."""
+        limit = self.limits.get(feature)
+        if limit is None:
+            return None
+        burst, rate = limit
+        buckets = self._buckets[feature]
+        bucket = buckets.get(user_id)
+        if bucket is None:
+            bucket = buckets[user_id] = _Bucket(burst, now)
+        else:
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            bucket.notified = False
+            return None
+        return bucket
+
+    def _sweep(self, now: float) -> None:
+        """Forgets buckets that are full again, they behave like new ones."""
+        self._last_sweep = now
+        for feature, buckets in self._buckets.items():
+            burst, rate = self.limits[feature]
+            idle_after = burst / rate if rate else float("inf")
+            for user_id in [
+                user_id
+                for user_id, bucket in buckets.items()
+                if now - bucket.updated >= idle_after
+            ]:
+                del buckets[user_id]
+
+    @property
+    def tracked_users(self) -> int:
+        return sum(len(buckets) for buckets in self._buckets.values())
+
+    async def _reject(self, update: Update, bucket: _Bucket) -> None:
+        notify = self.notify and not bucket.notified
+        bucket.notified = True
+        try:
+            if update.callback_query:
+                # Answered in any case so the button stops spinning.
+                await update.callback_query.answer(SLOW_DOWN_TEXT if notify else None)
+            elif notify and update.effective_message:
+                await update.effective_message.reply_text(SLOW_DOWN_TEXT)
+        except TelegramError as e:
+            logger.warning("Failed to answer a throttled update: %s", e)
+        self.stats["notified" if notify else "dropped"] += 1
+
+    async def handle(self, update: Update, context: CallbackContext) -> None:
+        """TypeHandler callback, registered in a group before the conversations."""
+        user = update.effective_user
+        if user is None:
+            return
+        now = time.monotonic()
+        if now - self._last_sweep >= SWEEP_INTERVAL:
+            self._sweep(now)
+
+        feature = self.feature_of(update, context.application.handlers.get(0, []))
+        for name in (feature, GLOBAL_FEATURE):
+            if name is None:
+                continue
+            bucket = self._take(name, user.id, now)
+            if bucket is not None:
+                self.stats["throttled"] += 1
+                self.stats[f"throttled_{name}"] += 1
+                logger.info("Throttled user %s on '%s'.", user.id, name, extra=SAMPLED)
+                await self._reject(update, bucket)
+                raise ApplicationHandlerStop
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,185 @@
+"""Typed errors, retry backoff and a circuit breaker for OpenAI requests.
+
+ChatGPTClient raises the ChatGPTError subclasses below instead of the SDK's
+exceptions, so callers can tell a failure from a reply and show users a fitting
+message. Transient failures are retried with jittered exponential backoff that
+honours Retry-After; while OpenAI keeps failing, the circuit breaker rejects
+requests at once instead of letting each one wait for its timeout.
+"""
+
+import email.utils
+import logging
+import math
+import random
+import time
+from collections import Counter
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class ChatGPTError(Exception):
+    """A ChatGPT request failed; `user_message` can be shown to the user."""
+
+    user_message = "Failed to get a response from ChatGPT. Please try again."
+    retryable = False
+
+    def __init__(self, message: str = "", retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ChatGPTUnavailable(ChatGPTError):
+    """Rejected without a request because the circuit breaker is open."""
+
+    user_message = "ChatGPT is temporarily unavailable. Please try again in a minute."
+
+
+class ChatGPTRateLimited(ChatGPTError):
+    user_message = "ChatGPT is busy right now. Please try again in a few seconds."
+    retryable = True
+
+
+class ChatGPTTimeout(ChatGPTError):
+    user_message = "ChatGPT took too long to answer. Please try again."
+    retryable = True
+
+
+class ChatGPTServerError(ChatGPTError):
+    """A connection failure or a 5xx response."""
+
+    retryable = True
+
+
+class ChatGPTRequestError(ChatGPTError):
+    """OpenAI rejected the request itself (e.g. 400, 401, exhausted quota)."""
+
+
+class ChatGPTBadResponse(ChatGPTError):
+    """The response had no usable content."""
+
+
+def retry_after_of(response: httpx.Response | None) -> float | None:
+    """
+    Seconds to wait according to the Retry-After(-ms) headers, if any. A
+    malformed header counts as none, so it cannot hide the error it came with.
+    """
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            seconds = float(headers["retry-after-ms"]) / 1000
+        elif "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                seconds = float(value)
+            except ValueError:
+                retry_at = email.utils.parsedate_to_datetime(value)
+                seconds = retry_at.timestamp() - time.time()
+        else:
+            return None
+    except (ValueError, TypeError, KeyError):
+        return None
+    return max(seconds, 0.0) if math.isfinite(seconds) else None
+
+
+def classify_error(error: Exception) -> ChatGPTError:
+    """Maps an exception of the openai SDK or httpx to a ChatGPTError."""
+    from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+    if isinstance(error, ChatGPTError):
+        return error
+    message = str(error) or type(error).__name__
+    if isinstance(error, (APITimeoutError, httpx.TimeoutException)):
+        return ChatGPTTimeout(message)
+    if isinstance(error, (APIConnectionError, httpx.TransportError)):
+        return ChatGPTServerError(message)
+    if isinstance(error, APIStatusError):
+        status = error.status_code
+        retry_after = retry_after_of(error.response)
+        if status == 429 and getattr(error, "code", None) != "insufficient_quota":
+            return ChatGPTRateLimited(message, retry_after)
+        if status in (408, 409) or status >= 500:
+            return ChatGPTServerError(message, retry_after)
+        return ChatGPTRequestError(message)
+    return ChatGPTError(message)
+
+
+def backoff_delay(
+    attempt: int, base: float, maximum: float, retry_after: float | None = None
+) -> float:
+    """
+    Delay before retry number `attempt` (from 0): "full jitter" exponential
+    backoff, or Retry-After plus a little jitter when the server sent one.
+    """
+    if retry_after is not None:
+        return retry_after + random.uniform(0, base)
+    return random.uniform(0, min(maximum, base * 2**attempt))
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        """
+        Opens after `failure_threshold` consecutive failures and rejects calls
+        for `reset_timeout` seconds. Then one probe call is let through: its
+        success closes the breaker, its failure opens it again.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.stats = Counter()
+        self._failures = 0
+        self._opened_at: float | None = None
+        # When the probe call started; a probe that never reports back (e.g.
+        # cancelled) is replaced by a new one after another reset_timeout.
+        self._probe_started: float | None = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def before_call(self) -> bool:
+        """
+        Raises ChatGPTUnavailable if the call must not be made now; returns
+        True if the call is the probe of a half-open breaker.
+        """
+        if self._opened_at is None or self.failure_threshold <= 0:
+            return False
+        now = time.monotonic()
+        remaining = self._opened_at + self.reset_timeout - now
+        probing = (
+            self._probe_started is not None
+            and now - self._probe_started < self.reset_timeout
+        )
+        if remaining > 0 or probing:
+            self.stats["rejected"] += 1
+            raise ChatGPTUnavailable(
+                "OpenAI circuit breaker is open.", retry_after=max(remaining, 0)
+            )
+        self._probe_started = now
+        logger.info("OpenAI circuit breaker half-open; sending a probe request.")
+        return True
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            logger.info("OpenAI circuit breaker closed.")
+            self.stats["closed"] += 1
+        self._failures = 0
+        self._opened_at = None
+        self._probe_started = None
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._probe_started is not None or (
+            self._opened_at is None and 0 < self.failure_threshold <= self._failures
+        ):
+            logger.error(
+                "OpenAI circuit breaker opened after %s failure(s); "
+                "rejecting requests for %.0fs.",
+                self._failures,
+                self.reset_timeout,
+            )
+            self.stats["opened"] += 1
+            self._opened_at = time.monotonic()
+        self._probe_started = None
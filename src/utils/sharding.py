@@ -0,0 +1,221 @@
+"""Runs the bot as several worker processes, each owning a fixed set of chats.
+
+The front process receives Telegram's webhook requests and forwards each update
+to the worker chosen by hashing its chat id, so all updates of a chat are
+handled by the same worker, in order, and its user_data and conversation states
+live only there. Workers are bot processes started with SHARD_INDEX set; they
+read the updates as length-prefixed frames from stdin. A worker that exits
+unexpectedly is restarted with backoff, and its updates are buffered meanwhile.
+
+Delivery is at most once. Telegram gets its 200 as soon as an update is written
+to the worker's stdin, and workers do not acknowledge updates, so the updates a
+worker had read or still had in its pipe when it crashed are lost, as are the
+ones it was handling. Only updates that arrive while no worker is running are
+buffered for the next one.
+"""
+
+import asyncio
+import json
+import logging
+import sys
+import zlib
+from collections import Counter, deque
+from collections.abc import AsyncIterator
+
+from telegram import Update
+from telegram.ext import Application
+
+from utils.http_server import HttpServer, HttpRequest, HttpResponse
+from utils.webhook import has_valid_secret
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER_SIZE = 4
+# A worker that ran this long before exiting restarts without backoff.
+STABLE_RUN_SECONDS = 60
+
+
+def chat_id_of(data: dict) -> int | None:
+    """Returns the chat id of a raw update, or the user id if it has no chat."""
+    for payload in data.values():
+        if not isinstance(payload, dict):
+            continue
+        chat = payload.get("chat") or (payload.get("message") or {}).get("chat")
+        if chat:
+            return chat.get("id")
+        user = payload.get("from") or payload.get("user")
+        if user:
+            return user.get("id")
+    return None
+
+
+def shard_of(data: dict, shard_count: int) -> int:
+    """Maps a raw update to a worker; stable across restarts of the bot."""
+    key = chat_id_of(data)
+    if key is None:
+        key = data.get("update_id", 0)
+    return zlib.crc32(str(key).encode()) % shard_count
+
+
+class ShardWorker:
+    def __init__(
+        self,
+        index: int,
+        command: list[str],
+        env: dict[str, str],
+        buffer_size: int,
+        max_restart_delay: float,
+    ):
+        """
+        Worker process `index`, started as `command` with `env`. While it is
+        down, up to `buffer_size` updates are kept for it (the oldest are
+        dropped); restarts back off up to `max_restart_delay` seconds.
+        """
+        self.index = index
+        self.command = command
+        self.env = env
+        self.max_restart_delay = max_restart_delay
+        self.process: asyncio.subprocess.Process | None = None
+        self.stats = Counter()
+        self._backlog: deque[bytes] = deque(maxlen=buffer_size)
+        self._supervisor: asyncio.Task | None = None
+        self._stopping = False
+
+    async def start(self) -> None:
+        self._supervisor = asyncio.create_task(self._supervise())
+
+    async def _spawn(self) -> None:
+        process = await asyncio.create_subprocess_exec(
+            *self.command, env=self.env, stdin=asyncio.subprocess.PIPE
+        )
+        while self._backlog:
+            process.stdin.write(self._backlog.popleft())
+        self.process = process
+        logger.info("Shard %s started (pid %s).", self.index, process.pid)
+
+    async def _supervise(self) -> None:
+        loop = asyncio.get_running_loop()
+        delay = 1.0
+        while not self._stopping:
+            started = loop.time()
+            await self._spawn()
+            returncode = await self.process.wait()
+            self.process = None
+            if self._stopping:
+                break
+            self.stats["restarts"] += 1
+            if loop.time() - started >= STABLE_RUN_SECONDS:
+                delay = 1.0
+            logger.error(
+                "Shard %s exited with code %s; restarting in %.0fs.",
+                self.index,
+                returncode,
+                delay,
+            )
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_restart_delay)
+
+    def _buffer(self, frame: bytes) -> None:
+        if len(self._backlog) == self._backlog.maxlen:
+            self.stats["dropped"] += 1
+            logger.warning("Shard %s backlog full; oldest update dropped.", self.index)
+        self._backlog.append(frame)
+
+    async def send(self, body: bytes) -> None:
+        """Forwards one raw update, or buffers it while the worker is down."""
+        frame = len(body).to_bytes(FRAME_HEADER_SIZE, "big") + body
+        self.stats["updates"] += 1
+        process = self.process
+        if process is None or process.returncode is not None:
+            self._buffer(frame)
+            return
+        try:
+            process.stdin.write(frame)
+            await process.stdin.drain()
+        except ConnectionError:
+            # The worker just died; the update goes to its replacement.
+            self._buffer(frame)
+
+    async def stop(self, timeout: float = 30) -> None:
+        """Closes the worker's input, so it finishes its updates and exits."""
+        self._stopping = True
+        process = self.process
+        if process is not None and process.returncode is None:
+            process.stdin.close()
+            try:
+                await asyncio.wait_for(process.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Shard %s did not stop in time; killed.", self.index)
+                process.kill()
+                await process.wait()
+        if self._supervisor:
+            self._supervisor.cancel()
+            await asyncio.gather(self._supervisor, return_exceptions=True)
+
+
+class ShardRouter:
+    def __init__(
+        self,
+        workers: list[ShardWorker],
+        host: str,
+        port: int,
+        path: str,
+        secret_token: str,
+    ):
+        """Webhook endpoint of the front process; routes updates by chat id."""
+        self.workers = workers
+        self.secret_token = secret_token
+        self.http_server = HttpServer(host, port, {("POST", path): self.handle_update})
+
+    async def handle_update(self, request: HttpRequest) -> HttpResponse:
+        if not has_valid_secret(request, self.secret_token):
+            logger.warning("Webhook request with an invalid secret token rejected.")
+            return HttpResponse(403, b"Forbidden")
+
+        try:
+            data = json.loads(request.body)
+            if not isinstance(data, dict):
+                raise ValueError("the update is not a JSON object")
+            shard = shard_of(data, len(self.workers))
+        except (ValueError, AttributeError) as e:
+            logger.warning("Webhook request with an invalid update rejected: %s", e)
+            return HttpResponse(400, b"Bad Request")
+
+        await self.workers[shard].send(request.body)
+        return HttpResponse(200)
+
+    async def start(self) -> None:
+        await self.http_server.start()
+
+    async def stop(self) -> None:
+        await self.http_server.stop()
+
+
+async def open_stdin() -> asyncio.StreamReader:
+    """Returns a reader for the frames the front process writes to stdin."""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), sys.stdin.buffer
+    )
+    return reader
+
+
+async def read_frames(reader: asyncio.StreamReader) -> AsyncIterator[bytes]:
+    while True:
+        try:
+            header = await reader.readexactly(FRAME_HEADER_SIZE)
+        except asyncio.IncompleteReadError:
+            return
+        yield await reader.readexactly(int.from_bytes(header, "big"))
+
+
+async def feed_updates(reader: asyncio.StreamReader, application: Application) -> None:
+    """Puts the forwarded updates into the application's queue until EOF."""
+    async for body in read_frames(reader):
+        try:
+            update = Update.de_json(json.loads(body), application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning("Invalid forwarded update skipped: %s", e)
+            continue
+        await application.update_queue.put(update)
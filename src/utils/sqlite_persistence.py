@@ -0,0 +1,253 @@
+"""SQLite-backed persistence for user_data and conversation states.
+
+User data is loaded lazily, the first time an update of that user is handled,
+instead of reading every user at startup. Changes are written behind: the
+Application hands over only the users touched since its last persistence run,
+and all of them are written in one transaction. Data is pickled when it is
+handed over, on the event loop, so the write in a worker thread never sees
+handlers change it; a batch that fails to be written stays pending.
+"""
+
+import asyncio
+import json
+import logging
+import pickle
+import sqlite3
+from pathlib import Path
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (
+    user_id INTEGER PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    state BLOB NOT NULL,
+    PRIMARY KEY (name, key)
+);
+"""
+
+
+class SqlitePersistence(BasePersistence):
+    def __init__(self, filepath: Path, update_interval: float = 60):
+        """
+        Stores user_data and conversation states in the SQLite database at
+        `filepath`. Chat data, bot data and callback data are not persisted.
+        """
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False, chat_data=False, user_data=True, callback_data=False
+            ),
+            update_interval=update_interval,
+        )
+        self.filepath = Path(filepath)
+        self._connection: sqlite3.Connection | None = None
+        self._db_lock = asyncio.Lock()
+        self._loaded_users: set[int] = set()
+        self._loading_users: dict[int, asyncio.Task] = {}
+        # Pickled data waiting to be written; None marks an ended conversation.
+        self._pending_users: dict[int, bytes] = {}
+        self._pending_user_drops: set[int] = set()
+        self._pending_conversations: dict[tuple[str, str], bytes | None] = {}
+        self._flush_task: asyncio.Task | None = None
+
+    # --- Database access (runs in a worker thread) ---
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.filepath.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.filepath, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def _read_user(self, user_id: int) -> dict | None:
+        row = (
+            self._connect()
+            .execute("SELECT data FROM user_data WHERE user_id = ?", (user_id,))
+            .fetchone()
+        )
+        return pickle.loads(row[0]) if row else None
+
+    def _read_conversations(self, name: str) -> dict:
+        rows = self._connect().execute(
+            "SELECT key, state FROM conversations WHERE name = ?", (name,)
+        )
+        return {tuple(json.loads(key)): pickle.loads(state) for key, state in rows}
+
+    def _write_batch(self, users: dict, user_drops: set, conversations: dict) -> None:
+        connection = self._connect()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)",
+                list(users.items()),
+            )
+            connection.executemany(
+                "DELETE FROM user_data WHERE user_id = ?",
+                [(user_id,) for user_id in user_drops],
+            )
+            connection.executemany(
+                "DELETE FROM conversations WHERE name = ? AND key = ?",
+                [key for key, state in conversations.items() if state is None],
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO conversations (name, key, state) "
+                "VALUES (?, ?, ?)",
+                [
+                    (name, key, state)
+                    for (name, key), state in conversations.items()
+                    if state is not None
+                ],
+            )
+
+    async def _run_db(self, func, *args):
+        async with self._db_lock:
+            return await asyncio.to_thread(func, *args)
+
+    # --- Write-behind batching ---
+
+    async def _flush_pending(self) -> None:
+        # Let the rest of the current persistence run record its changes first.
+        await asyncio.sleep(0)
+        while (
+            self._pending_users
+            or self._pending_user_drops
+            or self._pending_conversations
+        ):
+            users, self._pending_users = self._pending_users, {}
+            user_drops, self._pending_user_drops = self._pending_user_drops, set()
+            conversations = self._pending_conversations
+            self._pending_conversations = {}
+            try:
+                await self._run_db(self._write_batch, users, user_drops, conversations)
+            except Exception as e:
+                logger.error("Failed to persist a batch, keeping it pending: %s", e)
+                self._restore_pending(users, user_drops, conversations)
+                return
+            logger.debug(
+                "Persisted %s user(s), %s drop(s) and %s conversation state(s).",
+                len(users),
+                len(user_drops),
+                len(conversations),
+            )
+
+    def _restore_pending(
+        self, users: dict, user_drops: set, conversations: dict
+    ) -> None:
+        """Puts a failed batch back, unless newer changes replaced its entries."""
+        for user_id, data in users.items():
+            if user_id not in self._pending_user_drops:
+                self._pending_users.setdefault(user_id, data)
+        for user_id in user_drops:
+            if user_id not in self._pending_users:
+                self._pending_user_drops.add(user_id)
+        for key, state in conversations.items():
+            self._pending_conversations.setdefault(key, state)
+
+    @staticmethod
+    def _pickle(value, what: str) -> bytes | None:
+        try:
+            return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.error("Cannot persist %s: %s", what, e)
+            return None
+
+    async def _schedule_flush(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_pending())
+        await asyncio.shield(self._flush_task)
+
+    # --- User data ---
+
+    async def get_user_data(self) -> dict:
+        """Returns nothing up front; users are loaded by refresh_user_data."""
+        return {}
+
+    async def _load_user(self, user_id: int, user_data: dict) -> None:
+        stored = await self._run_db(self._read_user, user_id)
+        if stored:
+            for key, value in stored.items():
+                user_data.setdefault(key, value)
+        self._loaded_users.add(user_id)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        if user_id in self._loaded_users:
+            return
+        task = self._loading_users.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._load_user(user_id, user_data))
+            self._loading_users[user_id] = task
+        try:
+            await asyncio.shield(task)
+        finally:
+            self._loading_users.pop(user_id, None)
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        pickled = self._pickle(data, f"user_data of user {user_id}")
+        if pickled is None:
+            return
+        self._pending_user_drops.discard(user_id)
+        self._pending_users[user_id] = pickled
+        await self._schedule_flush()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._pending_users.pop(user_id, None)
+        self._pending_user_drops.add(user_id)
+        await self._schedule_flush()
+
+    # --- Conversations ---
+
+    async def get_conversations(self, name: str) -> dict:
+        return await self._run_db(self._read_conversations, name)
+
+    async def update_conversation(self, name: str, key: tuple, new_state) -> None:
+        pickled = None
+        if new_state is not None:
+            pickled = self._pickle(new_state, f"conversation state of {name}")
+            if pickled is None:
+                return
+        self._pending_conversations[(name, json.dumps(key))] = pickled
+        await self._schedule_flush()
+
+    # --- Not persisted ---
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id: int, data) -> None:
+        pass
+
+    async def update_bot_data(self, data) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        pass
+
+    async def flush(self) -> None:
+        """Writes everything still pending and closes the database."""
+        await self._schedule_flush()
+        if self._connection is not None:
+            await self._run_db(self._connection.close)
+            self._connection = None
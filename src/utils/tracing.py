@@ -0,0 +1,340 @@
+"""Lightweight tracing: a span per update with child spans for its API calls.
+
+PerChatUpdateProcessor starts a trace for a sampled share (TRACE_SAMPLE_RATE)
+of the updates; the current span is kept in a context variable, so handler
+callbacks, ChatGPTClient and the Bot API requests made while handling the
+update, including from tasks it starts, add child spans to it. Outside a
+sampled update, span() returns a shared no-op span, which costs next to
+nothing. Every span carries the update id, chat id and feature.
+
+Finished spans are queued and written by a background thread, as JSON lines to
+TRACE_FILE and/or in the OTLP/HTTP JSON format to TRACE_OTLP_ENDPOINT.
+"""
+
+import asyncio
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+from telegram.ext import ApplicationHandlerStop
+
+from config import (
+    TRACE_SAMPLE_RATE,
+    TRACE_FILE,
+    TRACE_OTLP_ENDPOINT,
+    TRACE_QUEUE_SIZE,
+    TRACE_EXPORT_INTERVAL,
+    SHARD_INDEX,
+)
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "telegram-bot"
+# Attributes that child spans take over from their parent.
+INHERITED_ATTRIBUTES = ("update_id", "chat_id", "feature")
+EXPORT_BATCH_SIZE = 512
+_STOP = object()
+
+_current_span: contextvars.ContextVar["Span | None"] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class _NoopSpan:
+    """Stands in for a span outside sampled updates."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *_exc_info) -> bool:
+        return False
+
+    def set_attribute(self, key: str, value) -> None:
+        pass
+
+    def end(self, error: BaseException | None = None) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    __slots__ = (
+        "tracer",
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "root",
+        "attributes",
+        "start_ns",
+        "end_ns",
+        "status",
+        "_token",
+    )
+
+    def __init__(self, tracer: "Tracer", name: str, parent: "Span | None", **attrs):
+        """
+        A span named `name`. Used as a context manager, it is the current span
+        within the block; otherwise it only ends with end(), which suits spans
+        around async generators, whose context is their consumer's.
+        """
+        self.tracer = tracer
+        self.name = name
+        self.span_id = f"{random.getrandbits(64):016x}"
+        if parent is None:
+            self.trace_id = f"{random.getrandbits(128):032x}"
+            self.parent_id = None
+            self.root = self
+            self.attributes = {}
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+            self.root = parent.root
+            self.attributes = {
+                key: parent.attributes[key]
+                for key in INHERITED_ATTRIBUTES
+                if key in parent.attributes
+            }
+        self.attributes.update(
+            (key, value) for key, value in attrs.items() if value is not None
+        )
+        self.start_ns = time.time_ns()
+        self.end_ns: int | None = None
+        self.status: str | None = None
+        self._token = None
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def end(self, error: BaseException | None = None) -> None:
+        """Ends the span, failed with `error` if given, and exports it."""
+        self.end_ns = time.time_ns()
+        if error is None or isinstance(error, ApplicationHandlerStop):
+            self.status = "ok"
+        elif isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            self.status = "cancelled"
+        else:
+            self.status = "error"
+            self.attributes["error"] = f"{type(error).__name__}: {error}"
+        self.tracer.export(self)
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, _exc_type, exc, _traceback) -> bool:
+        _current_span.reset(self._token)
+        self.end(exc)
+        return False
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": datetime.fromtimestamp(
+                self.start_ns / 1e9, timezone.utc
+            ).isoformat(timespec="microseconds"),
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: dict) -> list[dict]:
+    return [
+        {"key": key, "value": _otlp_value(value)} for key, value in attributes.items()
+    ]
+
+
+def _otlp_span(span: Span) -> dict:
+    entry = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        # SPAN_KIND_SERVER for updates, SPAN_KIND_CLIENT for the calls they make.
+        "kind": 2 if span.parent_id is None else 3,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": _otlp_attributes(span.attributes),
+        "status": {"code": 2 if span.status == "error" else 1},
+    }
+    if span.parent_id:
+        entry["parentSpanId"] = span.parent_id
+    if span.status == "error":
+        entry["status"]["message"] = span.attributes.get("error", "")
+    return entry
+
+
+class SpanExporter:
+    def __init__(
+        self,
+        path: Path | None,
+        endpoint: str | None,
+        queue_size: int = TRACE_QUEUE_SIZE,
+        interval: float = TRACE_EXPORT_INTERVAL,
+    ):
+        """
+        Writes finished spans to the JSON lines file `path` and/or posts them to
+        the OTLP/HTTP endpoint `endpoint`, in batches from a background thread:
+        every `interval` seconds or once EXPORT_BATCH_SIZE spans are waiting.
+        Spans that do not fit into the queue of `queue_size` are dropped.
+        """
+        self.path = path
+        self.endpoint = endpoint
+        self.interval = interval
+        self.stats = {"exported": 0, "dropped": 0, "failed": 0}
+        resource = {"service.name": SERVICE_NAME}
+        if SHARD_INDEX is not None:
+            resource["shard"] = SHARD_INDEX
+        self._resource = {"attributes": _otlp_attributes(resource)}
+        self._queue: queue.Queue = queue.Queue(queue_size)
+        self._thread = threading.Thread(
+            target=self._run, name="span-exporter", daemon=True
+        )
+        self._thread.start()
+
+    def put(self, span: Span) -> None:
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def stop(self) -> None:
+        """Exports the queued spans and stops the thread."""
+        self._queue.put(_STOP)
+        self._thread.join(timeout=10)
+
+    def _run(self) -> None:
+        client = httpx.Client(timeout=5) if self.endpoint else None
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.interval
+            while len(batch) < EXPORT_BATCH_SIZE:
+                try:
+                    span = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if span is _STOP:
+                    stopping = True
+                    break
+                batch.append(span)
+            if batch:
+                self._export(batch, client)
+        if client is not None:
+            client.close()
+
+    def _export(self, batch: list[Span], client: httpx.Client | None) -> None:
+        try:
+            if self.path is not None:
+                lines = "".join(
+                    json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n"
+                    for span in batch
+                )
+                with open(self.path, "a", encoding="utf-8") as trace_file:
+                    trace_file.write(lines)
+            if client is not None:
+                payload = {
+                    "resourceSpans": [
+                        {
+                            "resource": self._resource,
+                            "scopeSpans": [
+                                {
+                                    "scope": {"name": __name__},
+                                    "spans": [_otlp_span(span) for span in batch],
+                                }
+                            ],
+                        }
+                    ]
+                }
+                response = client.post(self.endpoint, json=payload)
+                response.raise_for_status()
+        except Exception as e:
+            self.stats["failed"] += len(batch)
+            logger.warning("Exporting %s span(s) failed: %s", len(batch), e)
+            return
+        self.stats["exported"] += len(batch)
+
+
+class Tracer:
+    def __init__(
+        self,
+        sample_rate: float = TRACE_SAMPLE_RATE,
+        path: Path | None = TRACE_FILE,
+        endpoint: str | None = TRACE_OTLP_ENDPOINT,
+    ):
+        """
+        Traces `sample_rate` (0..1) of the updates if a file `path` or an OTLP
+        `endpoint` is given; the exporter thread is started with the first trace.
+        """
+        self.sample_rate = sample_rate if (path or endpoint) else 0.0
+        self.path = path
+        self.endpoint = endpoint
+        self._exporter: SpanExporter | None = None
+
+    @property
+    def stats(self) -> dict:
+        return self._exporter.stats if self._exporter else {}
+
+    def start_trace(self, name: str, **attributes) -> Span | _NoopSpan:
+        """Returns the root span of a new trace, or NOOP_SPAN if not sampled."""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return NOOP_SPAN
+        if self._exporter is None:
+            self._exporter = SpanExporter(self.path, self.endpoint)
+            atexit.register(self._exporter.stop)
+        return Span(self, name, None, **attributes)
+
+    def span(self, name: str, **attributes) -> Span | _NoopSpan:
+        """Returns a child span of the current span, or NOOP_SPAN outside a trace."""
+        parent = _current_span.get()
+        if parent is None:
+            return NOOP_SPAN
+        return Span(self, name, parent, **attributes)
+
+    @staticmethod
+    def set_feature(feature: str) -> None:
+        """
+        Sets the feature of the current trace once a handler takes the update;
+        the last handler, after e.g. the rate limiter, decides.
+        """
+        span = _current_span.get()
+        if span is not None:
+            span.root.attributes["feature"] = feature
+            span.attributes["feature"] = feature
+
+    def export(self, span: Span) -> None:
+        if self._exporter is not None:
+            self._exporter.put(span)
+
+    def shutdown(self) -> None:
+        """Exports the remaining spans; blocks until they are written."""
+        if self._exporter is not None:
+            self._exporter.stop()
+
+
+tracer = Tracer()
@@ -0,0 +1,228 @@
+"""Two-tier cache of translations: an in-memory LRU in front of a SQLite table.
+
+Entries are keyed by the target language and the normalized source text and
+expire after a TTL. The SQLite tier survives restarts; hits from it are copied
+into memory. New entries are written behind: put() only stores them in memory,
+and a background task writes everything put meanwhile in one transaction, so a
+reply never waits for the database.
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+from config import (
+    TRANSLATION_CACHE_PATH,
+    TRANSLATION_CACHE_TTL,
+    TRANSLATION_CACHE_MEMORY_SIZE,
+    TRANSLATION_CACHE_MAX_ENTRIES,
+    TRANSLATION_CACHE_MAX_TEXT_LENGTH,
+)
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS translations (
+    lang TEXT NOT NULL,
+    text TEXT NOT NULL,
+    translation TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (lang, text)
+);
+CREATE INDEX IF NOT EXISTS translations_expires_at ON translations (expires_at);
+"""
+# Puts between two trims of the SQLite tier to TRANSLATION_CACHE_MAX_ENTRIES.
+TRIM_EVERY = 100
+
+
+def normalize_text(text: str) -> str:
+    """
+    Collapses whitespace. Case is kept, since it can change the translation:
+    "Turkey" and "turkey", "Polish" and "polish".
+    """
+    return " ".join(text.split())
+
+
+class TranslationCache:
+    def __init__(
+        self,
+        filepath: Path = TRANSLATION_CACHE_PATH,
+        ttl: float = TRANSLATION_CACHE_TTL,
+        memory_size: int = TRANSLATION_CACHE_MEMORY_SIZE,
+        max_entries: int = TRANSLATION_CACHE_MAX_ENTRIES,
+        max_text_length: int = TRANSLATION_CACHE_MAX_TEXT_LENGTH,
+    ):
+        """
+        Keeps the `memory_size` most recently used translations in memory and
+        up to `max_entries` in the SQLite database at `filepath`, each for `ttl`
+        seconds. Texts longer than `max_text_length` are not cached.
+        """
+        self.filepath = Path(filepath)
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.max_text_length = max_text_length
+        self._memory: OrderedDict[tuple[str, str], tuple[str, float]] = OrderedDict()
+        self._connection: sqlite3.Connection | None = None
+        self._db_lock = asyncio.Lock()
+        self._pending: dict[tuple[str, str], tuple[str, float]] = {}
+        self._flush_task: asyncio.Task | None = None
+        self._puts_since_trim = 0
+        self.stats = Counter()
+
+    # --- Database access (runs in a worker thread) ---
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.filepath.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.filepath, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def _read(self, lang: str, text: str, now: float) -> tuple[str, float] | None:
+        return (
+            self._connect()
+            .execute(
+                "SELECT translation, expires_at FROM translations "
+                "WHERE lang = ? AND text = ? AND expires_at > ?",
+                (lang, text, now),
+            )
+            .fetchone()
+        )
+
+    def _write(self, entries: dict[tuple[str, str], tuple[str, float]]) -> None:
+        connection = self._connect()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO translations "
+                "(lang, text, translation, expires_at) VALUES (?, ?, ?, ?)",
+                [(*key, *entry) for key, entry in entries.items()],
+            )
+
+    def _trim(self, now: float) -> None:
+        """Deletes expired entries, then the ones closest to expiring."""
+        connection = self._connect()
+        with connection:
+            connection.execute("DELETE FROM translations WHERE expires_at <= ?", (now,))
+            connection.execute(
+                "DELETE FROM translations WHERE rowid IN ("
+                "SELECT rowid FROM translations ORDER BY expires_at DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def _clear(self) -> int:
+        connection = self._connect()
+        with connection:
+            return connection.execute("DELETE FROM translations").rowcount
+
+    async def _run_db(self, func, *args):
+        async with self._db_lock:
+            return await asyncio.to_thread(func, *args)
+
+    # --- Write-behind batching ---
+
+    async def _flush_pending(self) -> None:
+        while self._pending:
+            entries, self._pending = self._pending, {}
+            try:
+                await self._run_db(self._write, entries)
+                self._puts_since_trim += len(entries)
+                if self._puts_since_trim >= TRIM_EVERY:
+                    self._puts_since_trim = 0
+                    await self._run_db(self._trim, time.time())
+            except sqlite3.Error as e:
+                logger.error(
+                    "Failed to write translation cache %s: %s", self.filepath, e
+                )
+
+    async def _wait_for_flush(self) -> None:
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+
+    # --- Cache API ---
+
+    def _key(self, text: str, lang: str) -> tuple[str, str] | None:
+        text = normalize_text(text)
+        if not text or len(text) > self.max_text_length:
+            return None
+        return lang, text
+
+    def _remember(self, key: tuple[str, str], translation: str, expires_at: float):
+        self._memory[key] = (translation, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    async def get(self, text: str, lang: str) -> str | None:
+        """Returns the cached translation of `text` into `lang`, or None."""
+        key = self._key(text, lang)
+        if key is None:
+            self.stats["uncacheable"] += 1
+            return None
+        now = time.time()
+
+        entry = self._memory.get(key) or self._pending.get(key)
+        if entry is not None:
+            if entry[1] > now:
+                self._remember(key, *entry)
+                self.stats["memory_hits"] += 1
+                return entry[0]
+            self._memory.pop(key, None)
+
+        try:
+            row = await self._run_db(self._read, *key, now)
+        except sqlite3.Error as e:
+            logger.error("Failed to read translation cache %s: %s", self.filepath, e)
+            row = None
+        if row is not None:
+            self._remember(key, *row)
+            self.stats["disk_hits"] += 1
+            return row[0]
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, text: str, lang: str, translation: str) -> None:
+        """
+        Caches the translation of `text` into `lang`; it is written to the
+        database in the background.
+        """
+        key = self._key(text, lang)
+        if key is None:
+            return
+        expires_at = time.time() + self.ttl
+        self._remember(key, translation, expires_at)
+        self._pending[key] = (translation, expires_at)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_pending())
+
+    async def purge(self) -> int:
+        """Removes every cached translation; returns how many were on disk."""
+        self._memory.clear()
+        self._pending.clear()
+        await self._wait_for_flush()
+        removed = await self._run_db(self._clear)
+        logger.info("Translation cache purged, %s entries removed.", removed)
+        return removed
+
+    @property
+    def memory_entries(self) -> int:
+        return len(self._memory)
+
+    async def close(self) -> None:
+        """Writes the pending entries and closes the database."""
+        await self._wait_for_flush()
+        async with self._db_lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+translation_cache = TranslationCache()
@@ -0,0 +1,79 @@
+"""Update processor that runs different chats concurrently but each chat in order."""
+
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_chats: int, max_pending_updates: int = 4096):
+        """
+        Processes updates of up to `max_concurrent_chats` chats in parallel.
+        Updates of the same chat are processed one after another in arrival order,
+        so ConversationHandler states and user_data stay consistent. Updates
+        waiting for their chat do not occupy one of the parallel slots;
+        `max_pending_updates` bounds how many updates may be in flight overall.
+        """
+        super().__init__(max_concurrent_updates=max_pending_updates)
+        self.max_concurrent_chats = max_concurrent_chats
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_chats)
+        # chat_id -> [lock, number of updates holding or waiting for the lock]
+        self._chat_locks: dict[int, list] = {}
+
+    @staticmethod
+    def _chat_key(update: object) -> int | None:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        chat_key = self._chat_key(update)
+        update_id = update.update_id if isinstance(update, Update) else None
+        # The root span of the update's trace; it also covers waiting for its turn.
+        with tracer.start_trace(
+            "update", update_id=update_id, chat_id=chat_key
+        ) as span:
+            started = time.perf_counter()
+            if chat_key is None:
+                async with self._slots:
+                    span.set_attribute("wait_ms", _elapsed_ms(started))
+                    await coroutine
+                return
+
+            entry = self._chat_locks.setdefault(chat_key, [asyncio.Lock(), 0])
+            entry[1] += 1
+            try:
+                async with entry[0]:
+                    async with self._slots:
+                        span.set_attribute("wait_ms", _elapsed_ms(started))
+                        await coroutine
+            finally:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._chat_locks[chat_key]
+
+    @property
+    def active_chats(self) -> int:
+        return len(self._chat_locks)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,65 @@
+"""Downloads voice notes into memory, spilling only large ones to a temp dir."""
+
+import logging
+import os
+import uuid
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from io import BytesIO
+from pathlib import Path
+from typing import BinaryIO
+
+from telegram import File
+
+from config import VOICE_SPILL_THRESHOLD, VOICE_TEMP_DIR
+
+logger = logging.getLogger(__name__)
+
+
+def clean_voice_temp_dir(temp_dir: Path = VOICE_TEMP_DIR) -> None:
+    """Removes files left in the temp dir by a previous run, e.g. after a crash."""
+    temp_dir.mkdir(parents=True, exist_ok=True)
+    removed = 0
+    for path in temp_dir.iterdir():
+        try:
+            if path.is_file():
+                path.unlink()
+                removed += 1
+        except OSError as e:
+            logger.error("Failed to delete leftover voice file %s: %s", path, e)
+    if removed:
+        logger.info("Deleted %s leftover voice file(s) from %s.", removed, temp_dir)
+
+
+@asynccontextmanager
+async def open_voice_file(
+    voice_file: File,
+    spill_threshold: int = VOICE_SPILL_THRESHOLD,
+    temp_dir: Path = VOICE_TEMP_DIR,
+) -> AsyncIterator[BinaryIO]:
+    """
+    Downloads `voice_file` and yields it as a readable binary file object.
+    Files up to `spill_threshold` bytes are kept in memory; larger ones (or
+    ones of unknown size) are written to `temp_dir` and deleted afterwards.
+    """
+    size = voice_file.file_size
+    if size is not None and size <= spill_threshold:
+        buffer = BytesIO()
+        await voice_file.download_to_memory(buffer)
+        buffer.seek(0)
+        yield buffer
+        return
+
+    temp_dir.mkdir(parents=True, exist_ok=True)
+    path = temp_dir / f"{uuid.uuid4().hex}.ogg"
+    try:
+        await voice_file.download_to_drive(path)
+        with open(path, "rb") as f:
+            yield f
+    finally:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error("Failed to delete temporary voice file %s: %s", path, e)
@@ -0,0 +1,129 @@
+"""Speaks a streamed ChatGPT reply sentence by sentence.
+
+Text deltas are cut into sentence-sized chunks as they arrive. Each chunk is
+synthesized as soon as it is complete, with a bounded number of TTS requests in
+flight, and the audio is sent in order as soon as it is ready, so the first
+voice message goes out while the rest of the reply is still being generated.
+"""
+
+import asyncio
+import logging
+import re
+from collections.abc import AsyncIterator, Awaitable, Callable
+
+from config import (
+    VOICE_TTS_CONCURRENCY,
+    VOICE_CHUNK_MIN_CHARS,
+    VOICE_CHUNK_MAX_CHARS,
+)
+
+logger = logging.getLogger(__name__)
+
+# End of a sentence: punctuation followed by whitespace, or a line break.
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+
+class SentenceChunker:
+    def __init__(
+        self,
+        min_chars: int = VOICE_CHUNK_MIN_CHARS,
+        max_chars: int = VOICE_CHUNK_MAX_CHARS,
+    ):
+        """
+        Groups sentences into chunks of at least `min_chars` characters, except
+        for the first chunk, which is a single sentence so it can be spoken as
+        early as possible. Text without sentence breaks is cut at a space once
+        it reaches `max_chars`.
+        """
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._buffer = ""
+        self._chunks_emitted = 0
+
+    def _cut(self) -> int:
+        """Returns where the next chunk ends in the buffer, or 0 if not yet."""
+        min_chars = self.min_chars if self._chunks_emitted else 1
+        for match in SENTENCE_END.finditer(self._buffer):
+            if match.start() >= min_chars:
+                return match.end()
+        if len(self._buffer) >= self.max_chars:
+            cut = self._buffer.rfind(" ", 0, self.max_chars)
+            return cut + 1 if cut > 0 else self.max_chars
+        return 0
+
+    def feed(self, text: str) -> list[str]:
+        """Adds streamed text and returns the chunks it completed."""
+        self._buffer += text
+        chunks = []
+        while cut := self._cut():
+            chunk = self._buffer[:cut].strip()
+            self._buffer = self._buffer[cut:]
+            if chunk:
+                chunks.append(chunk)
+                self._chunks_emitted += 1
+        return chunks
+
+    def flush(self) -> list[str]:
+        """Returns the remaining text as the last chunk."""
+        chunk = self._buffer.strip()
+        self._buffer = ""
+        return [chunk] if chunk else []
+
+
+class VoicePipeline:
+    def __init__(
+        self,
+        synthesize: Callable[[str], Awaitable[bytes | None]],
+        send: Callable[[str, bytes | None], Awaitable[None]],
+        concurrency: int = VOICE_TTS_CONCURRENCY,
+        chunker: SentenceChunker | None = None,
+    ):
+        """
+        `synthesize` turns a text chunk into audio (None on failure) and `send`
+        delivers a chunk with its audio. At most `concurrency` chunks are
+        synthesized at once; chunks are always sent in order.
+        """
+        self.synthesize = synthesize
+        self.send = send
+        self.chunker = chunker or SentenceChunker()
+        self._slots = asyncio.Semaphore(concurrency)
+
+    async def _synthesize(self, text: str) -> bytes | None:
+        async with self._slots:
+            return await self.synthesize(text)
+
+    async def _send_in_order(self, queue: asyncio.Queue) -> None:
+        while (item := await queue.get()) is not None:
+            text, task = item
+            await self.send(text, await task)
+
+    async def run(self, deltas: AsyncIterator[str]) -> str:
+        """Speaks the streamed reply and returns its full text."""
+        queue: asyncio.Queue = asyncio.Queue()
+        sender = asyncio.create_task(self._send_in_order(queue))
+        tasks = []
+        parts = []
+
+        def enqueue(chunks: list[str]) -> None:
+            for chunk in chunks:
+                task = asyncio.create_task(self._synthesize(chunk))
+                tasks.append(task)
+                queue.put_nowait((chunk, task))
+
+        try:
+            async for delta in deltas:
+                parts.append(delta)
+                enqueue(self.chunker.feed(delta))
+                if sender.done():
+                    # Sending failed; awaiting the sender below re-raises.
+                    break
+            else:
+                enqueue(self.chunker.flush())
+            queue.put_nowait(None)
+            await sender
+        finally:
+            sender.cancel()
+            for task in tasks:
+                task.cancel()
+        logger.debug("Voice reply spoken in %s chunk(s).", len(tasks))
+        return "".join(parts)
@@ -0,0 +1,66 @@
+"""Webhook endpoint that feeds Telegram updates into the Application's queue."""
+
+import hmac
+import json
+import logging
+
+from telegram import Update
+from telegram.ext import Application
+
+from utils.http_server import HttpServer, HttpRequest, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = "x-telegram-bot-api-secret-token"
+
+
+def has_valid_secret(request: HttpRequest, secret_token: str) -> bool:
+    """Checks the secret token header Telegram sends with webhook requests."""
+    received_token = request.headers.get(SECRET_TOKEN_HEADER, "")
+    # Compared as bytes: compare_digest() raises TypeError for non-ASCII str.
+    # Headers are decoded as latin-1, so this restores the bytes received.
+    return hmac.compare_digest(
+        received_token.encode("latin-1"), secret_token.encode("utf-8")
+    )
+
+
+class WebhookServer:
+    def __init__(
+        self,
+        application: Application,
+        host: str,
+        port: int,
+        path: str,
+        secret_token: str,
+    ):
+        """
+        Accepts updates POSTed by Telegram to `path`. Requests without the
+        matching secret token header are rejected.
+        """
+        self.application = application
+        self.secret_token = secret_token
+        self.http_server = HttpServer(host, port, {("POST", path): self.handle_update})
+
+    async def handle_update(self, request: HttpRequest) -> HttpResponse:
+        """Validates and enqueues one update, answering 200 without waiting for it."""
+        if not has_valid_secret(request, self.secret_token):
+            logger.warning("Webhook request with an invalid secret token rejected.")
+            return HttpResponse(403, b"Forbidden")
+
+        try:
+            data = json.loads(request.body)
+            if not isinstance(data, dict):
+                raise ValueError("the update is not a JSON object")
+            update = Update.de_json(data, self.application.bot)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            logger.warning("Webhook request with an invalid update rejected: %s", e)
+            return HttpResponse(400, b"Bad Request")
+
+        self.application.update_queue.put_nowait(update)
+        return HttpResponse(200)
+
+    async def start(self) -> None:
+        await self.http_server.start()
+
+    async def stop(self) -> None:
+        await self.http_server.stop()